@@ -0,0 +1,303 @@
+"""
+Python ports of the per-day computations the dashboards run in the browser
+(render/overview_app.js, render/prolific_common.js, render/day_app.js). They
+work on the export payload shape, so results line up with what the pages draw.
+"""
+
+import math
+
+import categories
+from categories import DEFAULT_CATEGORY, mapwin
+
+KEY_BIN_SECONDS = 10 * 60
+KEY_BIN_COUNT = 86400 // KEY_BIN_SECONDS + 1
+
+FOCUS_IGNORED_TITLES = ("Idle", "Locked Screen", "Task Switching")
+
+
+def map_events(window_events):
+    """Returns copies of window events with the mapped category under "m"."""
+    return [{"t": e["t"], "s": e["s"], "m": mapwin(e["s"])} for e in window_events]
+
+
+def category_seconds(mapped_events):
+    """
+    Mirrors mapEvents + statEvents in overview_app.js: seconds per category in
+    first-appearance order. Like the JS, the first interval seen for a
+    category only registers it (with 0 seconds) and the last event has no
+    duration.
+    """
+    counts = {}
+    for e in mapped_events:
+        counts.setdefault(e["m"], None)
+    for prev, cur in zip(mapped_events, mapped_events[1:]):
+        m = prev["m"]
+        if counts[m] is None:
+            counts[m] = 0
+        else:
+            counts[m] += cur["t"] - prev["t"]
+    return {m: (secs or 0) for m, secs in counts.items()}
+
+
+def stat_events(mapped_events):
+    """
+    Port of statEvents in day_app.js: sets "dt" on each event to the time
+    until the next one; the last event gets 1 second.
+    """
+    for prev, cur in zip(mapped_events, mapped_events[1:]):
+        prev["dt"] = cur["t"] - prev["t"]
+    if mapped_events:
+        mapped_events[-1]["dt"] = 1
+    return mapped_events
+
+
+def _js_round(x):
+    # Math.round: halves go up, unlike Python's round-half-even.
+    return int(math.floor(x + 0.5))
+
+
+def compute_key_stats(ew, ek):
+    """Port of computeKeyStats: keys pressed per category, {m: {"f", "n"}}."""
+    key_stats = {}
+    i = j = 0
+    cur_window = ""
+    while i < len(ew) and j < len(ek):
+        if ew[i]["t"] < ek[j]["t"]:
+            cur_window = ew[i]["m"]
+            i += 1
+            continue
+        if cur_window != "":
+            stats = key_stats.setdefault(cur_window, {"f": 0, "n": 0})
+            stats["f"] += ek[j]["s"]
+            stats["n"] += 1
+        j += 1
+    return key_stats
+
+
+def compute_hacking_stats(ew, ek, hacking_titles=None, passive_titles=None):
+    """
+    Port of computeHackingStats: contiguous stretches of heavy typing in
+    hacking categories (or any time in passive ones), with their totals.
+
+    One deliberate difference: a session that ends where it started (dt 0,
+    only possible with repeated key timestamps) gets intensity 0.0, where
+    the JS divides by zero and gets NaN or Infinity. Neither survives JSON.
+    Passive sessions are then raised to 0.2 like any other passive session.
+    """
+    if hacking_titles is None:
+        hacking_titles = categories.hacking_titles()
+    if passive_titles is None:
+        passive_titles = categories.passive_hacking_titles()
+    hacking_events = []
+    totals = {"time": 0, "keys": 0}
+    state = {
+        "counter": 0,
+        "reset_counter": 0,
+        "now": False,
+        "session_passive": False,
+        "start": -1,
+        "f_accum": 0,
+    }
+
+    def not_hacking(t):
+        state["reset_counter"] += 1
+        if state["reset_counter"] <= 10:
+            return
+        if state["now"]:
+            dt = t - state["start"]
+            # JS: f_accum / 0 is NaN or Infinity; see the docstring.
+            intensity = state["f_accum"] / dt if dt else 0.0
+            if state["session_passive"]:
+                intensity = max(intensity, 0.2)
+            hacking_events.append(
+                {
+                    "t0": state["start"],
+                    "t1": t,
+                    "dt": dt,
+                    "ftotal": state["f_accum"],
+                    "intensity": intensity,
+                    "passive": state["session_passive"],
+                }
+            )
+            totals["time"] += dt
+            totals["keys"] += state["f_accum"]
+        state["now"] = False
+        state["counter"] = 0
+        state["reset_counter"] = 0
+        state["f_accum"] = 0
+        state["session_passive"] = False
+
+    i = j = 0
+    cur_window = ""
+    hacking_title = False
+    passive_title = False
+    while i < len(ew) and j < len(ek):
+        tk = ek[j]["t"]
+        if ew[i]["t"] < tk:
+            cur_window = ew[i]["m"]
+            hacking_title = cur_window in hacking_titles
+            passive_title = cur_window in passive_titles
+            i += 1
+            continue
+
+        if cur_window != "":
+            fhere = ek[j]["s"]
+            if passive_title:
+                state["reset_counter"] = max(0, state["reset_counter"] - 1)
+                state["counter"] += 1
+                if state["counter"] > 3:
+                    if not state["now"]:
+                        state["start"] = tk
+                        state["session_passive"] = True
+                    state["now"] = True
+                if state["now"]:
+                    state["f_accum"] += fhere
+            elif hacking_title:
+                if fhere < 3:
+                    state["reset_counter"] += 1
+                    if state["reset_counter"] > 10:
+                        not_hacking(tk)
+                else:
+                    state["reset_counter"] = max(0, state["reset_counter"] - 1)
+                    state["counter"] += 1
+                    if state["counter"] > 15:
+                        if not state["now"]:
+                            state["start"] = tk
+                            state["session_passive"] = False
+                        state["now"] = True
+                    if state["now"]:
+                        state["f_accum"] += fhere
+            else:
+                not_hacking(tk)
+        j += 1
+
+    return {
+        "total_hacking_keys": totals["keys"],
+        "total_hacking_time": totals["time"],
+        "events": hacking_events,
+    }
+
+
+def compute_focus_tax_stats(es, hacking_titles=None, passive_titles=None):
+    """
+    Port of computeFocusTaxStats: an estimate of the time lost to switching
+    between categories, from events carrying "m" and "dt" (see stat_events).
+    """
+    if hacking_titles is None:
+        hacking_titles = categories.hacking_titles()
+    if passive_titles is None:
+        passive_titles = categories.passive_hacking_titles()
+    deep_titles = set(hacking_titles) | set(passive_titles)
+
+    seq = [
+        (e["m"], e["dt"])
+        for e in es
+        if e.get("m") and e.get("dt") and e["dt"] > 0 and e["m"] not in FOCUS_IGNORED_TITLES
+    ]
+
+    active_seconds = 0
+    counts = {}
+    short_hops = 0
+    deep_blocks = 0
+    for m, dt in seq:
+        active_seconds += dt
+        counts[m] = counts.get(m, 0) + dt
+        if dt < 120:
+            short_hops += 1
+        if dt >= 1500:
+            deep_blocks += 1
+
+    switches = 0
+    tax_seconds = 0
+    last_switch_ix = -999
+    for b in range(1, len(seq)):
+        (prev_m, prev_dt), (cur_m, cur_dt) = seq[b - 1], seq[b]
+        if prev_m == cur_m:
+            continue
+        switches += 1
+        penalty = 30
+        penalty += 0.15 * min(prev_dt, 600)
+        penalty += 0.15 * min(cur_dt, 600)
+        if prev_m in deep_titles or cur_m in deep_titles:
+            penalty += 20
+        if b - last_switch_ix <= 2:
+            penalty += 15  # clustered switching is extra expensive
+        tax_seconds += penalty
+        last_switch_ix = b
+
+    if active_seconds > 0:
+        tax_seconds = min(tax_seconds, active_seconds * 0.5)
+
+    entropy = 0.0
+    for count in counts.values():
+        p = count / max(1, active_seconds)
+        if p > 0:
+            entropy += -p * (math.log(p) / math.log(2))
+    coherence = 100
+    if len(counts) > 1:
+        max_entropy = math.log(len(counts)) / math.log(2)
+        coherence = max(0, min(100, _js_round(100 * (1.0 - entropy / max_entropy))))
+
+    return {
+        "active_seconds": active_seconds,
+        "tax_seconds": _js_round(tax_seconds),
+        "tax_pct": (100.0 * tax_seconds / active_seconds) if active_seconds > 0 else 0,
+        "coherence": coherence,
+        "switches": switches,
+        "short_hops": short_hops,
+        "deep_blocks": deep_blocks,
+    }
+
+
+def misc_title_stats(mapped_events):
+    """Seconds and hits per raw title that mapped to MISC, as the overview inspector shows."""
+    out = {}
+    for k, e in enumerate(mapped_events):
+        if e["m"] != DEFAULT_CATEGORY:
+            continue
+        title = e["s"].strip()
+        if not title:
+            continue
+        dt = max(0, mapped_events[k + 1]["t"] - e["t"]) if k + 1 < len(mapped_events) else 1
+        entry = out.setdefault(title, [0, 0])
+        entry[0] += dt
+        entry[1] += 1
+    return out
+
+
+def key_bins(keyfreq_events, t0):
+    bins = [0] * KEY_BIN_COUNT
+    for e in keyfreq_events:
+        ix = (e["t"] - t0) // KEY_BIN_SECONDS
+        if 0 <= ix < KEY_BIN_COUNT:
+            bins[ix] += e["s"]
+    return bins
+
+
+def compute_day_rollup(payload, t0):
+    """Per-day summary stored in daily_rollups and shipped in overview.json."""
+    ew = map_events(payload["window_events"])
+    ek = payload["keyfreq_events"]
+    hacking = compute_hacking_stats(ew, ek)
+    return {
+        "category_seconds": category_seconds(ew),
+        "key_stats": compute_key_stats(ew, ek),
+        "total_keys": sum(e["s"] for e in ek),
+        "hacking_seconds": hacking["total_hacking_time"],
+        "misc_titles": misc_title_stats(ew),
+        "key_bins": key_bins(ek, t0),
+    }
+
+
+def compute_day_stats(payload):
+    """
+    What the day page computes on load: hacking sessions, keys per category
+    and the focus tax. Stored in day_stats and served by /api/day/<t0>/stats.
+    """
+    ew = stat_events(map_events(payload["window_events"]))
+    ek = payload["keyfreq_events"]
+    return {
+        "hacking_stats": compute_hacking_stats(ew, ek),
+        "key_stats": compute_key_stats(ew, ek),
+        "focus_stats": compute_focus_tax_stats(ew),
+    }
@@ -0,0 +1,340 @@
+"""
+asyncio server mode (python server.py <port> --async). Speaks HTTP/1.1 with
+keep-alive, sends static files with loop.sendfile, and runs the server.py
+routes (SQLite reads, notes, blog posts, refresh jobs) on a small thread
+pool. At most max_in_flight requests are handled at once; the rest wait up
+to QUEUE_TIMEOUT_SECONDS for a slot and then get a 503 with Retry-After, so
+a burst of page loads queues up instead of spawning a thread per
+connection.
+"""
+
+import asyncio
+import http.client
+import io
+import mimetypes
+import os
+import posixpath
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from http import HTTPStatus
+from urllib.parse import unquote, urlsplit
+
+import metrics
+import server
+
+DEFAULT_MAX_IN_FLIGHT = 32
+# Matches the number of idle SQLite readers storage.py keeps pooled.
+DEFAULT_WORKERS = 4
+QUEUE_TIMEOUT_SECONDS = 10.0
+KEEPALIVE_TIMEOUT_SECONDS = 15.0
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+SERVER_NAME = "Prolific"
+
+
+class RequestError(Exception):
+    """A request we answer with `status` and then close the connection."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+async def read_request(reader):
+    """
+    Next request on the connection as (method, target, version, headers,
+    body), or None once the client is done or has been idle too long.
+    """
+    try:
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEPALIVE_TIMEOUT_SECONDS)
+    except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+        return None
+    except asyncio.LimitOverrunError:
+        raise RequestError(431, "Request header too large") from None
+
+    request_line, _, header_block = head.lstrip(b"\r\n").partition(b"\r\n")
+    parts = request_line.decode("iso-8859-1").split()
+    if len(parts) != 3:
+        raise RequestError(400, "Bad request line")
+    method, target, version = parts
+    if not version.startswith("HTTP/1."):
+        raise RequestError(505, "HTTP version not supported")
+    headers = http.client.parse_headers(io.BytesIO(header_block))
+
+    if "Transfer-Encoding" in headers:
+        raise RequestError(501, "Chunked request bodies are not supported")
+    length = server.coerce_int(headers.get("Content-Length"), 0)
+    if length > MAX_BODY_BYTES:
+        raise RequestError(413, "Request body too large")
+    body = b""
+    if length > 0:
+        try:
+            body = await reader.readexactly(length)
+        except asyncio.IncompleteReadError:
+            return None
+    return method, target, version, headers, body
+
+
+def wants_keep_alive(version, headers):
+    connection = (headers.get("Connection") or "").lower()
+    if version == "HTTP/1.0":
+        return "keep-alive" in connection
+    return "close" not in connection
+
+
+def translate_path(directory, target):
+    """Filesystem path for a URL path, as SimpleHTTPRequestHandler maps it."""
+    path = target.split("?", 1)[0].split("#", 1)[0]
+    trailing_slash = path.rstrip().endswith("/")
+    path = posixpath.normpath(unquote(path, errors="surrogatepass"))
+    out = directory
+    for word in filter(None, path.split("/")):
+        if os.path.dirname(word) or word in (os.curdir, os.pardir):
+            continue
+        out = os.path.join(out, word)
+    if trailing_slash:
+        out += "/"
+    return out
+
+
+def static_response(directory, target, headers):
+    """
+    Response for a static file with the same gzip and caching rules as
+    CustomHandler.send_head. The body is bytes, or an open file for the
+    caller to sendfile() and close.
+    """
+    url_path = urlsplit(target).path
+    path = translate_path(directory, target)
+    if os.path.isdir(path):
+        if not url_path.endswith("/"):
+            status, response_headers, body = server.text_response(301, "Moved")
+            return status, response_headers + [("Location", url_path + "/")], body
+        for index in ("index.html", "index.htm"):
+            if os.path.isfile(os.path.join(path, index)):
+                path = os.path.join(path, index)
+                break
+        else:
+            return server.text_response(404, "File not found")
+
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return server.text_response(404, "File not found")
+    if not os.path.isfile(path):
+        return server.text_response(404, "File not found")
+
+    response_headers = server.static_cache_headers(url_path)
+    if "If-Modified-Since" in headers and "If-None-Match" not in headers:
+        if server.not_modified_since(headers["If-Modified-Since"], stat.st_mtime):
+            return 304, response_headers, b""
+
+    response_headers += [
+        ("Content-Type", mimetypes.guess_type(path)[0] or "application/octet-stream"),
+        ("Last-Modified", formatdate(stat.st_mtime, usegmt=True)),
+    ]
+    if (
+        path.endswith(server.GZIP_SUFFIXES)
+        and stat.st_size >= server.GZIP_MIN_BYTES
+        and server.accepts_gzip(headers.get("Accept-Encoding"))
+    ):
+        body, length = server.open_gzip_body(path, stat)
+        if isinstance(body, io.BytesIO):
+            body = body.getvalue()
+        response_headers += [("Content-Encoding", "gzip"), ("Content-Length", str(length))]
+        return 200, response_headers, body
+
+    try:
+        body = open(path, "rb")
+    except OSError:
+        return server.text_response(404, "File not found")
+    response_headers.append(("Content-Length", str(stat.st_size)))
+    return 200, response_headers, body
+
+
+def _response_head(status, headers, keep_alive):
+    lines = [
+        f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+        f"Server: {SERVER_NAME}",
+        f"Date: {formatdate(usegmt=True)}",
+    ]
+    lines += [f"{name}: {value}" for name, value in headers]
+    lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+def _is_stream(body):
+    # Routes stream with a generator; static files are open files to sendfile.
+    return not isinstance(body, bytes) and not hasattr(body, "read")
+
+
+class AsyncServer:
+    def __init__(self, directory, max_in_flight=DEFAULT_MAX_IN_FLIGHT, workers=DEFAULT_WORKERS):
+        self.directory = directory
+        self.max_in_flight = max_in_flight
+        self.workers = workers
+        self._slots = None
+        self._executor = None
+        self._server = None
+        self._connections = set()
+
+    async def start(self, host, port):
+        """Starts listening; returns the bound port."""
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="prolific-http"
+        )
+        self._server = await asyncio.start_server(
+            self._serve_connection, host, port, limit=MAX_HEADER_BYTES
+        )
+        return self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        # Idle keep-alive connections would otherwise sit in read_request
+        # until their timeout.
+        for task in list(self._connections):
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    async def _serve_connection(self, reader, writer):
+        peer = writer.get_extra_info("peername") or ("-",)
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except RequestError as exc:
+                    response = server.text_response(exc.status, str(exc))
+                    await self._send(writer, "GET", response, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                if not await self._serve_request(writer, peer[0], request):
+                    break
+        except (ConnectionError, OSError):
+            pass
+        except asyncio.CancelledError:
+            # close() cancels connections still open at shutdown; end the
+            # task normally so asyncio's stream callback has nothing to log.
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _serve_request(self, writer, client, request):
+        """Handles one request; returns whether to keep the connection open."""
+        method, target, version, headers, body = request
+        keep_alive = wants_keep_alive(version, headers)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), QUEUE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            status, response_headers, payload = server.text_response(503, "Server busy")
+            response = status, response_headers + [("Retry-After", "1")], payload
+            await self._send(writer, method, response, keep_alive)
+        else:
+            try:
+                response = await self._dispatch(method, target, headers, body)
+                if _is_stream(response[2]):
+                    # Chunked for HTTP/1.1; HTTP/1.0 clients read to the close.
+                    if version == "HTTP/1.1":
+                        status, response_headers, payload = response
+                        response_headers = response_headers + [("Transfer-Encoding", "chunked")]
+                        response = status, response_headers, payload
+                    else:
+                        keep_alive = False
+                await self._send(writer, method, response, keep_alive)
+            finally:
+                self._slots.release()
+
+        status = response[0]
+        labels = {"method": method, "path": server.request_label(target)}
+        metrics.observe("prolific_http_request_seconds", time.perf_counter() - started, **labels)
+        metrics.inc("prolific_http_requests_total", status=status, **labels)
+        stamp = time.strftime("%d/%b/%Y %H:%M:%S")
+        sys.stderr.write(f'{client} - - [{stamp}] "{method} {target} {version}" {status} -\n')
+        return keep_alive
+
+    async def _dispatch(self, method, target, headers, body):
+        loop = asyncio.get_running_loop()
+        if method == "POST":
+            return await loop.run_in_executor(
+                self._executor, server.handle_post, target, headers.get("Content-Type"), body
+            )
+        if method not in ("GET", "HEAD"):
+            status, response_headers, payload = server.text_response(501, "Unsupported method")
+            return status, response_headers + [("Allow", "GET, HEAD, POST")], payload
+        if server.is_routed_path(urlsplit(target).path):
+            return await loop.run_in_executor(
+                self._executor, server.handle_get, target, headers.get("If-None-Match")
+            )
+        return await loop.run_in_executor(
+            self._executor, static_response, self.directory, target, headers
+        )
+
+    async def _send(self, writer, method, response, keep_alive):
+        status, headers, body = response
+        try:
+            writer.write(_response_head(status, headers, keep_alive))
+            if method == "HEAD" or status == 304:
+                await writer.drain()
+            elif isinstance(body, bytes):
+                writer.write(body)
+                await writer.drain()
+            elif _is_stream(body):
+                chunked = ("Transfer-Encoding", "chunked") in headers
+                await self._send_stream(writer, body, chunked)
+            else:
+                await writer.drain()
+                await asyncio.get_running_loop().sendfile(writer.transport, body)
+        finally:
+            if not isinstance(body, bytes):
+                body.close()
+
+    async def _send_stream(self, writer, body, chunked):
+        # Chunks are produced on the executor (they read SQLite) and each is
+        # drained before the next is read, so a slow client holds back the
+        # query instead of letting output pile up in memory.
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                chunk = await loop.run_in_executor(self._executor, server.next_stream_chunk, body)
+            except Exception as exc:
+                # Headers are out; cut the connection so the client sees a
+                # truncated response rather than a clean end.
+                print(f"server error: {exc}")
+                writer.transport.abort()
+                return
+            if not chunk:
+                break
+            writer.write(b"%X\r\n%s\r\n" % (len(chunk), chunk) if chunked else chunk)
+            await writer.drain()
+        if chunked:
+            writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+def run(host, port, directory, max_in_flight=DEFAULT_MAX_IN_FLIGHT, workers=DEFAULT_WORKERS):
+    async def main():
+        httpd = AsyncServer(directory, max_in_flight=max_in_flight, workers=workers)
+        bound = await httpd.start(host, port)
+        print(
+            f"Serving Prolific at http://localhost:{bound} "
+            f"(asyncio, {max_in_flight} requests in flight, {workers} workers)"
+        )
+        try:
+            await httpd.serve_forever()
+        finally:
+            await httpd.close()
+
+    asyncio.run(main())
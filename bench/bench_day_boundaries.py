@@ -0,0 +1,49 @@
+"""
+Microbenchmark: rewind7am.rewindTime vs day_boundaries.rewind / rewind_many.
+
+    python bench/bench_day_boundaries.py [--count N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import day_boundaries  # noqa: E402
+from rewind7am import rewindTime  # noqa: E402
+
+
+def timed(label, fn, count):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed * 1000:9.1f} ms  {count / elapsed / 1e6:7.2f} M ts/s")
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    now = int(time.time())
+    # Roughly five years of events, the shape a full re-bucketing sees.
+    stamps = sorted(rng.randrange(now - 5 * 365 * 86400, now) for _ in range(args.count))
+    day_boundaries.rewind(stamps[0])
+
+    expected, base = timed("rewindTime (per event)", lambda: [rewindTime(t) for t in stamps], args.count)
+    got, single = timed("rewind (per event)", lambda: [day_boundaries.rewind(t) for t in stamps], args.count)
+    assert got == expected
+    got, batch = timed("rewind_many", lambda: day_boundaries.rewind_many(stamps), args.count)
+    assert got == expected
+
+    print(f"speedup: rewind {base / single:.1f}x, rewind_many {base / batch:.1f}x", end="")
+    print("" if day_boundaries.np is not None else " (numpy not installed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Prolific benchmark suite. Every benchmark runs against synthetic history
+(bench/synthetic.py) in its own temporary directory.
+
+    python bench/run.py [--days 365] [--out results.json]
+    python bench/run.py --compare baseline.json [--threshold 0.25]
+
+With --compare, any benchmark whose time grew by more than the threshold
+over the baseline is flagged and the exit status is 1.
+"""
+
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+from http.server import ThreadingHTTPServer
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import storage  # noqa: E402
+import synthetic  # noqa: E402
+
+LIVE_INSERTS = 2000
+HTTP_REQUESTS = 200
+
+
+@contextlib.contextmanager
+def workspace():
+    """Temporary logs/, DB and render/ with cwd and env pointed at them."""
+    saved_env = {k: os.environ.get(k) for k in ("PROLIFIC_LOG_DIR", "PROLIFIC_DB_PATH")}
+    saved_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="prolific-bench-") as root:
+        os.environ["PROLIFIC_LOG_DIR"] = os.path.join(root, "logs")
+        os.environ["PROLIFIC_DB_PATH"] = os.path.join(root, "logs", "prolific.db")
+        os.makedirs(os.path.join(root, "logs"))
+        os.makedirs(os.path.join(root, "render"))
+        os.chdir(root)
+        try:
+            yield root
+        finally:
+            storage.close_connections()
+            os.chdir(saved_cwd)
+            for key, value in saved_env.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+
+
+def timed(fn):
+    # Export and backfill print a line per file; keep that out of the output.
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = fn()
+        return time.perf_counter() - start, result
+
+
+def result(seconds, count=None, unit=None, **extra):
+    out = {"seconds": round(seconds, 6)}
+    if count:
+        out["count"] = count
+        out["rate"] = round(count / seconds, 1) if seconds else None
+        out["unit"] = unit
+    out.update(extra)
+    return out
+
+
+def bench_inserts(results, days, seed):
+    with workspace():
+        storage.init_db()
+        day_t0, events = next(synthetic.generate_history(1, seed))
+        window = events["window"][:LIVE_INSERTS]
+        seconds, _ = timed(lambda: [storage.insert_window_event(t, s) for t, s in window])
+        results["insert_window_event"] = result(seconds, len(window), "rows/s")
+        keyfreq = events["keyfreq"][:LIVE_INSERTS]
+        seconds, _ = timed(lambda: [storage.insert_keyfreq_event(t, n) for t, n in keyfreq])
+        results["insert_keyfreq_event"] = result(seconds, len(keyfreq), "rows/s")
+
+    with workspace():
+        history = list(synthetic.generate_history(days, seed))
+        seconds, rows = timed(lambda: synthetic.load_sqlite(history))
+        results["event_writer_load"] = result(seconds, rows, "rows/s", days=days)
+
+
+def bench_backfill(results, days, seed):
+    with workspace() as root:
+        storage.init_db()
+        rows = synthetic.write_legacy_logs(
+            os.path.join(root, "logs"), synthetic.generate_history(days, seed)
+        )
+        seconds, summary = timed(lambda: storage.backfill_from_legacy_logs(force=False))
+        results["backfill_from_legacy_logs"] = result(
+            seconds, summary["rows_inserted"], "rows/s", files=summary["files_imported"], rows=rows
+        )
+        seconds, _ = timed(lambda: storage.backfill_from_legacy_logs(force=False))
+        results["backfill_noop_check"] = result(seconds)
+
+
+def bench_export_and_http(results, days, seed):
+    import export_events
+    import server
+
+    with workspace():
+        history = list(synthetic.generate_history(days, seed))
+        with contextlib.redirect_stdout(io.StringIO()):
+            synthetic.load_sqlite(history)
+
+        seconds, summary = timed(lambda: export_events.updateEvents(full=True))
+        results["update_events_full"] = result(seconds, summary["days_written"], "days/s")
+
+        last_day = history[-1][0]
+        storage.insert_window_event(last_day + 86000, "Windows PowerShell (powershell.exe)")
+        seconds, summary = timed(lambda: export_events.updateEvents())
+        results["update_events_incremental"] = result(seconds, days_written=summary["days_written"])
+
+        seconds, summary = timed(lambda: export_events.updateEvents())
+        results["update_events_noop"] = result(seconds)
+
+        render_dir = os.path.join(os.getcwd(), "render")
+        shutil.copy(os.path.join(ROOT_DIR, "render", "d3.min.js"), render_dir)
+
+        class QuietHandler(server.CustomHandler):
+            def log_message(self, *args):
+                pass
+
+        handler = partial(QuietHandler, directory=render_dir)
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        thread.start()
+        try:
+            port = httpd.server_address[1]
+            etag = _request(port, f"/api/day/{last_day}")[1].get("ETag")
+            cases = {
+                "http_api_day": (f"/api/day/{last_day}", {}),
+                "http_api_day_304": (f"/api/day/{last_day}", {"If-None-Match": etag}),
+                "http_overview_json_gzip": ("/overview.json", {"Accept-Encoding": "gzip"}),
+                "http_static_js_gzip": ("/d3.min.js", {"Accept-Encoding": "gzip"}),
+            }
+            for name, (path, headers) in cases.items():
+                results[name] = _latency(port, path, headers)
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+
+
+def _request(port, path, headers=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        conn.request("GET", path, headers=headers or {})
+        resp = conn.getresponse()
+        body = resp.read()
+        return resp.status, dict(resp.getheaders()), body
+    finally:
+        conn.close()
+
+
+def _latency(port, path, headers):
+    samples = []
+    status = None
+    for _ in range(HTTP_REQUESTS):
+        start = time.perf_counter()
+        status, _, body = _request(port, path, headers)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return result(
+        sum(samples),
+        len(samples),
+        "req/s",
+        status=status,
+        bytes=len(body),
+        p50_ms=round(samples[len(samples) // 2] * 1000, 3),
+        p95_ms=round(samples[int(len(samples) * 0.95)] * 1000, 3),
+    )
+
+
+BENCHMARKS = {
+    "inserts": bench_inserts,
+    "backfill": bench_backfill,
+    "export": bench_export_and_http,
+}
+
+
+def compare(current, baseline, threshold):
+    """Returns [(name, old_seconds, new_seconds, ratio)] for regressions."""
+    regressions = []
+    print(f"{'benchmark':<30} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, entry in sorted(current["results"].items()):
+        base = baseline.get("results", {}).get(name)
+        if not base or not base.get("seconds"):
+            print(f"{name:<30} {'-':>10} {entry['seconds']:>10.4f} {'new':>8}")
+            continue
+        ratio = entry["seconds"] / base["seconds"]
+        flag = "  REGRESSION" if ratio > 1 + threshold else ""
+        print(f"{name:<30} {base['seconds']:>10.4f} {entry['seconds']:>10.4f} {ratio - 1:>+8.1%}{flag}")
+        if flag:
+            regressions.append((name, base["seconds"], entry["seconds"], ratio))
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the Prolific benchmark suite.")
+    parser.add_argument("--days", type=int, default=365, help="Days of synthetic history (default 365).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", choices=sorted(BENCHMARKS), action="append", help="Run only these groups.")
+    parser.add_argument("--out", help="Write results JSON here (default: stdout).")
+    parser.add_argument("--compare", metavar="BASELINE", help="Baseline results JSON to compare against.")
+    parser.add_argument(
+        "--threshold", type=float, default=0.25, help="Allowed slowdown before flagging (default 0.25)."
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = {}
+    for name in args.only or BENCHMARKS:
+        print(f"running {name} ({args.days} days)...", file=sys.stderr)
+        BENCHMARKS[name](results, args.days, args.seed)
+
+    report = {
+        "meta": {
+            "days": args.days,
+            "seed": args.seed,
+            "created": int(time.time()),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    elif not args.compare:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("days") != args.days:
+            print("warning: baseline was recorded with a different --days", file=sys.stderr)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,127 @@
+"""
+Deterministic synthetic history shaped like what prolific.py records: the
+foreground window sampled every 2 s (a row on change plus a heartbeat every
+10 minutes), a keyfreq bucket every 9 s while the collector runs, idle
+stretches, a few notes and the occasional blog post.
+"""
+
+import os
+import random
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+from day_boundaries import rewind  # noqa: E402
+
+WINDOW_POLL_SECONDS = 2
+WINDOW_HEARTBEAT_SECONDS = 600
+KEY_BUCKET_SECONDS = 9
+
+# (title, process, relative weight, mean keys per 9 s bucket)
+WINDOWS = [
+    ("main.py - prolific - Visual Studio Code", "Code.exe", 30, 22),
+    ("storage.py - prolific - Visual Studio Code", "Code.exe", 20, 25),
+    ("Windows PowerShell", "powershell.exe", 8, 12),
+    ("Pull requests - GitHub - Google Chrome", "chrome.exe", 10, 4),
+    ("Inbox (3) - Gmail - Google Chrome", "chrome.exe", 8, 6),
+    ("YouTube - Google Chrome", "chrome.exe", 6, 0),
+    ("Slack | general | team", "slack.exe", 8, 9),
+    ("Microsoft Teams", "ms-teams.exe", 4, 3),
+    ("report_q3.docx - Word", "WINWORD.EXE", 5, 18),
+    ("budget.xlsx - Excel", "EXCEL.EXE", 4, 7),
+    ("Spotify Premium", "Spotify.exe", 2, 0),
+    ("Fusion 360", "Fusion360.exe", 3, 2),
+]
+NOTES = ["standup done", "deep work block", "lunch", "code review", "shipped export fix"]
+
+# Fixed anchor so every run (on the same timezone) generates the same days.
+END_TIMESTAMP = 1767225600  # 2026-01-01 00:00 UTC
+
+
+def day_timestamps(days, end_timestamp=END_TIMESTAMP):
+    last = rewind(end_timestamp)
+    return [rewind(last - 86400 * k + 43200) for k in range(days - 1, -1, -1)]
+
+
+def generate_day(day_t0, seed=0):
+    """Events for one day as {"window", "keyfreq", "notes": [(t, s)], "blog": str or None}."""
+    rng = random.Random(seed * 1_000_003 + day_t0)
+    weekend = rng.random() < 2 / 7
+    start = day_t0 + rng.randrange(3600, 3 * 3600 if not weekend else 5 * 3600, WINDOW_POLL_SECONDS)
+    end = start + rng.randrange(4 * 3600 if weekend else 9 * 3600, (8 if weekend else 15) * 3600)
+    end = min(end, day_t0 + 86400 - 60)
+
+    weights = [w[2] for w in WINDOWS]
+    window = []
+    keyfreq = []
+    t = start
+    next_bucket = start + KEY_BUCKET_SECONDS
+    while t < end:
+        if rng.random() < 0.04:
+            payload, rate = "__IDLE__ (idle)", 0
+            dwell = rng.randrange(300, 3600)
+        else:
+            title, process, _, rate = rng.choices(WINDOWS, weights)[0]
+            payload = f"{title} ({process})"
+            dwell = int(rng.expovariate(1 / 90)) + WINDOW_POLL_SECONDS
+        dwell -= dwell % WINDOW_POLL_SECONDS
+        stop = min(end, t + max(dwell, WINDOW_POLL_SECONDS))
+        beat = t
+        while beat < stop:
+            window.append((beat, payload))
+            beat += WINDOW_HEARTBEAT_SECONDS
+        while next_bucket <= stop:
+            keys = max(0, int(rng.gauss(rate, rate / 2))) if rate else 0
+            keyfreq.append((next_bucket, keys))
+            next_bucket += KEY_BUCKET_SECONDS
+        t = stop
+
+    notes = sorted((rng.randrange(start, end), rng.choice(NOTES)) for _ in range(rng.randrange(0, 4)))
+    blog = None
+    if rng.random() < 0.3:
+        blog = " ".join(rng.choice(NOTES) for _ in range(rng.randrange(5, 40)))
+    return {"window": window, "keyfreq": keyfreq, "notes": notes, "blog": blog}
+
+
+def generate_history(days, seed=0, end_timestamp=END_TIMESTAMP):
+    """Yields (day_t0, events) for `days` consecutive days, oldest first."""
+    for day_t0 in day_timestamps(days, end_timestamp):
+        yield day_t0, generate_day(day_t0, seed)
+
+
+def write_legacy_logs(logs_dir, history):
+    """Writes history as legacy window_/keyfreq_/notes_/blog_<t0>.txt files; returns row count."""
+    os.makedirs(logs_dir, exist_ok=True)
+    rows = 0
+    for day_t0, events in history:
+        for kind in ("window", "keyfreq", "notes"):
+            if not events[kind]:
+                continue
+            path = os.path.join(logs_dir, f"{kind}_{day_t0}.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.writelines(f"{t} {s}\n" for t, s in events[kind])
+            rows += len(events[kind])
+        if events["blog"] is not None:
+            with open(os.path.join(logs_dir, f"blog_{day_t0}.txt"), "w", encoding="utf-8") as f:
+                f.write(events["blog"])
+    return rows
+
+
+def load_sqlite(history):
+    """Inserts history through the live write paths (one batch per day); returns row count."""
+    storage.init_db()
+    writer = storage.EventWriter(threading.Event())
+    rows = 0
+    for day_t0, events in history:
+        batch = [("window", t, s) for t, s in events["window"]]
+        batch += [("keyfreq", t, n) for t, n in events["keyfreq"]]
+        if writer.flush(batch):
+            raise RuntimeError(f"could not write day {day_t0}")
+        for t, note in events["notes"]:
+            storage.insert_note_event(note, timestamp=t)
+        if events["blog"] is not None:
+            storage.upsert_blog_entry(day_t0, events["blog"])
+        rows += len(batch) + len(events["notes"])
+    return rows
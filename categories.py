@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import namedtuple
+from itertools import islice
+
+# Shared with render/render_settings.js, which loads the same file.
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "render", "category_rules.json")
+
+DEFAULT_CATEGORY = "MISC"
+MAX_CACHED_TITLES = 200000
+
+_JS_FLAGS = {"i": "i", "m": "m", "s": "s"}
+
+
+def _rule_source(pattern, flags):
+    inline = "".join(_JS_FLAGS[f] for f in flags if f in _JS_FLAGS)
+    return f"(?{inline}:{pattern})" if inline else f"(?:{pattern})"
+
+
+def _compile_rule(pattern, flags):
+    return re.compile(_rule_source(pattern, flags))
+
+
+def _normalize(rules):
+    return [(str(p), str(f), str(m)) for p, f, m in rules]
+
+
+def _combined_regex(rules):
+    # One alternative per rule, highest index first, each a lookahead that
+    # succeeds if the rule matches anywhere in the title. Alternation tries
+    # them in order, so the first alternative to match is the last rule that
+    # matches: mapwin()'s last-match-wins, in one pass of the regex engine.
+    alternatives = []
+    for k in range(len(rules) - 1, -1, -1):
+        pattern, flags, _ = rules[k]
+        alternatives.append(f"(?=[\\s\\S]*?{_rule_source(pattern, flags)})(?P<r{k}>)")
+    if not alternatives:
+        return None
+    return re.compile("(?:" + "|".join(alternatives) + ")")
+
+
+# Replaced whole by update(), never mutated, so categorize() can read it once
+# and use its regex and rules together without taking the lock.
+_RuleSet = namedtuple("_RuleSet", "rules regex hacking_titles passive_hacking_titles version")
+
+
+def _rule_set(rules, hacking_titles, passive_hacking_titles):
+    hacking_titles = list(hacking_titles)
+    passive_hacking_titles = list(passive_hacking_titles)
+    raw = json.dumps([rules, hacking_titles, passive_hacking_titles])
+    version = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+    return _RuleSet(rules, _combined_regex(rules), hacking_titles, passive_hacking_titles, version)
+
+
+class CategoryEngine:
+    """
+    Maps window titles to categories with the title_mappings rules from
+    category_rules.json. Results are memoized per distinct title; replacing
+    the rules drops only cached titles that an added or removed rule matches.
+    """
+
+    def __init__(self, rules, hacking_titles=(), passive_hacking_titles=()):
+        self._lock = threading.Lock()
+        self._cache = {}
+        self._rule_set = _rule_set(_normalize(rules), hacking_titles, passive_hacking_titles)
+
+    @property
+    def rules(self):
+        return self._rule_set.rules
+
+    @property
+    def hacking_titles(self):
+        return self._rule_set.hacking_titles
+
+    @property
+    def passive_hacking_titles(self):
+        return self._rule_set.passive_hacking_titles
+
+    @property
+    def version(self):
+        return self._rule_set.version
+
+    def categorize(self, title):
+        cached = self._cache.get(title)
+        if cached is not None:
+            return cached
+        rule_set = self._rule_set
+        mapped = DEFAULT_CATEGORY
+        if rule_set.regex is not None:
+            match = rule_set.regex.match(title)
+            if match is not None:
+                mapped = rule_set.rules[int(match.lastgroup[1:])][2]
+        with self._lock:
+            # An update() since we read rule_set has already invalidated the
+            # cache for the new rules; our answer is for the old ones.
+            if self._rule_set is not rule_set:
+                return mapped
+            if len(self._cache) >= MAX_CACHED_TITLES:
+                for stale in list(islice(self._cache, MAX_CACHED_TITLES // 2)):
+                    del self._cache[stale]
+            self._cache[title] = mapped
+        return mapped
+
+    def update(self, rules, hacking_titles=(), passive_hacking_titles=()):
+        """
+        Swaps in new rules and returns how many cached titles were dropped.
+        A title no added/removed rule matches has the same set of matching
+        rules before and after, so as long as the surviving rules kept their
+        relative order its category cannot have changed.
+        """
+        new_set = _rule_set(_normalize(rules), hacking_titles, passive_hacking_titles)
+        with self._lock:
+            old_rules = self._rule_set.rules
+            new_rules = new_set.rules
+            if new_rules == old_rules:
+                self._rule_set = new_set
+                return 0
+
+            # Invalidate before publishing new_set, so a reader that still
+            # finds a title cached got it under the old rules.
+            kept_old = [r for r in old_rules if r in set(new_rules)]
+            kept_new = [r for r in new_rules if r in set(old_rules)]
+            if kept_old != kept_new:
+                dropped = len(self._cache)
+                self._cache.clear()
+            else:
+                changed = [_compile_rule(p, f) for p, f, _ in set(old_rules) ^ set(new_rules)]
+                stale = [t for t in self._cache if any(rx.search(t) for rx in changed)]
+                for title in stale:
+                    del self._cache[title]
+                dropped = len(stale)
+            self._rule_set = new_set
+            return dropped
+
+    def cache_size(self):
+        return len(self._cache)
+
+
+def _rules_from_document(doc):
+    rules = [
+        (entry["pattern"], entry.get("flags", ""), entry["mapto"])
+        for entry in doc.get("title_mappings", [])
+    ]
+    return rules, doc.get("hacking_titles", []), doc.get("passive_hacking_titles", [])
+
+
+def _load_document(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+_ENGINE = None
+_ENGINE_MTIME = None
+_ENGINE_LOCK = threading.Lock()
+
+
+def get_engine(path=RULES_PATH):
+    if _ENGINE is None:
+        reload_rules(path)
+    return _ENGINE
+
+
+def reload_rules(path=RULES_PATH):
+    """
+    Picks up edits to category_rules.json. Cheap when the file is unchanged,
+    so callers can run it once per export.
+    """
+    global _ENGINE, _ENGINE_MTIME
+    with _ENGINE_LOCK:
+        mtime = os.stat(path).st_mtime_ns
+        if _ENGINE is not None and mtime == _ENGINE_MTIME:
+            return _ENGINE
+        rules = _rules_from_document(_load_document(path))
+        if _ENGINE is None:
+            _ENGINE = CategoryEngine(*rules)
+        else:
+            dropped = _ENGINE.update(*rules)
+            print(f"category rules changed, re-categorizing {dropped} cached titles")
+        _ENGINE_MTIME = mtime
+        return _ENGINE
+
+
+def mapwin(title):
+    return get_engine().categorize(title)
+
+
+def rules_version():
+    return get_engine().version
+
+
+def hacking_titles():
+    return get_engine().hacking_titles
+
+
+def passive_hacking_titles():
+    return get_engine().passive_hacking_titles
@@ -0,0 +1,52 @@
+import argparse
+from datetime import datetime
+
+from storage import RETENTION_DAYS, RETENTION_KEYFREQ_BUCKET_SECONDS, compact_old_days, init_db
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Downsample old days by merging their keyfreq rows into buckets."
+    )
+    parser.add_argument(
+        "--older-than-days",
+        type=int,
+        default=RETENTION_DAYS,
+        help=f"Only compact days older than this (default {RETENTION_DAYS}).",
+    )
+    parser.add_argument(
+        "--keyfreq-bucket-seconds",
+        type=int,
+        choices=[60, 300],
+        default=RETENTION_KEYFREQ_BUCKET_SECONDS,
+        help=f"Keyfreq bucket size for compacted days (default {RETENTION_KEYFREQ_BUCKET_SECONDS}).",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Report what would be removed without changing anything.",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    init_db()
+    report = compact_old_days(
+        older_than_days=args.older_than_days,
+        keyfreq_bucket_seconds=args.keyfreq_bucket_seconds,
+        dry_run=args.dry_run,
+    )
+    verb = "Would compact" if args.dry_run else "Compacted"
+    print(f"[{datetime.now()}] {verb} {report['days']} days")
+    before = report["keyfreq_rows_before"]
+    after = report["keyfreq_rows_after"]
+    print(f"[{datetime.now()}] keyfreq rows: {before} -> {after} ({before - after} removed)")
+    print(f"[{datetime.now()}] Space saved: {report['bytes_saved'] / 1e6:.2f} MB of packed keyfreq data")
+    if not args.dry_run and report["days"]:
+        print(f"[{datetime.now()}] Run VACUUM (see README) to return the space to the filesystem.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,123 @@
+"""
+Day boundaries (local 7 AM) as a sorted table of Unix timestamps. Resolving a
+timestamp is a bisect instead of the two datetime constructions in
+rewind7am.rewindTime, and gives the same answer: the day an event belongs to
+starts at the last boundary at or before it. Boundaries are computed with
+local datetimes, so days around DST changes are 23 or 25 hours long exactly
+as rewindTime has them.
+"""
+
+import datetime
+import threading
+import time
+from bisect import bisect_right
+
+try:
+    import numpy as np
+except ImportError:  # optional, only speeds up rewind_many
+    np = None
+
+DAY_START_HOUR = 7
+# Below this many timestamps the numpy conversion costs more than it saves.
+NUMPY_MIN_BATCH = 256
+
+_lock = threading.Lock()
+_table = []
+_table_np = None  # (table, numpy copy of it)
+_table_tz = None
+_first_year = None
+_last_year = None
+
+
+def _tz_key():
+    # time.tzset() rebinds time.tzname, so an identity check on it is enough
+    # to notice a timezone change cheaply.
+    return time.tzname
+
+
+def _boundary(day):
+    return int(datetime.datetime(day.year, day.month, day.day, DAY_START_HOUR).timestamp())
+
+
+def _ensure_years(first_year, last_year):
+    """Makes the table cover every boundary from first_year-1 to last_year+1."""
+    global _table, _table_np, _table_tz, _first_year, _last_year
+    tz = _tz_key()
+    with _lock:
+        if _table_tz is tz and _first_year <= first_year and last_year <= _last_year:
+            return _table
+        if _table_tz is tz:
+            first_year = min(first_year, _first_year)
+            last_year = max(last_year, _last_year)
+        day = datetime.date(max(first_year - 1, datetime.MINYEAR), 1, 1)
+        end = datetime.date(min(last_year + 1, datetime.MAXYEAR), 12, 31)
+        table = []
+        while day <= end:
+            table.append(_boundary(day))
+            day += datetime.timedelta(days=1)
+        _table = table
+        _table_np = None
+        _table_tz = tz
+        _first_year = first_year
+        _last_year = last_year
+        return table
+
+
+def _check(t):
+    if not isinstance(t, (int, float)) or t < 0:
+        raise ValueError(f"Invalid timestamp: {t}")
+
+
+def _table_for(lo, hi):
+    table = _table
+    if _table_tz is not _tz_key() or not table or lo < table[1] or hi >= table[-1]:
+        table = _ensure_years(time.localtime(lo).tm_year, time.localtime(hi).tm_year)
+    return table
+
+
+def rewind(t):
+    """Unix time of the 7 AM that starts t's day; same result as rewindTime(t)."""
+    if not isinstance(t, (int, float)) or t < 0:
+        raise ValueError(f"Invalid timestamp: {t}")
+    table = _table
+    if _table_tz is not time.tzname or not table or t < table[1] or t >= table[-1]:
+        table = _table_for(t, t)
+    return table[bisect_right(table, t) - 1]
+
+
+def rewind_many(timestamps):
+    """
+    rewind() for a batch. Returns a list, or a numpy array when given one.
+    Uses numpy.searchsorted when numpy is installed and the batch is large.
+    """
+    if np is not None and isinstance(timestamps, np.ndarray):
+        if timestamps.size == 0:
+            return timestamps.astype(np.int64)
+        lo, hi = timestamps.min().item(), timestamps.max().item()
+        _check(lo)
+        return _rewind_numpy(timestamps, lo, hi)
+
+    timestamps = list(timestamps)
+    if not timestamps:
+        return []
+    try:
+        lo, hi = min(timestamps), max(timestamps)
+    except TypeError:
+        raise ValueError("Invalid timestamp in batch") from None
+    _check(lo)
+    _check(hi)
+    if np is not None and len(timestamps) >= NUMPY_MIN_BATCH:
+        return _rewind_numpy(np.asarray(timestamps), lo, hi).tolist()
+
+    table = _table_for(lo, hi)
+    return [table[bisect_right(table, t) - 1] for t in timestamps]
+
+
+def _rewind_numpy(values, lo, hi):
+    global _table_np
+    table = _table_for(lo, hi)
+    with _lock:
+        if _table_np is None or _table_np[0] is not table:
+            _table_np = (table, np.asarray(table, dtype=np.int64))
+        table_np = _table_np[1]
+    return table_np[np.searchsorted(table_np, values, side="right") - 1]
@@ -1,24 +1,62 @@
+import argparse
+import gzip
+import hashlib
 import json
 import os
+import shutil
+import threading
+import time
 from datetime import datetime
 
+import metrics
+from analytics import compute_day_rollup, compute_day_stats
+from categories import reload_rules, rules_version
 from storage import (
+    MAX_WINDOW_ACTIVE_GAP_SECONDS,
     backfill_from_legacy_logs,
+    fetch_daily_rollups,
+    fetch_day_fingerprint,
+    fetch_day_revisions,
+    fetch_day_stats,
+    fetch_export_revisions,
     fetch_keyfreq_events,
     fetch_notes_events,
+    fetch_rollup_revisions,
     fetch_window_events,
     get_blog_entry,
     init_db,
+    iter_daily_rollups,
+    iter_events,
     list_day_timestamps,
+    mark_days_exported,
+    upsert_daily_rollups,
+    upsert_day_stats,
 )
 
 INFERRED_IDLE_TITLE = "__IDLE__"
-try:
-    MAX_WINDOW_ACTIVE_GAP_SECONDS = int(
-        os.environ.get("PROLIFIC_MAX_WINDOW_ACTIVE_GAP_SECONDS", "1200")
-    )
-except ValueError:
-    MAX_WINDOW_ACTIVE_GAP_SECONDS = 1200
+
+# Opt-in compact export written next to events_<t0>.json, see
+# encode_day_payload_v2().
+EXPORT_V2 = os.environ.get("PROLIFIC_EXPORT_V2", "").strip().lower() in ("1", "true", "yes")
+# Exports touching at least this many days read each table in one pass.
+RANGE_READ_MIN_DAYS = 8
+_RANGE_KINDS = ("window", "keyfreq", "notes", "blog")
+_PAYLOAD_KEYS = {
+    "window": "window_events",
+    "keyfreq": "keyfreq_events",
+    "notes": "notes_events",
+    "blog": "blog",
+}
+# Fields GET /api/days accepts; "rollup" is the day's overview summary.
+DAY_STREAM_FIELDS = _RANGE_KINDS + ("rollup",)
+DAY_STREAM_DEFAULT_FIELDS = _RANGE_KINDS
+
+# Event lists are encoded this many items at a time when writing JSON.
+JSON_CHUNK_ITEMS = 2048
+
+# Deployments that finished migrating their text logs can skip the legacy
+# backfill check entirely.
+SKIP_BACKFILL = os.environ.get("PROLIFIC_NO_BACKFILL", "").strip().lower() in ("1", "true", "yes")
 
 
 def _normalize_text_events(rows, day_t0, day_t1, dedupe_exact=True):
@@ -52,6 +90,19 @@ def _normalize_text_events(rows, day_t0, day_t1, dedupe_exact=True):
 
 
 def _normalize_keyfreq_events(rows, day_t0, day_t1):
+    # Storage hands back sorted, in-day, non-negative int samples; only fall
+    # back to the rebuild below when something actually needs cleaning.
+    prev = day_t0 - 1
+    for row in rows:
+        stamp = row.get("t")
+        value = row.get("s")
+        if type(stamp) is not int or type(value) is not int or stamp <= prev or value < 0:
+            break
+        prev = stamp
+    else:
+        if prev < day_t1:
+            return rows
+
     collapsed = {}
     for row in rows:
         try:
@@ -87,51 +138,492 @@ def _normalize_window_events(rows, day_t0, day_t1):
     return out
 
 
-def updateEvents():
+def _payload_from_rows(t0, window_rows, keyfreq_rows, notes_rows, blog):
+    t1 = t0 + 86400
+    return {
+        "window_events": _normalize_window_events(window_rows, t0, t1),
+        "keyfreq_events": _normalize_keyfreq_events(keyfreq_rows, t0, t1),
+        "notes_events": _normalize_text_events(notes_rows, t0, t1, dedupe_exact=False),
+        "blog": blog,
+    }
+
+
+def build_day_payload(t0):
+    return _payload_from_rows(
+        t0,
+        fetch_window_events(t0),
+        fetch_keyfreq_events(t0),
+        fetch_notes_events(t0),
+        get_blog_entry(t0),
+    )
+
+
+def _iter_day_payloads(days, kinds=_RANGE_KINDS):
+    """
+    Yields (t0, payload) for the sorted days. Beyond a handful of days this
+    reads each table once over the whole range, merging the per-day streams,
+    instead of running four queries per day. Kinds left out of `kinds` are
+    not read and come back empty.
+    """
+    if len(days) < RANGE_READ_MIN_DAYS:
+        fetchers = {
+            "window": fetch_window_events,
+            "keyfreq": fetch_keyfreq_events,
+            "notes": fetch_notes_events,
+            "blog": get_blog_entry,
+        }
+        for t0 in days:
+            found = {kind: fetchers[kind](t0) for kind in kinds}
+            yield t0, _payload_from_rows(
+                t0,
+                found.get("window", []),
+                found.get("keyfreq", []),
+                found.get("notes", []),
+                found.get("blog", ""),
+            )
+        return
+
+    streams = {kind: iter_events(kind, days[0], days[-1]) for kind in kinds}
+    heads = {kind: next(stream, None) for kind, stream in streams.items()}
+    try:
+        for t0 in days:
+            found = {}
+            for kind, stream in streams.items():
+                head = heads[kind]
+                while head is not None and head[0] < t0:
+                    head = next(stream, None)
+                if head is not None and head[0] == t0:
+                    found[kind] = head[1]
+                    head = next(stream, None)
+                heads[kind] = head
+            yield t0, _payload_from_rows(
+                t0,
+                found.get("window", []),
+                found.get("keyfreq", []),
+                found.get("notes", []),
+                found.get("blog", ""),
+            )
+    finally:
+        for stream in streams.values():
+            stream.close()
+
+
+def iter_days_ndjson(t0_from=None, t0_to=None, fields=DAY_STREAM_DEFAULT_FIELDS):
+    """
+    Yields one NDJSON line (bytes) per day with data in t0_from..t0_to:
+    {"t0", <payload keys of the requested kinds>, "rollup"}. "rollup" is the
+    day's daily_rollups entry, or null before its first export. Rows come
+    from range cursors, so memory stays around one day whatever the range.
+    """
+    lo = -(1 << 62) if t0_from is None else int(t0_from)
+    hi = (1 << 62) if t0_to is None else int(t0_to)
+    days = [t0 for t0 in list_day_timestamps() if lo <= t0 <= hi]
+    if not days:
+        return
+    kinds = [kind for kind in _RANGE_KINDS if kind in fields]
+    payloads = _iter_day_payloads(days, kinds)
+    rollups = iter_daily_rollups(days[0], days[-1]) if "rollup" in fields else None
+    rollup = next(rollups, None) if rollups is not None else None
+    try:
+        for t0, payload in payloads:
+            line = {"t0": t0}
+            for kind in kinds:
+                key = _PAYLOAD_KEYS[kind]
+                line[key] = payload[key]
+            if rollups is not None:
+                while rollup is not None and rollup["t0"] < t0:
+                    rollup = next(rollups, None)
+                line["rollup"] = rollup if rollup is not None and rollup["t0"] == t0 else None
+            text = json.dumps(line, ensure_ascii=False, separators=(",", ":"))
+            yield text.encode("utf-8") + b"\n"
+    finally:
+        payloads.close()
+        if rollups is not None:
+            rollups.close()
+
+
+def _delta_column(events, t0, strings=None):
+    column = {"dt": [], "s": []}
+    prev = t0
+    for e in events:
+        column["dt"].append(e["t"] - prev)
+        prev = e["t"]
+        if strings is None:
+            column["s"].append(e["s"])
+        else:
+            ix = strings.get(e["s"])
+            if ix is None:
+                ix = strings[e["s"]] = len(strings)
+            column["s"].append(ix)
+    return column
+
+
+def encode_day_payload_v2(payload, t0):
+    """
+    Columnar form of a day payload (format 2). Every title and note is
+    stored once in "strings"; each event list becomes parallel arrays of
+    time deltas (the first relative to t0) and values, with text values
+    given as indices into "strings". decodeDayPayload() in
+    render/prolific_common.js expands it back.
+    """
+    strings = {}
+    encoded = {
+        "format": 2,
+        "t0": t0,
+        "window_events": _delta_column(payload["window_events"], t0, strings),
+        "keyfreq_events": _delta_column(payload["keyfreq_events"], t0),
+        "notes_events": _delta_column(payload["notes_events"], t0, strings),
+        "blog": payload["blog"],
+    }
+    encoded["strings"] = list(strings)
+    return encoded
+
+
+def decode_day_payload_v2(encoded):
+    strings = encoded["strings"]
+    out = {"blog": encoded.get("blog", "")}
+    for key in ("window_events", "keyfreq_events", "notes_events"):
+        column = encoded[key]
+        t = encoded["t0"]
+        events = []
+        for dt, value in zip(column["dt"], column["s"]):
+            t += dt
+            events.append({"t": t, "s": value if key == "keyfreq_events" else strings[value]})
+        out[key] = events
+    return out
+
+
+def day_payload_etag(t0):
+    """
+    Strong ETag for build_day_payload(t0): changes whenever the day's rows,
+    blog or export cleanup settings change.
+    """
+    fingerprint = fetch_day_fingerprint(t0)
+    if fingerprint is None:
+        return None
+    raw = repr((fingerprint, MAX_WINDOW_ACTIVE_GAP_SECONDS)).encode("utf-8")
+    return '"' + hashlib.sha1(raw).hexdigest()[:24] + '"'
+
+
+def _stats_etag(revisions, rules):
+    raw = repr((sorted(revisions.items()), rules, MAX_WINDOW_ACTIVE_GAP_SECONDS)).encode("utf-8")
+    return '"' + hashlib.sha1(raw).hexdigest()[:24] + '"'
+
+
+def day_stats_etag(t0):
+    """ETag for day_stats(t0), or None when the day has no data."""
+    fingerprint = fetch_day_fingerprint(t0)
+    if fingerprint is None:
+        return None
+    return _stats_etag({t0: fingerprint[2]}, rules_version())
+
+
+def all_day_stats_etag():
+    return _stats_etag(fetch_day_revisions(), rules_version())
+
+
+def _cached_day_stats(days, revisions, cached):
+    """
+    {t0: stats} for days, taking entries from cached while their revision and
+    rules version still match and recomputing (and storing) the rest.
+    """
+    rules = rules_version()
+    out = {}
+    stale = []
+    for t0 in days:
+        entry = cached.get(t0)
+        if entry is not None and entry[:2] == (revisions.get(t0, 0), rules):
+            out[t0] = entry[2]
+        else:
+            stale.append(t0)
+    rows = []
+    for t0, payload in _iter_day_payloads(stale):
+        out[t0] = compute_day_stats(payload)
+        rows.append((t0, revisions.get(t0, 0), rules, out[t0]))
+    upsert_day_stats(rows)
+    return out
+
+
+def day_stats(t0):
+    """
+    analytics.compute_day_stats for one day, cached in SQLite until the day's
+    revision or the category rules change. None when the day has no data.
+    """
+    # Revision first, as in updateEvents: a racing write only makes the
+    # stored entry look stale.
+    fingerprint = fetch_day_fingerprint(t0)
+    if fingerprint is None:
+        return None
+    return _cached_day_stats([t0], {t0: fingerprint[2]}, fetch_day_stats(t0))[t0]
+
+
+def all_day_stats():
+    """[{"t0", **stats}] for every day with data, oldest first."""
+    revisions = fetch_day_revisions()
+    days = list_day_timestamps()
+    stats = _cached_day_stats(days, revisions, fetch_day_stats())
+    return [dict(t0=t0, **stats[t0]) for t0 in days]
+
+
+def _iter_json(obj, separators=None, depth=2):
+    """
+    Yields the text of json.dumps(obj, ensure_ascii=False, separators=...)
+    in pieces. Lists, up to `depth` containers deep, are encoded a slice of
+    JSON_CHUNK_ITEMS at a time, so a day's event lists never exist as one
+    big string.
+    """
+    item_sep, key_sep = separators or (", ", ": ")
+    if depth > 0 and isinstance(obj, dict) and obj:
+        yield "{"
+        for k, (key, value) in enumerate(obj.items()):
+            yield (item_sep if k else "") + json.dumps(key, ensure_ascii=False) + key_sep
+            yield from _iter_json(value, separators, depth - 1)
+        yield "}"
+    elif depth > 0 and isinstance(obj, list) and len(obj) > JSON_CHUNK_ITEMS:
+        yield "["
+        for start in range(0, len(obj), JSON_CHUNK_ITEMS):
+            piece = json.dumps(
+                obj[start : start + JSON_CHUNK_ITEMS], ensure_ascii=False, separators=separators
+            )
+            yield (item_sep if start else "") + piece[1:-1]
+        yield "]"
+    else:
+        yield json.dumps(obj, ensure_ascii=False, separators=separators)
+
+
+def _same_file_content(path, size, digest):
+    try:
+        if os.path.getsize(path) != size:
+            return False
+        existing = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                existing.update(block)
+    except OSError:
+        return False
+    return existing.hexdigest() == digest
+
+
+def _write_json(path, obj, separators=None):
+    """
+    Writes obj as JSON plus a gzip copy at <path>.gz, which server.py sends
+    as-is to clients that accept gzip. The JSON is encoded once, streamed
+    into a temp file and hashed on the way; if it matches what is on disk
+    the temp file is dropped and nothing is compressed or replaced.
+    Otherwise the .gz is compressed from the temp file and both are moved
+    into place with os.replace, the .gz second so it is never older than the
+    file it mirrors; readers see the old file or the new one, never half of
+    it. Returns True if the files were replaced.
+    """
+    suffix = f".{os.getpid()}-{threading.get_ident()}.tmp"
+    tmp_path = path + suffix
+    gz_tmp_path = path + ".gz" + suffix
+    digest = hashlib.sha1()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            for piece in _iter_json(obj, separators):
+                data = piece.encode("utf-8")
+                digest.update(data)
+                size += len(data)
+                f.write(data)
+        if os.path.isfile(path + ".gz") and _same_file_content(path, size, digest.hexdigest()):
+            os.unlink(tmp_path)
+            return False
+        with open(tmp_path, "rb") as src, open(gz_tmp_path, "wb") as raw_gz:
+            with gzip.GzipFile(fileobj=raw_gz, mode="wb", compresslevel=9, mtime=0) as gz:
+                shutil.copyfileobj(src, gz, 1 << 20)
+        gz_size = os.path.getsize(gz_tmp_path)
+        os.replace(tmp_path, path)
+        os.replace(gz_tmp_path, path + ".gz")
+    except BaseException:
+        for leftover in (tmp_path, gz_tmp_path):
+            try:
+                os.unlink(leftover)
+            except OSError:
+                pass
+        raise
+    metrics.inc("prolific_export_bytes_written_total", size + gz_size)
+    return True
+
+
+def _load_export_list(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return []
+    return data if isinstance(data, list) else []
+
+
+def _export_list_entry(t0, v2):
+    entry = {"t0": t0, "t1": t0 + 86400, "fname": f"events_{t0}.json"}
+    if v2:
+        entry["formats"] = {"1": entry["fname"], "2": f"events_{t0}.v2.json"}
+    return entry
+
+
+def _patch_export_list(export_list_path, timestamps, v2=False):
+    """
+    Brings render/export_list.json in line with the current set of days.
+    Entries advertise the v2 file under "formats" when it is being written.
+    Returns True if the file changed.
+    """
+    existing = _load_export_list(export_list_path)
+    patched = [_export_list_entry(t0, v2) for t0 in timestamps]
+
+    if patched == existing:
+        return False
+
+    return _write_json(export_list_path, patched)
+
+
+def _write_overview(overview_path, timestamps):
+    """
+    Writes render/overview.json: one compact rollup per exported day, in
+    export_list.json order, so overview.html never needs the raw events.
+    """
+    present = set(timestamps)
+    days = []
+    for rollup in fetch_daily_rollups():
+        t0 = rollup["t0"]
+        if t0 not in present:
+            continue
+        rollup["t1"] = t0 + 86400
+        rollup["fname"] = f"events_{t0}.json"
+        days.append(rollup)
+
+    return _write_json(overview_path, {"days": days})
+
+
+@metrics.timed("prolific_export_run_seconds")
+def updateEvents(full=False, v2=None, progress=None, backfill=None):
     """
     Writes per-day render/events_<t0>.json files and render/export_list.json
     from SQLite storage. Legacy text logs are backfilled into SQLite once.
+
+    Only days whose revision changed since their last export are rewritten,
+    unless full=True. With v2 (default: PROLIFIC_EXPORT_V2) each day also
+    gets a compact events_<t0>.v2.json. progress, if given, is called as
+    progress(days_done, days_total, days_written) while days are processed.
+    backfill=False (default: not PROLIFIC_NO_BACKFILL) skips the legacy log
+    import check.
     """
+    if v2 is None:
+        v2 = EXPORT_V2
+    if backfill is None:
+        backfill = not SKIP_BACKFILL
     init_db()
-    summary = backfill_from_legacy_logs(force=False)
-    if summary["files_imported"] > 0:
-        print(
-            f"[{datetime.now()}] sqlite backfill imported "
-            f"{summary['files_imported']} files, {summary['rows_inserted']} rows"
-        )
+    if backfill:
+        summary = backfill_from_legacy_logs(force=False)
+        if summary["files_imported"] > 0:
+            print(
+                f"[{datetime.now()}] sqlite backfill imported "
+                f"{summary['files_imported']} files, {summary['rows_inserted']} rows"
+            )
 
     timestamps = list_day_timestamps()
     if not timestamps:
         print("No valid event data found. Exiting.")
-        return
+        return {"days_total": 0, "days_written": 0}
 
     render_root = os.path.join(os.getcwd(), "render")
     os.makedirs(render_root, exist_ok=True)
 
-    export_list = []
+    # Read revisions before the rows: a write racing this export bumps the
+    # revision past what we record, so the day is picked up again next run.
+    revisions = fetch_day_revisions()
+    exported = {} if full else fetch_export_revisions()
+    rolled_up = {} if full else fetch_rollup_revisions()
+    # Editing category_rules.json changes its version, which re-rolls every
+    # day's summary without rewriting the unchanged event files.
+    rules = reload_rules().version
+
+    todo = []
     for t0 in timestamps:
-        t1 = t0 + 86400
-        out_name = f"events_{t0}.json"
-        out_path = os.path.join(render_root, out_name)
-
-        payload = {
-            "window_events": _normalize_window_events(fetch_window_events(t0), t0, t1),
-            "keyfreq_events": _normalize_keyfreq_events(fetch_keyfreq_events(t0), t0, t1),
-            "notes_events": _normalize_text_events(fetch_notes_events(t0), t0, t1, dedupe_exact=False),
-            "blog": get_blog_entry(t0),
-        }
+        revision = revisions.get(t0, 0)
+        file_current = (
+            exported.get(t0) == revision
+            and os.path.isfile(os.path.join(render_root, f"events_{t0}.json"))
+            and (not v2 or os.path.isfile(os.path.join(render_root, f"events_{t0}.v2.json")))
+        )
+        rollup_current = rolled_up.get(t0) == (revision, rules)
+        if not (file_current and rollup_current):
+            todo.append((t0, revision, file_current))
 
-        with open(out_path, "w", encoding="utf-8") as f:
-            json.dump(payload, f, ensure_ascii=False)
-        print(f"[{datetime.now()}] wrote {out_path}")
+    written = []
+    rollups = []
+    stats = []
+    # One summary line per run instead of a line per file.
+    files = {"written": 0, "unchanged": 0}
 
-        export_list.append({"t0": t0, "t1": t1, "fname": out_name})
+    def write(path, obj, separators=None):
+        files["written" if _write_json(path, obj, separators) else "unchanged"] += 1
+    days_skipped = len(timestamps) - len(todo)
+    payloads = _iter_day_payloads([t0 for t0, _, _ in todo])
+    # Payloads are read lazily, so a day's time includes fetching its rows.
+    day_started = time.perf_counter()
+    for k, ((t0, revision, file_current), (_, payload)) in enumerate(zip(todo, payloads)):
+        if progress is not None:
+            progress(days_skipped + k, len(timestamps), len(written))
+
+        if not file_current:
+            write(os.path.join(render_root, f"events_{t0}.json"), payload)
+            if v2:
+                v2_path = os.path.join(render_root, f"events_{t0}.v2.json")
+                write(v2_path, encode_day_payload_v2(payload, t0), separators=(",", ":"))
+            written.append((t0, revision))
+
+        rollups.append((t0, revision, rules, compute_day_rollup(payload, t0)))
+        stats.append((t0, revision, rules, compute_day_stats(payload)))
+        now = time.perf_counter()
+        metrics.observe("prolific_export_day_seconds", now - day_started)
+        day_started = now
+
+    if progress is not None:
+        progress(len(timestamps), len(timestamps), len(written))
+
+    upsert_daily_rollups(rollups)
+    upsert_day_stats(stats)
+    mark_days_exported(written)
 
     export_list_path = os.path.join(render_root, "export_list.json")
-    with open(export_list_path, "w", encoding="utf-8") as f:
-        json.dump(export_list, f, ensure_ascii=False)
-    print(f"[{datetime.now()}] wrote {export_list_path}")
+    if _patch_export_list(export_list_path, timestamps, v2=v2):
+        files["written"] += 1
+
+    overview_path = os.path.join(render_root, "overview.json")
+    if rollups or not os.path.isfile(overview_path):
+        files["written" if _write_overview(overview_path, timestamps) else "unchanged"] += 1
+
+    print(
+        f"[{datetime.now()}] exported {len(written)} of {len(timestamps)} days to {render_root} "
+        f"({files['written']} files written, {files['unchanged']} unchanged)"
+    )
+    return {"days_total": len(timestamps), "days_written": len(written)}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export SQLite events to render/events_*.json.")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Rewrite every day instead of only days that changed since the last export.",
+    )
+    parser.add_argument(
+        "--v2",
+        action="store_true",
+        default=EXPORT_V2,
+        help="Also write compact columnar events_<t0>.v2.json files (or set PROLIFIC_EXPORT_V2=1).",
+    )
+    parser.add_argument(
+        "--no-backfill",
+        action="store_true",
+        default=SKIP_BACKFILL,
+        help="Skip importing legacy logs/*.txt files (or set PROLIFIC_NO_BACKFILL=1).",
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    updateEvents()
+    args = parse_args()
+    updateEvents(full=args.full, v2=args.v2, backfill=not args.no_backfill)
@@ -0,0 +1,104 @@
+"""
+Packed keyfreq samples. A block is a little-endian uint16 stream with one
+record per sample, or per run of zero samples:
+
+    dt:     [dt]                           seconds since the previous sample
+                                           (the block's base time for the first)
+            [0xFFFF, dt >> 16, dt & 0xFFFF] when dt >= 0xFFFF
+    count:  [count]                        for 0 < count < 0xFFFF
+            [0xFFFF, hi, lo]               larger counts, up to MAX_COUNT
+            [0, n]                         n zero samples, each dt after the last
+
+A collector day (a sample every 9 s, mostly small counts) packs to about
+4 bytes per sample, and idle stretches collapse into a single record.
+Blocks concatenate: pack(more, base_t=last_t) appended to a block whose last
+sample is at last_t decodes as one stream.
+"""
+
+import sys
+from array import array
+
+ESCAPE = 0xFFFF
+MAX_COUNT = 0xFFFFFFFF
+MAX_RUN = 0xFFFF
+
+
+def _words(data):
+    words = array("H")
+    words.frombytes(data)
+    if sys.byteorder == "big":
+        words.byteswap()
+    return words
+
+
+def _put_wide(words, value):
+    if value < ESCAPE:
+        words.append(value)
+    else:
+        words.extend((ESCAPE, value >> 16, value & 0xFFFF))
+
+
+def pack(samples, base_t):
+    """
+    Encodes time-sorted [(t, count)] with every t >= base_t. Negative counts
+    are stored as 0, counts above MAX_COUNT as MAX_COUNT.
+    """
+    words = array("H")
+    prev = base_t
+    i = 0
+    n = len(samples)
+    while i < n:
+        t, count = samples[i]
+        dt = t - prev
+        if dt < 0:
+            raise ValueError(f"Unsorted keyfreq sample at {t} (previous {prev})")
+        _put_wide(words, dt)
+        count = min(max(int(count), 0), MAX_COUNT)
+        if count:
+            _put_wide(words, count)
+            i += 1
+        else:
+            run = 1
+            while (
+                i + run < n
+                and run < MAX_RUN
+                and samples[i + run][1] <= 0
+                and samples[i + run][0] - samples[i + run - 1][0] == dt
+            ):
+                run += 1
+            words.extend((0, run))
+            i += run
+            t = samples[i - 1][0]
+        prev = t
+    if sys.byteorder == "big":
+        words.byteswap()
+    return words.tobytes()
+
+
+def unpack(data, base_t):
+    """Decodes a block back into [(t, count)]."""
+    words = _words(data)
+    out = []
+    t = base_t
+    i = 0
+    n = len(words)
+    while i < n:
+        dt = words[i]
+        i += 1
+        if dt == ESCAPE:
+            dt = words[i] << 16 | words[i + 1]
+            i += 2
+        count = words[i]
+        i += 1
+        if count == 0:
+            for _ in range(words[i]):
+                t += dt
+                out.append((t, 0))
+            i += 1
+            continue
+        if count == ESCAPE:
+            count = words[i] << 16 | words[i + 1]
+            i += 2
+        t += dt
+        out.append((t, count))
+    return out
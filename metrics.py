@@ -0,0 +1,148 @@
+"""
+In-process counters and latency histograms for the hot paths, rendered as
+Prometheus text (GET /metrics on server.py) or as a one-line summary for
+the collector, which has no HTTP server.
+"""
+
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds; +Inf is implied.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 10.0)
+
+_HELP = {
+    "prolific_storage_op_seconds": "Time spent in storage.py reads and writes.",
+    "prolific_storage_write_lock_wait_seconds": "Time spent waiting for storage._WRITE_LOCK.",
+    "prolific_storage_rows_written_total": "Rows inserted, by table (keyfreq_blocks: samples).",
+    "prolific_export_day_seconds": "Time to build and write one day during updateEvents.",
+    "prolific_export_run_seconds": "Time for a whole updateEvents run.",
+    "prolific_export_bytes_written_total": "Bytes of JSON (and gzip copies) written by the exporter.",
+    "prolific_collector_loop_jitter_seconds": "How late a collector loop iteration ran.",
+    "prolific_http_request_seconds": "HTTP request handling time, by method and path.",
+    "prolific_http_requests_total": "HTTP requests, by method, path and status.",
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0, 0, 0.0]
+        buckets, _, _, _ = hist
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                buckets[i] += 1
+                break
+        else:
+            buckets[-1] += 1
+        hist[1] += seconds
+        hist[2] += 1
+        hist[3] = max(hist[3], seconds)
+
+
+@contextmanager
+def timer(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def timed(name, **labels):
+    """Decorator form of timer()."""
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    parts = []
+    for k, v in items:
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def render_prometheus():
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((k, [list(v[0]), v[1], v[2]]) for k, v in _histograms.items())
+
+    lines = []
+    seen = set()
+
+    def header(name, kind):
+        if name in seen:
+            return
+        seen.add(name)
+        if name in _HELP:
+            lines.append(f"# HELP {name} {_HELP[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in counters:
+        header(name, "counter")
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for (name, labels), (buckets, total, count) in histograms:
+        header(name, "histogram")
+        cumulative = 0
+        for bound, n in zip(LATENCY_BUCKETS, buckets):
+            cumulative += n
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+        lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def summary_line():
+    """Compact one-line digest: count, mean and max per histogram, then counters."""
+    with _lock:
+        histograms = sorted((k, v[1], v[2], v[3]) for k, v in _histograms.items())
+        counters = sorted(_counters.items())
+    parts = []
+    for (name, labels), total, count, peak in histograms:
+        label = ",".join(str(v) for _, v in labels)
+        short = name.replace("prolific_", "").replace("_seconds", "")
+        parts.append(
+            f"{short}[{label}] n={count} avg={total / count * 1000:.1f}ms max={peak * 1000:.1f}ms"
+        )
+    for (name, labels), value in counters:
+        label = ",".join(str(v) for _, v in labels)
+        parts.append(f"{name.replace('prolific_', '')}[{label}]={value}")
+    return "; ".join(parts) if parts else "no metrics yet"
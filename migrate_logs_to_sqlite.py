@@ -1,16 +1,44 @@
+import argparse
+import time
 from datetime import datetime
 
 from storage import backfill_from_legacy_logs, get_db_path, init_db
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Import legacy logs/*.txt files into SQLite.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Parser processes (default: PROLIFIC_BACKFILL_WORKERS or the CPU count, up to 8).",
+    )
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
     init_db()
-    summary = backfill_from_legacy_logs(force=True)
+    started = time.monotonic()
+
+    def progress(files_done, files_total, rows_inserted):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        print(
+            f"[{datetime.now()}] {files_done}/{files_total} files, "
+            f"{rows_inserted} rows ({rows_inserted / elapsed:.0f} rows/s)"
+        )
+
+    summary = backfill_from_legacy_logs(force=True, workers=args.workers, progress=progress)
+    elapsed = max(time.monotonic() - started, 1e-6)
     print(f"[{datetime.now()}] SQLite DB: {get_db_path()}")
     print(f"[{datetime.now()}] Files scanned: {summary['files_seen']}")
     print(f"[{datetime.now()}] Files imported: {summary['files_imported']}")
     print(f"[{datetime.now()}] Rows inserted: {summary['rows_inserted']}")
     print(f"[{datetime.now()}] Rows malformed: {summary['rows_malformed']}")
+    print(
+        f"[{datetime.now()}] Elapsed: {elapsed:.1f}s "
+        f"({summary['rows_inserted'] / elapsed:.0f} rows/s)"
+    )
     return 0
 
 
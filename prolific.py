@@ -10,13 +10,28 @@ import win32gui
 import win32process
 from pynput import keyboard
 
-from storage import init_db, insert_keyfreq_event, insert_window_event
+import metrics
+from storage import (
+    RETENTION_DAYS,
+    EventWriter,
+    compact_old_days,
+    init_db,
+    insert_keyfreq_event,
+    insert_window_event,
+)
 
 LOG_DIR = "logs"
 WINDOW_POLL_SECONDS = 2.0
-WINDOW_HEARTBEAT_SECONDS = 600
+# A heartbeat only moves the open window span's end_t forward in place, so it
+# is cheap to send often; it sets how precisely a span's end is known.
+WINDOW_HEARTBEAT_SECONDS = 10
 KEY_BUCKET_SECONDS = 9.0
 USER_IDLE_SECONDS = 300
+EVENT_FLUSH_SECONDS = 5.0
+METRICS_SUMMARY_SECONDS = 300.0
+COMPACTION_INTERVAL_SECONDS = 6 * 3600
+# A short pause between days keeps compaction from crowding out live writes.
+COMPACTION_DAY_PAUSE_SECONDS = 0.05
 
 
 class LASTINPUTINFO(ctypes.Structure):
@@ -69,7 +84,9 @@ def log_active_windows(
     poll_seconds=WINDOW_POLL_SECONDS,
     heartbeat_seconds=WINDOW_HEARTBEAT_SECONDS,
     idle_seconds=USER_IDLE_SECONDS,
+    writer=None,
 ):
+    write_window_event = writer.submit_window_event if writer else insert_window_event
     last_payload = None
     last_write_time = 0
 
@@ -81,17 +98,21 @@ def log_active_windows(
             should_write = payload != last_payload or (now - last_write_time) >= heartbeat_seconds
 
             if should_write:
-                insert_window_event(now, payload)
-                print(f"window: {payload}")
+                write_window_event(now, payload)
+                if payload != last_payload:
+                    print(f"window: {payload}")
                 last_payload = payload
                 last_write_time = now
         except Exception as exc:
             print(f"window logger error: {exc}")
 
-        stop_event.wait(poll_seconds)
+        due = time.monotonic() + poll_seconds
+        if not stop_event.wait(poll_seconds):
+            metrics.observe("prolific_collector_loop_jitter_seconds", time.monotonic() - due, loop="window")
 
 
-def log_key_frequency(stop_event, bucket_seconds=KEY_BUCKET_SECONDS):
+def log_key_frequency(stop_event, bucket_seconds=KEY_BUCKET_SECONDS, writer=None):
+    write_keyfreq_event = writer.submit_keyfreq_event if writer else insert_keyfreq_event
     count_lock = threading.Lock()
     bucket_count = 0
 
@@ -105,34 +126,54 @@ def log_key_frequency(stop_event, bucket_seconds=KEY_BUCKET_SECONDS):
 
     try:
         while not stop_event.is_set():
+            due = time.monotonic() + bucket_seconds
             stop_event.wait(bucket_seconds)
+            metrics.observe("prolific_collector_loop_jitter_seconds", time.monotonic() - due, loop="keyfreq")
             now = int(time.time())
 
             with count_lock:
                 count = bucket_count
                 bucket_count = 0
 
-            insert_keyfreq_event(now, count)
+            write_keyfreq_event(now, count)
             print(f"keyfreq: {count}")
     finally:
         listener.stop()
         listener.join(timeout=2)
 
 
+def compact_in_background(stop_event, older_than_days=RETENTION_DAYS, interval=COMPACTION_INTERVAL_SECONDS):
+    """Compacts old days now and then every interval seconds, pausing between days."""
+    while not stop_event.is_set():
+        try:
+            report = compact_old_days(
+                older_than_days=older_than_days,
+                stop_event=stop_event,
+                pause_seconds=COMPACTION_DAY_PAUSE_SECONDS,
+            )
+            if report["days"]:
+                removed = report["keyfreq_rows_before"] - report["keyfreq_rows_after"]
+                print(f"compaction: {report['days']} days, {removed} keyfreq rows removed")
+        except Exception as exc:
+            print(f"compaction error: {exc}")
+        stop_event.wait(interval)
+
+
 def start_logging(
     stop_event,
     window_poll_seconds=WINDOW_POLL_SECONDS,
     key_bucket_seconds=KEY_BUCKET_SECONDS,
     idle_seconds=USER_IDLE_SECONDS,
+    writer=None,
 ):
     window_thread = threading.Thread(
         target=log_active_windows,
-        args=(stop_event, window_poll_seconds, WINDOW_HEARTBEAT_SECONDS, idle_seconds),
+        args=(stop_event, window_poll_seconds, WINDOW_HEARTBEAT_SECONDS, idle_seconds, writer),
         daemon=True,
     )
     key_thread = threading.Thread(
         target=log_key_frequency,
-        args=(stop_event, key_bucket_seconds),
+        args=(stop_event, key_bucket_seconds, writer),
         daemon=True,
     )
     window_thread.start()
@@ -163,6 +204,24 @@ def parse_args():
         default=USER_IDLE_SECONDS,
         help="Seconds without user input before logging __IDLE__.",
     )
+    parser.add_argument(
+        "--flush-seconds",
+        type=float,
+        default=EVENT_FLUSH_SECONDS,
+        help="How often queued events are committed to SQLite in one transaction.",
+    )
+    parser.add_argument(
+        "--retention-days",
+        type=int,
+        default=RETENTION_DAYS,
+        help="Downsample keyfreq rows of days older than this in the background (0 disables).",
+    )
+    parser.add_argument(
+        "--metrics-seconds",
+        type=float,
+        default=METRICS_SUMMARY_SECONDS,
+        help="How often to print a one-line latency/jitter summary (0 disables).",
+    )
     return parser.parse_args()
 
 
@@ -183,20 +242,41 @@ def main():
 
     print("starting prolific logger (windows mode)")
     idle_seconds = max(15.0, float(args.idle_seconds))
+    writer = EventWriter(stop_event, flush_seconds=args.flush_seconds).start()
     threads = start_logging(
         stop_event=stop_event,
         window_poll_seconds=args.window_poll_seconds,
         key_bucket_seconds=args.key_bucket_seconds,
         idle_seconds=idle_seconds,
+        writer=writer,
     )
-
+    if args.retention_days > 0:
+        compaction_thread = threading.Thread(
+            target=compact_in_background,
+            args=(stop_event, args.retention_days),
+            daemon=True,
+        )
+        compaction_thread.start()
+        threads = (*threads, compaction_thread)
+
+    next_summary = time.monotonic() + args.metrics_seconds
     try:
         while not stop_event.is_set():
             stop_event.wait(1)
+            if args.metrics_seconds > 0 and time.monotonic() >= next_summary:
+                print(f"metrics: {metrics.summary_line()}")
+                next_summary = time.monotonic() + args.metrics_seconds
     finally:
         stop_event.set()
         for thread in threads:
             thread.join(timeout=3)
+        writer.close()
+        stats = writer.stats()
+        print(
+            f"event writer: {stats['written']} events in {stats['flushes']} flushes, "
+            f"avg {stats['avg_flush_ms']:.1f}ms, max queue depth {stats['max_queue_depth']}, "
+            f"dropped {stats['dropped']}"
+        )
         print("logger stopped")
 
     return 0
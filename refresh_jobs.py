@@ -0,0 +1,125 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+MAX_FINISHED_JOBS = 50
+
+
+class RefreshJobs:
+    """
+    Runs export refreshes on a background thread, one at a time. A request
+    made while a run is in flight queues a single follow-up run; further
+    requests join that queued job instead of adding more, since one run
+    after the last write already picks up everything.
+    """
+
+    def __init__(self, run):
+        self._run = run
+        self._cond = threading.Condition()
+        self._ids = itertools.count(1)
+        self._jobs = OrderedDict()
+        self._running = None
+        self._queued = None
+
+    def submit(self):
+        """Returns a snapshot of the job that will cover this request."""
+        with self._cond:
+            if self._queued is not None:
+                self._queued["requests"] += 1
+                return self._snapshot(self._queued)
+
+            job = {
+                "id": next(self._ids),
+                "state": "queued",
+                "requests": 1,
+                "days_total": None,
+                "days_done": 0,
+                "days_written": 0,
+                "error": None,
+                "created": time.time(),
+                "started": None,
+                "finished": None,
+            }
+            self._jobs[job["id"]] = job
+            self._prune()
+            if self._running is None:
+                self._running = job
+                worker = threading.Thread(target=self._worker, args=(job,), name="refresh", daemon=True)
+                worker.start()
+            else:
+                self._queued = job
+            return self._snapshot(job)
+
+    def get(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return None if job is None else self._snapshot(job)
+
+    def wait(self, job_id, timeout=None):
+        """Blocks until the job has finished (or timeout); returns its snapshot."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                job = self._jobs.get(job_id)
+                if job is None or job["state"] in ("done", "failed"):
+                    return None if job is None else self._snapshot(job)
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return self._snapshot(job)
+                self._cond.wait(remaining)
+
+    def _worker(self, job):
+        while job is not None:
+            self._execute(job)
+            with self._cond:
+                job = self._queued
+                self._queued = None
+                self._running = job
+
+    def _execute(self, job):
+        def progress(days_done, days_total, days_written):
+            with self._cond:
+                job["days_done"] = days_done
+                job["days_total"] = days_total
+                job["days_written"] = days_written
+
+        with self._cond:
+            job["state"] = "running"
+            job["started"] = time.time()
+        try:
+            summary = self._run(progress=progress)
+            state, error = "done", None
+        except Exception as exc:
+            print(f"refresh job {job['id']} failed: {exc}")
+            summary, state, error = None, "failed", str(exc)
+        with self._cond:
+            if summary:
+                job["days_total"] = summary["days_total"]
+                job["days_written"] = summary["days_written"]
+            job["state"] = state
+            job["error"] = error
+            job["finished"] = time.time()
+            self._cond.notify_all()
+
+    def _prune(self):
+        finished = [k for k, j in self._jobs.items() if j["state"] in ("done", "failed")]
+        for job_id in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def _snapshot(self, job):
+        started = job["started"]
+        if started is None:
+            elapsed = 0.0
+        else:
+            elapsed = (job["finished"] or time.time()) - started
+        return {
+            "id": job["id"],
+            "state": job["state"],
+            "requests": job["requests"],
+            "days_total": job["days_total"],
+            "days_done": job["days_done"],
+            "days_written": job["days_written"],
+            "elapsed_seconds": round(elapsed, 3),
+            "error": job["error"],
+        }
@@ -466,53 +466,93 @@
 
     function fetchAndLoadEvents(daylog) {
       loaded = false;
-      // we do this random thing to defeat caching. Very annoying
-      var json_path = daylog.fname + "?sigh=" + Math.floor(10000*Math.random());
-
-      // fill in blog area with blog for this day
-      $.getJSON(json_path, function(data){
-        loaded = true;
-
-        // save these as globals for later access
-        events = data['window_events'];
-        key_events = data['keyfreq_events']
-        notes_events = data['notes_events']
-
-        // map all window titles through the (customizable) mapwin function
-        _.each(events, function(e) { e.m = mapwin(e.s); });
-        
-        // compute various statistics
-        statEvents(events);
-
-        // create color hash table, maps from window titles -> HSL color
-        color_hash = colorHashStrings(_.uniq(_.pluck(events, 'm')));
-
-        // find the time extent: min and max time for this day
-        if(events.length > 0) {
-          t00 = _.min(_.pluck(events, 't'));
-          ft = _.max(_.map(events, function(e) { return e.t + e.dt; }))
-        } else {
-          t00 = daylog.t0;
-          ft = daylog.t1;
+      // The server builds the day straight from SQLite and answers with an
+      // ETag, so repeat visits revalidate with a cheap 304 instead of
+      // re-downloading. The exported file is only a fallback.
+      // Both ask for the compact columnar format when it is available.
+      $.ajax({
+        url: "/api/day/" + daylog.t0 + "?format=v2",
+        dataType: "json",
+        success: function(data) { loadWithRules(daylog, data); },
+        error: function() {
+          var fname = (daylog.formats && daylog.formats["2"]) || daylog.fname;
+          $.getJSON(fname, function(data) { loadWithRules(daylog, data); });
         }
+      });
+    }
 
-        // render blog entry
-        blog = 'blog' in data ? data['blog'] : '';
-        if(typeof blog !== 'string') { blog = ''; }
-        $("#blogpre").text(blog);
+    function loadWithRules(daylog, data) {
+      // mapwin() needs category_rules.json, which may still be loading
+      loadCategoryRules().then(function() { loadDayData(daylog, decodeDayPayload(data)); });
+    }
 
-        visualizeEvents(events);
-        writeHeader();
-        createPieChart(events, etypes);
-        computeKeyStats(events, key_events);
-        hacking_stats = computeHackingStats(events, key_events, hacking_titles);
-        visualizeHackingTimes(hacking_stats);
-        focus_stats = computeFocusTaxStats(events);
-        visualizeFocusMeter(focus_stats);
-        key_stats = computeKeyStats(events, key_events);
-        visualizeKeyStats(key_stats, etypes);
-        visualizeKeyFreq(key_events);
-        visualizeNotes(notes_events);
+    function loadDayData(daylog, data) {
+      loaded = true;
+
+      // save these as globals for later access
+      events = data['window_events'];
+      key_events = data['keyfreq_events']
+      notes_events = data['notes_events']
+
+      // map all window titles through the (customizable) mapwin function
+      _.each(events, function(e) { e.m = mapwin(e.s); });
+      
+      // compute various statistics
+      statEvents(events);
+
+      // create color hash table, maps from window titles -> HSL color
+      color_hash = colorHashStrings(_.uniq(_.pluck(events, 'm')));
+
+      // find the time extent: min and max time for this day
+      if(events.length > 0) {
+        t00 = _.min(_.pluck(events, 't'));
+        ft = _.max(_.map(events, function(e) { return e.t + e.dt; }))
+      } else {
+        t00 = daylog.t0;
+        ft = daylog.t1;
+      }
+
+      // render blog entry
+      blog = 'blog' in data ? data['blog'] : '';
+      if(typeof blog !== 'string') { blog = ''; }
+      $("#blogpre").text(blog);
+
+      visualizeEvents(events);
+      writeHeader();
+      createPieChart(events, etypes);
+      visualizeKeyFreq(key_events);
+      visualizeNotes(notes_events);
+      fetchAndShowDayStats(daylog);
+    }
+
+    function showDayStats(stats) {
+      hacking_stats = stats.hacking_stats;
+      visualizeHackingTimes(hacking_stats);
+      focus_stats = stats.focus_stats;
+      visualizeFocusMeter(focus_stats);
+      key_stats = stats.key_stats;
+      visualizeKeyStats(key_stats, etypes);
+    }
+
+    function fetchAndShowDayStats(daylog) {
+      // The server caches these per day (analytics.compute_day_stats); when
+      // it is not reachable, run the same passes here.
+      hacking_stats = {};
+      $.ajax({
+        url: "/api/day/" + daylog.t0 + "/stats",
+        dataType: "json",
+        success: function(stats) {
+          if(event_list[cur_event_id] !== daylog) return; // moved on to another day
+          showDayStats(stats);
+        },
+        error: function() {
+          if(event_list[cur_event_id] !== daylog) return;
+          showDayStats({
+            hacking_stats: computeHackingStats(events, key_events, hacking_titles),
+            focus_stats: computeFocusTaxStats(events),
+            key_stats: computeKeyStats(events, key_events),
+          });
+        }
       });
     }
 
@@ -535,8 +575,12 @@
       .style("visibility", "hidden")
       .text("");
 
-      // we do this random thing to defeat caching. Very annoying
-      $.getJSON("export_list.json?sigh=" + Math.floor(10000*Math.random()), function(data){
+      // start loading the category rules alongside the day list
+      loadCategoryRules();
+
+      // export_list.json is served with Cache-Control: no-cache, so the
+      // browser revalidates it rather than showing a stale list
+      $.getJSON("export_list.json", function(data){
         event_list = data; // assign to global variable
 
         cur_event_id = event_list.length - 1;
@@ -554,13 +598,14 @@
         startSpinner();
         $.post("/refresh",
           {"time" : event_list[cur_event_id].t0},
-          function(data,status){
-            console.log("Data: " + data + "\nStatus: " + status);
-            stopSpinner();
-            if(data === 'OK') {
-              // everything went well, refresh current view
-              fetchAndLoadEvents(event_list[cur_event_id]);
-            }
+          function(job,status){
+            waitForRefresh(job, function(done) {
+              stopSpinner();
+              if(done && done.state === 'done') {
+                // everything went well, refresh current view
+                fetchAndLoadEvents(event_list[cur_event_id]);
+              }
+            });
         });
       });
 
@@ -570,11 +615,11 @@
         startSpinner();
         $.post("/addnote",
           {"note": $("#notetext").val(), "time": clicktime},
-          function(data,status){
-            console.log("Data: " + data + "\nStatus: " + status);
+          function(job,status){
             stopSpinner();
-            if(data === 'OK') {
-              // everything went well, refresh current view
+            if(job && job.id) {
+              // the note is already stored and /api/day reads it straight
+              // from SQLite, so there is no need to wait for the export job
               $("#notetext").val('') // erase
               $("#notesinfo").hide(); // take away
               fetchAndLoadEvents(event_list[cur_event_id]);
@@ -633,12 +678,9 @@
         // submit to server with POST request
         $.post("/blog",
           {"time" : event_list[cur_event_id].t0, "post": txt},
-           function(data,status){
-            console.log("Data: " + data + "\nStatus: " + status);
+           function(job,status){
+            console.log("blog saved, export job " + (job && job.id) + "\nStatus: " + status);
             stopSpinner();
-            if(data === 'OK') {
-              // everything went well
-            }
           });
       });
       setInterval(redraw, 1000); // in case of window resize, we can redraw
@@ -651,8 +693,10 @@
       visualizeEvents(events);
       visualizeKeyFreq(key_events);
       visualizeNotes(notes_events);
-      visualizeHackingTimes(hacking_stats);
-      visualizeFocusMeter(focus_stats);
+      if(hacking_stats.events) { // day stats arrive after the events
+        visualizeHackingTimes(hacking_stats);
+        visualizeFocusMeter(focus_stats);
+      }
       dirty = false;
     }
 
@@ -27,6 +27,14 @@
     window.location.replace("day.html?gotoday=" + encodeURIComponent(ix));
   }
 
+  // The export runs as a background job; poll it until it is finished.
+  function waitForJob(job) {
+    if (!job || job.state === "done" || job.state === "failed") return job;
+    return new Promise(function (resolve) { setTimeout(resolve, 500); })
+      .then(function () { return fetch("/api/refresh/" + job.id, { cache: "no-store" }); })
+      .then(function (r) { return r.ok ? r.json().then(waitForJob) : null; });
+  }
+
   function refreshStatus() {
     setText("homeStatusServer", "Checking...");
     setText("homeStatusPort", portOrigin());
@@ -36,6 +44,9 @@
       body: "time=0",
       cache: "no-store"
     })
+      .then(function (r) {
+        return r.ok ? r.json().then(waitForJob) : null;
+      })
       .catch(function () {
         // Home status should still render if refresh endpoint is temporarily unavailable.
         return null;
@@ -8,11 +8,12 @@ var etypes = [];
 var edur = []; // duration by day index -> {category: seconds}
 var color_hash = {};
 var event_list = [];
-var events = [];
+var day_rollups = []; // per-day summaries from overview.json, parallel to event_list
 
 var year_stats = {};
 var year_order = [];
 var active_year = null;
+var year_picked = false; // set once the user clicks a year
 
 function showOverviewMessage(html) {
   $("#graphopts").empty();
@@ -24,53 +25,29 @@ function showOverviewMessage(html) {
   $("#keystats").empty();
 }
 
-function mapEvents(es) {
-  for(var i=0,N=es.length;i<N;i++) {
-    var e = es[i];
-    e.m = mapwin(e.s);
-    if(etypes.indexOf(e.m) === -1) {
-      etypes.push(e.m);
-    }
-    if(!skipdraw.hasOwnProperty(e.m)) {
-      skipdraw[e.m] = false;
-    }
-  }
-}
-
-function statEvents(es, ecounts) {
-  if(es.length === 0) return; // empty case
-
-  var ixprev = 0;
-  for(var i=1,N=es.length;i<N;i++) {
-    var dt = es[i].t - es[ixprev].t;
-    es[ixprev].dt = dt;
-    var tmap = es[ixprev].m;
-    if(ecounts.hasOwnProperty(tmap)) {
-      ecounts[tmap] += dt;
-    } else {
-      ecounts[tmap] = 0;
-    }
-    ixprev = i;
-  }
-  es[N-1].dt = 1;
-}
-
+// overview.json carries per-day category durations computed at export time
+// (see analytics.py), so there are no raw events to map or stat here.
 function analyzeEvents() {
   edur = [];
   etypes = [];
 
-  for(var k=0;k<events.length;k++) {
-    var es = events[k]["window_events"] || [];
-    mapEvents(es);
+  for(var k=0;k<day_rollups.length;k++) {
+    var cats = day_rollups[k].category_seconds || {};
+    var day_dur = {};
+    for(var cat in cats) {
+      if(!cats.hasOwnProperty(cat)) continue;
+      if(etypes.indexOf(cat) === -1) {
+        etypes.push(cat);
+      }
+      if(!skipdraw.hasOwnProperty(cat)) {
+        skipdraw[cat] = false;
+      }
+      day_dur[cat] = cats[cat];
+    }
+    edur.push(day_dur);
   }
 
   color_hash = colorHashStrings(etypes);
-
-  for(var q=0;q<events.length;q++) {
-    edur.push({});
-    var day_events = events[q]["window_events"] || [];
-    statEvents(day_events, edur[q]);
-  }
 }
 
 function sumDayDurations(day_dur) {
@@ -88,7 +65,7 @@ function buildYearStats() {
   year_stats = {};
   year_order = [];
 
-  var n = Math.min(event_list.length, events.length, edur.length);
+  var n = Math.min(event_list.length, day_rollups.length, edur.length);
   for(var k=0;k<n;k++) {
     var t0 = event_list[k].t0;
     if(!t0) continue;
@@ -100,7 +77,8 @@ function buildYearStats() {
         indices: [],
         day_count: 0,
         total_seconds: 0,
-        total_keys: 0
+        total_keys: 0,
+        total_hacking_seconds: 0
       };
       year_order.push(year);
     }
@@ -109,11 +87,8 @@ function buildYearStats() {
     ys.indices.push(k);
     ys.day_count += 1;
     ys.total_seconds += sumDayDurations(edur[k]);
-
-    var key_events = events[k]["keyfreq_events"] || [];
-    for(var i=0;i<key_events.length;i++) {
-      ys.total_keys += (key_events[i].s || 0);
-    }
+    ys.total_keys += (day_rollups[k].total_keys || 0);
+    ys.total_hacking_seconds += (day_rollups[k].hacking_seconds || 0);
   }
 
   year_order = _.sortBy(year_order, function(y) { return y; });
@@ -179,6 +154,7 @@ function renderYearControls() {
     }
     btn.click(function() {
       active_year = y;
+      year_picked = true;
       drawYearlyOverview();
     });
     controls.append(btn);
@@ -229,7 +205,8 @@ function renderYearSummaryCards() {
 
     card.append(
       $('<p class="year-meta"></p>').text(
-        info.total_keys + " keys in " + info.day_count + " days (" + avg_keys + "/day)"
+        info.total_keys + " keys in " + info.day_count + " days (" + avg_keys + "/day), " +
+        (info.total_hacking_seconds / 3600.0).toFixed(2) + " hr hacking"
       )
     );
 
@@ -384,13 +361,10 @@ function drawEventsForYear(year) {
   }
 }
 
-function mergeWindowKeyEventsForIndices(indices) {
+function keyStatsForIndices(indices) {
   var key_stats_out = [];
   for(var i=0;i<indices.length;i++) {
-    var k = indices[i];
-    var es = events[k]["window_events"] || [];
-    var ek = events[k]["keyfreq_events"] || [];
-    key_stats_out.push(computeKeyStats(es, ek));
+    key_stats_out.push(day_rollups[indices[i]].key_stats || {});
   }
   return key_stats_out;
 }
@@ -403,7 +377,7 @@ function visualizeKeySummaryForYear(indices, local_categories) {
     return;
   }
 
-  key_stats_all = mergeWindowKeyEventsForIndices(indices);
+  key_stats_all = keyStatsForIndices(indices);
 
   var gstats = {};
   _.each(local_categories, function(m) {
@@ -507,26 +481,14 @@ function visualizeMiscInspectorForYear(indices) {
   var aggregate = {};
   for(var i=0;i<indices.length;i++) {
     var day_ix = indices[i];
-    var day_events = events[day_ix]["window_events"] || [];
-    for(var j=0;j<day_events.length;j++) {
-      var e = day_events[j];
-      if(e.m !== "MISC") {
-        continue;
-      }
-      var raw_title = (e.s || "").trim();
-      if(!raw_title) {
-        continue;
-      }
-      var dt = 1;
-      if(j + 1 < day_events.length) {
-        dt = Math.max(0, day_events[j + 1].t - e.t);
-      }
-
+    var misc = day_rollups[day_ix].misc_titles || {};
+    for(var raw_title in misc) {
+      if(!misc.hasOwnProperty(raw_title)) continue;
       if(!aggregate.hasOwnProperty(raw_title)) {
         aggregate[raw_title] = {title: raw_title, seconds: 0, hits: 0};
       }
-      aggregate[raw_title].seconds += dt;
-      aggregate[raw_title].hits += 1;
+      aggregate[raw_title].seconds += misc[raw_title][0];
+      aggregate[raw_title].hits += misc[raw_title][1];
     }
   }
 
@@ -568,7 +530,6 @@ function drawKeyEventsForYear(year) {
   if(!W || W < 300) { W = 1200; }
   var H = 15;
   var wmargin = 100;
-  var time_bin = 10 * 60;
 
   var allkevents = [];
   var d0s = [];
@@ -581,33 +542,23 @@ function drawKeyEventsForYear(year) {
 
   for(var i=0;i<info.indices.length;i++) {
     var day_ix = info.indices[i];
-    var es = events[day_ix]["keyfreq_events"] || [];
+    // 10-minute key bins for the day, precomputed at export time
+    var bins = day_rollups[day_ix].key_bins || [];
+    var d0 = new Date(event_list[day_ix].t0 * 1000);
 
-    var t00 = event_list[day_ix].t0;
-    var d0 = new Date(t00 * 1000);
-    var ft = t00 + 60*60*24;
     var kevents = [];
-    var t = t00;
-    while(t <= ft) {
-      kevents.push(0);
-      t += time_bin;
-      if(i === 0) {
+    var ktot = 0;
+    for(var b=0;b<bins.length;b++) {
+      var kv = bins[b] || 0;
+      kevents.push(kv);
+      if(kevents_global.length <= b) {
         kevents_global.push(0);
       }
-    }
-
-    var ktot = 0;
-    for(var q=0,n=es.length;q<n;q++) {
-      var kw = es[q];
-      var binix = Math.floor((kw.t - t00)/time_bin);
-      if(binix < 0 || binix >= kevents.length) continue;
-
-      kevents[binix] += kw.s;
-      kevents_global[binix] += kw.s;
-      if(kevents[binix] > maxs) maxs = kevents[binix];
-      if(kevents_global[binix] > max_kevents_global) max_kevents_global = kevents_global[binix];
-      sum_kevents_global += kw.s;
-      ktot += kw.s;
+      kevents_global[b] += kv;
+      if(kv > maxs) maxs = kv;
+      if(kevents_global[b] > max_kevents_global) max_kevents_global = kevents_global[b];
+      sum_kevents_global += kv;
+      ktot += kv;
     }
 
     allkevents.push(kevents);
@@ -729,39 +680,80 @@ function drawYearlyOverview() {
   }
 }
 
-function loadAllEvents() {
-  var loaded_ok = false;
-
-  getJSON_CACHEHACK("export_list.json").then(function(days_list) {
-    event_list = days_list || [];
-    return Promise.all(event_list.map(function(x) { return getJSON_CACHEHACK(x.fname); }));
-  }).then(function(days) {
-    events = days || [];
-    loaded_ok = true;
-  }).catch(function(err) {
-    console.log("some error happened: " + err);
-    var msg = "Global Overview could not load data. ";
-    if(window.location.protocol === "file:") {
-      msg += "Open it from the local server instead: ";
-      msg += '<a href="' + overviewPrimaryUrl + '">:8080</a> or ';
-      msg += '<a href="' + overviewFallbackUrl + '">:8090</a>.';
-    } else {
-      msg += "Try refreshing, then open via ";
-      msg += '<a href="' + overviewPrimaryUrl + '">:8080</a> or ';
-      msg += '<a href="' + overviewFallbackUrl + '">:8090</a>.';
-    }
-    showOverviewMessage(msg);
-  }).then(function() {
-    if(!loaded_ok) return;
+function showLoadError(err) {
+  console.log("some error happened: " + err);
+  var msg = "Global Overview could not load data. ";
+  if(window.location.protocol === "file:") {
+    msg += "Open it from the local server instead: ";
+    msg += '<a href="' + overviewPrimaryUrl + '">:8080</a> or ';
+    msg += '<a href="' + overviewFallbackUrl + '">:8090</a>.';
+  } else {
+    msg += "Try refreshing, then open via ";
+    msg += '<a href="' + overviewPrimaryUrl + '">:8080</a> or ';
+    msg += '<a href="' + overviewFallbackUrl + '">:8090</a>.';
+  }
+  showOverviewMessage(msg);
+}
 
-    if(!event_list || event_list.length === 0) {
+function drawLoadedDays(loading) {
+  if(!event_list || event_list.length === 0) {
+    if(!loading) {
       showOverviewMessage("No exported days yet. Click <b>Refresh Data</b> after tracking for a bit.");
-      return;
     }
+    return;
+  }
+
+  // While days are still arriving, keep re-picking the busiest year unless
+  // the user already chose one.
+  if(loading && !year_picked) active_year = null;
+  analyzeEvents();
+  buildYearStats();
+  drawYearlyOverview();
+}
+
+// overview.json holds one small rollup per day, written by the export step
+function loadOverviewJSON() {
+  getJSON("overview.json").then(function(overview) {
+    day_rollups = (overview && overview.days) || [];
+    event_list = _.map(day_rollups, function(d) {
+      return {t0: d.t0, t1: d.t1, fname: d.fname};
+    });
+    drawLoadedDays(false);
+  }).catch(showLoadError);
+}
 
-    analyzeEvents();
-    buildYearStats();
-    drawYearlyOverview();
+function loadAllEvents() {
+  day_rollups = [];
+  event_list = [];
+  var redraw_timer = null;
+
+  // /api/days streams the same rollups straight from SQLite, one line per
+  // day, so years can be drawn while the rest are still arriving.
+  getNDJSON("/api/days?fields=rollup", function(day) {
+    if(!day.rollup) return; // not exported yet, overview.json skips it too
+    var rollup = day.rollup;
+    rollup.t1 = rollup.t0 + 86400;
+    rollup.fname = "events_" + rollup.t0 + ".json";
+    day_rollups.push(rollup);
+    event_list.push({t0: rollup.t0, t1: rollup.t1, fname: rollup.fname});
+    if(redraw_timer === null) {
+      redraw_timer = setTimeout(function() {
+        redraw_timer = null;
+        drawLoadedDays(true);
+      }, 250);
+    }
+  }).then(function() {
+    if(redraw_timer !== null) {
+      clearTimeout(redraw_timer);
+      redraw_timer = null;
+    }
+    drawLoadedDays(false);
+  }, function(err) {
+    if(redraw_timer !== null) {
+      clearTimeout(redraw_timer);
+      redraw_timer = null;
+    }
+    loadOverviewJSON(); // older server without /api/days
   });
 }
 
@@ -789,12 +781,13 @@ function start() {
 
   $("#reloadbutton").click(function() {
     startSpinner();
-    $.post("/refresh", {"time": 0}, function(data, status) {
-      console.log("Data: " + data + "\nStatus: " + status);
-      stopSpinner();
-      if(data === "OK") {
-        loadAllEvents();
-      }
+    $.post("/refresh", {"time": 0}, function(job, status) {
+      waitForRefresh(job, function(done) {
+        stopSpinner();
+        if(done && done.state === "done") {
+          loadAllEvents();
+        }
+      });
     });
   });
 }
@@ -61,6 +61,50 @@ function getJSON(url) {
   });
 }
 
+// streams a newline-delimited JSON response (e.g. /api/days), calling
+// onLine with each parsed line as it arrives instead of waiting for the
+// whole body. Resolves with the number of lines once the response is done.
+function getNDJSON(url, onLine) {
+  return new Promise(function(resolve, reject) {
+    var req = new XMLHttpRequest();
+    var seen = 0; // characters of responseText already handed out
+    var count = 0;
+    var failed = false;
+    function consume(final) {
+      var text = req.responseText;
+      var end = final ? text.length : text.lastIndexOf("\n") + 1;
+      if(end <= seen) return;
+      var lines = text.substring(seen, end).split("\n");
+      seen = end;
+      for(var i=0;i<lines.length;i++) {
+        if(lines[i].length === 0) continue;
+        onLine(JSON.parse(lines[i]));
+        count++;
+      }
+    }
+    function fail(err) {
+      if(failed) return;
+      failed = true;
+      req.abort();
+      console.log("getNDJSON failed for", url, err);
+      reject(err);
+    }
+    req.open('GET', url);
+    req.onprogress = function() {
+      if(req.status != 200 || failed) return;
+      try { consume(false); } catch(err) { fail(err); }
+    };
+    req.onload = function() {
+      if(failed) return;
+      if(req.status != 200) { fail(Error(req.statusText)); return; }
+      try { consume(true); } catch(err) { fail(err); return; }
+      resolve(count);
+    };
+    req.onerror = function() { fail(Error("Network Error")); };
+    req.send();
+  });
+}
+
 function getJSON_CACHEHACK(url) {
   // Sometimes caching can refuse to retrieve a JSON object if
   // it has been updated. Appending a random number is a hacky
@@ -73,6 +117,42 @@ function getJSON_CACHEHACK(url) {
   });
 }
 
+// expands a columnar (format 2) day export back into the usual
+// {window_events: [{t, s}], ...} shape. Plain payloads pass through.
+function decodeDayPayload(data) {
+  if(!data || data.format !== 2) { return data; }
+  var strings = data.strings;
+  function expand(col, lookup) {
+    var out = new Array(col.dt.length);
+    var t = data.t0;
+    for(var i=0,N=col.dt.length;i<N;i++) {
+      t += col.dt[i];
+      out[i] = {t: t, s: lookup ? strings[col.s[i]] : col.s[i]};
+    }
+    return out;
+  }
+  return {
+    window_events: expand(data.window_events, true),
+    keyfreq_events: expand(data.keyfreq_events, false),
+    notes_events: expand(data.notes_events, true),
+    blog: data.blog
+  };
+}
+
+// /refresh, /addnote and /blog answer with a background export job.
+// Polls GET /api/refresh/<id> until it finishes, then calls done(job).
+function waitForRefresh(job, done) {
+  if(!job || job.state === 'done' || job.state === 'failed') { done(job); return; }
+  setTimeout(function() {
+    getJSON('/api/refresh/' + job.id).then(function(next) {
+      if(next.days_total) {
+        console.log("refresh job " + next.id + ": " + next.days_done + "/" + next.days_total + " days");
+      }
+      waitForRefresh(next, done);
+    }, function() { done(null); });
+  }, 500);
+}
+
 // takes window and key events (ew and ek) and assigns key events
 // to windows. Returns the total number of keys pressed
 // in every window. Uses a merge-sort-like strategy
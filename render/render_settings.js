@@ -1,28 +1,65 @@
 // various settings for rendering, user-modifiable
-// order matters: later rules override earlier rules
-var title_mappings = [
-{pattern : /Google Chrome|Firefox|Brave|Microsoft Edge/i, mapto : 'Browser'},
-{pattern : /Visual Studio Code| - Code/i, mapto : 'VSCode'},
-{pattern : /Cursor/i, mapto : 'VSCode'},
-{pattern : /PyCharm|IntelliJ|CLion|Rider/i, mapto : 'VSCode'},
-{pattern : /Fusion 360|Autodesk Fusion|Fusion360/i, mapto : 'CAD / Design'},
-{pattern : /Windows PowerShell|Command Prompt|Windows Terminal|pwsh|cmd\.exe/i, mapto : 'Terminal'},
-{pattern : /Jupyter|Notebook|Colab|OneNote/i, mapto : 'OneNote'},
-{pattern : /GitHub|Stack Overflow|Read the Docs|Documentation/i, mapto : 'Research'},
-{pattern : /Google Docs|Google Sheets|Notion|OneNote|PowerPoint|Excel|Word/i, mapto : 'Planning'},
-{pattern : /File Explorer|explorer\.exe/i, mapto : 'File Explorer'},
-{pattern : /Snipping Tool|Settings|Control Panel/i, mapto : 'Utility'},
-{pattern : /JDownloader/i, mapto : 'Downloads'},
-{pattern : /OBS/i, mapto : 'OBS'},
-{pattern : /YouTube|Spotify|Music/i, mapto : 'Media'},
-{pattern : /Dispatch|Naruto|Steam|Epic Games|Riot Client|Valorant|Dota|League of Legends|CS2|Counter-Strike|Genshin|Roblox|Minecraft/i, mapto : 'Games'},
-{pattern : /Facebook|Instagram|Twitter|X \(|Discord|Telegram|WhatsApp/i, mapto : 'Social'},
-{pattern : /ChatGPT|Claude|Gemini|Perplexity/i, mapto : 'Research'},
-{pattern : /\.(py|js|ts|tsx|jsx|html|css|cpp|h|md)/i, mapto : 'VSCode'},
-{pattern : /Task Switching/i, mapto : 'Task Switching'},
-{pattern : /__IDLE__/, mapto : 'Idle'},
-{pattern : /__LOCKEDSCREEN/, mapto : 'Locked Screen'},
-];
+//
+// Title -> category rules live in category_rules.json, which the Python
+// export (categories.py) reads as well, so overview rollups and these pages
+// classify titles identically. Edit that file to change categories;
+// order matters: later rules override earlier rules.
+
+var category_rules_url = "category_rules.json";
+var title_mappings = [];
+// list of titles that classify as "hacking"
+var hacking_titles = [];
+// Productive categories that may not involve heavy typing.
+// These are counted by focused active-window time in computeHackingStats().
+var passive_hacking_titles = [];
+
+function applyCategoryRules(rules) {
+  // fill the arrays in place so the aliases below see the loaded rules
+  var mappings = rules.title_mappings || [];
+  for(var ri=0;ri<mappings.length;ri++) {
+    var rule = mappings[ri];
+    title_mappings.push({pattern : new RegExp(rule.pattern, rule.flags || ''), mapto : rule.mapto});
+  }
+  Array.prototype.push.apply(hacking_titles, rules.hacking_titles || []);
+  Array.prototype.push.apply(passive_hacking_titles, rules.passive_hacking_titles || []);
+}
+
+function showCategoryRulesError(err) {
+  console.log("could not load " + category_rules_url + ": " + err);
+  var msg = "Could not load " + category_rules_url + ", so every window shows as MISC. ";
+  msg += window.location.protocol === "file:"
+    ? "Open this page from the Prolific local server instead of the file."
+    : "Check that the file is valid JSON and refresh.";
+  $(function() { $('<div class="rules-error"></div>').text(msg).prependTo("body"); });
+}
+
+// Loads category_rules.json once. Returns a promise that resolves when the
+// rules are in place (empty, with a visible error, if they failed to load);
+// wait on it before calling mapwin().
+var category_rules_ready = null;
+function loadCategoryRules() {
+  if(category_rules_ready === null) {
+    category_rules_ready = new Promise(function(resolve) {
+      var req = new XMLHttpRequest();
+      req.open('GET', category_rules_url);
+      req.onload = function() {
+        try {
+          if(req.status !== 200) { throw Error(req.status + " " + req.statusText); }
+          applyCategoryRules(JSON.parse(req.responseText));
+        } catch (err) {
+          showCategoryRulesError(err);
+        }
+        resolve();
+      };
+      req.onerror = function() {
+        showCategoryRulesError("network error");
+        resolve();
+      };
+      req.send();
+    });
+  }
+  return category_rules_ready;
+}
 
 function mapwin(w) {
   var n = title_mappings.length;
@@ -43,11 +80,6 @@ display_groups.push(["Planning", "Browser", "File Explorer", "Utility", "Downloa
 display_groups.push(["OBS", "Media", "Social", "Games"]);
 display_groups.push(["Task Switching", "Idle", "Locked Screen", "MISC"]);
 
-// list of titles that classify as "hacking"
-var hacking_titles = ["VSCode", "Terminal", "OneNote", "Research"];
-// Productive categories that may not involve heavy typing.
-// These are counted by focused active-window time in computeHackingStats().
-var passive_hacking_titles = ["CAD / Design"];
 var draw_hacking = true;
 var draw_notes = true;
 var draw_coffee = false;
@@ -1,28 +1,69 @@
+import argparse
+import email.utils
+import gzip
+import io
 import json
 import os
-import sys
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import timezone
 from functools import partial
 from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
-from urllib.parse import parse_qs
+from urllib.parse import parse_qs, urlsplit
 
-from export_events import updateEvents
+import metrics
+from export_events import (
+    DAY_STREAM_DEFAULT_FIELDS,
+    DAY_STREAM_FIELDS,
+    all_day_stats,
+    all_day_stats_etag,
+    build_day_payload,
+    day_payload_etag,
+    day_stats,
+    day_stats_etag,
+    encode_day_payload_v2,
+    iter_days_ndjson,
+    updateEvents,
+)
 from note import log_note
+from refresh_jobs import RefreshJobs
 from storage import init_db, upsert_blog_for_timestamp
 
 IP = "127.0.0.1"
 PORT = 8080
-if len(sys.argv) > 1:
-    PORT = int(sys.argv[1])
 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 RENDER_DIR = os.path.join(ROOT_DIR, "render")
 LOG_DIR = os.path.join(ROOT_DIR, "logs")
 
-# Ensure relative paths in updateEvents/log_note resolve to this project root.
-os.chdir(ROOT_DIR)
-os.makedirs(LOG_DIR, exist_ok=True)
-os.makedirs(RENDER_DIR, exist_ok=True)
-init_db()
+API_DAY_RE = re.compile(r"^/api/day/(\d+)$")
+API_DAY_STATS_RE = re.compile(r"^/api/day/(\d+)/stats$")
+API_DAYS_STATS_PATH = "/api/days/stats"
+API_DAYS_PATH = "/api/days"
+API_REFRESH_RE = re.compile(r"^/api/refresh/(\d+)$")
+
+# Request paths reported under their own label in /metrics; everything else
+# is a static file ("static") or an unknown endpoint ("other").
+METRICS_PATHS = ("/metrics", "/refresh", "/addnote", "/blog")
+
+# /refresh, /addnote and /blog hand the export to this background runner and
+# answer right away with the job; clients poll GET /api/refresh/<id>.
+REFRESH_JOBS = RefreshJobs(updateEvents)
+
+# Text assets worth gzipping. Exports write a precompressed <file>.gz next to
+# each JSON; anything without one is compressed on first request and cached.
+GZIP_SUFFIXES = (".json", ".js", ".css", ".html", ".svg", ".txt")
+GZIP_MIN_BYTES = 1024
+GZIP_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+# Streamed responses (GET /api/days) go out in chunks of about this size.
+STREAM_CHUNK_BYTES = 64 * 1024
+
+_gzip_cache = OrderedDict()
+_gzip_cache_bytes = 0
+_gzip_cache_lock = threading.Lock()
 
 
 def coerce_int(value, fallback=None):
@@ -32,70 +73,473 @@ def coerce_int(value, fallback=None):
         return fallback
 
 
+def accepts_gzip(accept_encoding):
+    for token in (accept_encoding or "").split(","):
+        coding, _, params = token.strip().partition(";")
+        if coding.strip().lower() not in ("gzip", "*"):
+            continue
+        q = params.strip().lower()
+        if q.startswith("q="):
+            try:
+                return float(q[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+
+def gzip_cached(path, stat):
+    """gzip bytes for path, cached per (path, mtime, size) with LRU eviction."""
+    global _gzip_cache_bytes
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _gzip_cache_lock:
+        body = _gzip_cache.get(key)
+        if body is not None:
+            _gzip_cache.move_to_end(key)
+            return body
+
+    with open(path, "rb") as f:
+        body = gzip.compress(f.read(), compresslevel=6, mtime=0)
+    if len(body) > GZIP_CACHE_MAX_BYTES // 4:
+        return body
+
+    with _gzip_cache_lock:
+        if key not in _gzip_cache:
+            _gzip_cache[key] = body
+            _gzip_cache_bytes += len(body)
+        while _gzip_cache_bytes > GZIP_CACHE_MAX_BYTES:
+            _, evicted = _gzip_cache.popitem(last=False)
+            _gzip_cache_bytes -= len(evicted)
+    return body
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match or not etag:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def request_label(raw_path):
+    """Low-cardinality path label for request metrics."""
+    path = urlsplit(raw_path).path
+    if API_DAY_RE.match(path):
+        return "/api/day/:t0"
+    if API_DAY_STATS_RE.match(path):
+        return "/api/day/:t0/stats"
+    if path in (API_DAYS_STATS_PATH, API_DAYS_PATH):
+        return path
+    if API_REFRESH_RE.match(path):
+        return "/api/refresh/:id"
+    if path in METRICS_PATHS:
+        return path
+    if path.startswith("/api/"):
+        return "other"
+    return "static"
+
+
+def not_modified_since(if_modified_since, mtime):
+    try:
+        ims = email.utils.parsedate_to_datetime(if_modified_since)
+    except (TypeError, IndexError, OverflowError, ValueError):
+        return False
+    if ims.tzinfo is None:
+        ims = ims.replace(tzinfo=timezone.utc)
+    return int(mtime) <= ims.timestamp()
+
+
+def open_gzip_body(path, stat):
+    """
+    (file object, length) with the gzip encoding of path: the exporter's
+    <path>.gz when it is at least as new, otherwise gzip_cached().
+    """
+    try:
+        gz_stat = os.stat(path + ".gz")
+        if gz_stat.st_mtime_ns >= stat.st_mtime_ns:
+            return open(path + ".gz", "rb"), gz_stat.st_size
+    except OSError:
+        pass
+    data = gzip_cached(path, stat)
+    return io.BytesIO(data), len(data)
+
+
+def static_cache_headers(path):
+    # Exported JSON changes in place; make browsers revalidate it instead
+    # of relying on ?sigh=<random> cache-busting.
+    headers = []
+    if path.endswith(".json"):
+        headers.append(("Cache-Control", "no-cache"))
+    if path.endswith(GZIP_SUFFIXES):
+        headers.append(("Vary", "Accept-Encoding"))
+    return headers
+
+
+def is_routed_path(path):
+    """Paths answered by handle_get(); everything else is a static file."""
+    return path == "/metrics" or path.startswith("/api/")
+
+
+# Routes return (status, [(header, value)], body) so both CustomHandler and
+# async_server.py can send them. The body is bytes, or for streamed responses
+# an iterator of bytes sent with chunked transfer encoding.
+
+
+def text_response(status, text):
+    body = text.encode("utf-8")
+    headers = [("Content-Type", "text/plain; charset=utf-8"), ("Content-Length", str(len(body)))]
+    return status, headers, body
+
+
+def json_response(status, payload, etag=None):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    headers = [
+        ("Content-Type", "application/json; charset=utf-8"),
+        ("Content-Length", str(len(body))),
+        ("Cache-Control", "no-cache"),
+    ]
+    if etag:
+        headers.append(("ETag", etag))
+    return status, headers, body
+
+
+def not_modified_response(etag):
+    return 304, [("ETag", etag), ("Cache-Control", "no-cache")], b""
+
+
+def metrics_response():
+    body = metrics.render_prometheus().encode("utf-8")
+    headers = [
+        ("Content-Type", "text/plain; version=0.0.4; charset=utf-8"),
+        ("Content-Length", str(len(body))),
+        ("Cache-Control", "no-cache"),
+    ]
+    return 200, headers, body
+
+
+def parse_post_payload(content_type, raw):
+    content_type = (content_type or "").split(";", 1)[0].strip().lower()
+
+    if content_type == "application/json":
+        try:
+            data = json.loads(raw.decode("utf-8"))
+            if isinstance(data, dict):
+                return data
+        except json.JSONDecodeError:
+            return {}
+
+    if content_type == "application/x-www-form-urlencoded":
+        parsed = parse_qs(raw.decode("utf-8"), keep_blank_values=True)
+        return {k: v[0] if isinstance(v, list) and v else "" for k, v in parsed.items()}
+
+    return {}
+
+
+def day_response(t0, v2=False, if_none_match=None):
+    etag = day_payload_etag(t0)
+    if etag is None:
+        return text_response(404, "No data for day")
+    if v2:
+        etag = etag[:-1] + '-v2"'
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag)
+    payload = build_day_payload(t0)
+    if v2:
+        payload = encode_day_payload_v2(payload, t0)
+    return json_response(200, payload, etag=etag)
+
+
+def day_stats_response(t0, if_none_match=None):
+    etag = day_stats_etag(t0)
+    if etag is None:
+        return text_response(404, "No data for day")
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag)
+    return json_response(200, day_stats(t0), etag=etag)
+
+
+def all_day_stats_response(if_none_match=None):
+    etag = all_day_stats_etag()
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag)
+    return json_response(200, {"days": all_day_stats()}, etag=etag)
+
+
+def next_stream_chunk(pieces):
+    """Joins pieces from a streamed body up to about STREAM_CHUNK_BYTES; b"" at the end."""
+    parts = []
+    size = 0
+    for piece in pieces:
+        parts.append(piece)
+        size += len(piece)
+        if size >= STREAM_CHUNK_BYTES:
+            break
+    return b"".join(parts)
+
+
+def days_stream_response(query):
+    """GET /api/days?from=<t0>&to=<t0>&fields=window,keyfreq: one NDJSON line per day."""
+    bounds = []
+    for name in ("from", "to"):
+        raw = query.get(name, [None])[0]
+        if raw is not None and coerce_int(raw) is None:
+            return text_response(400, f"{name} must be a day timestamp")
+        bounds.append(coerce_int(raw))
+    t0_from, t0_to = bounds
+    if t0_from is not None and t0_to is not None and t0_to < t0_from:
+        return text_response(400, "to is before from")
+
+    fields = DAY_STREAM_DEFAULT_FIELDS
+    if "fields" in query:
+        fields = [f.strip() for f in ",".join(query["fields"]).split(",") if f.strip()]
+        unknown = [f for f in fields if f not in DAY_STREAM_FIELDS]
+        if unknown or not fields:
+            return text_response(400, f"fields must be a list of: {', '.join(DAY_STREAM_FIELDS)}")
+
+    headers = [
+        ("Content-Type", "application/x-ndjson; charset=utf-8"),
+        ("Cache-Control", "no-cache"),
+    ]
+    return 200, headers, iter_days_ndjson(t0_from, t0_to, fields)
+
+
+def handle_get(raw_path, if_none_match=None):
+    """Response for GET /metrics and /api/* (see is_routed_path)."""
+    parts = urlsplit(raw_path)
+    path = parts.path
+    if path == "/metrics":
+        return metrics_response()
+
+    try:
+        match = API_DAY_RE.match(path)
+        if match:
+            query = parse_qs(parts.query)
+            v2 = query.get("format", [""])[0] == "v2"
+            return day_response(int(match.group(1)), v2, if_none_match)
+
+        match = API_DAY_STATS_RE.match(path)
+        if match:
+            return day_stats_response(int(match.group(1)), if_none_match)
+
+        if path == API_DAYS_STATS_PATH:
+            return all_day_stats_response(if_none_match)
+
+        if path == API_DAYS_PATH:
+            return days_stream_response(parse_qs(parts.query))
+
+        match = API_REFRESH_RE.match(path)
+        if match:
+            job = REFRESH_JOBS.get(int(match.group(1)))
+            if job is None:
+                return text_response(404, "Unknown refresh job")
+            return json_response(200, job)
+
+        return text_response(404, "Unknown endpoint")
+
+    except Exception as exc:
+        print(f"server error: {exc}")
+        return text_response(500, f"ERROR: {exc}")
+
+
+def handle_post(path, content_type, raw):
+    try:
+        data = parse_post_payload(content_type, raw)
+
+        if path == "/refresh":
+            return json_response(202, REFRESH_JOBS.submit())
+
+        if path == "/addnote":
+            note = str(data.get("note", ""))
+            note_time = coerce_int(data.get("time"), None)
+            log_note(note, note_time)
+            return json_response(202, REFRESH_JOBS.submit())
+
+        if path == "/blog":
+            post = str(data.get("post", ""))
+            post_time = coerce_int(data.get("time"), None)
+            if post_time is None:
+                return text_response(400, "Missing or invalid blog time")
+
+            upsert_blog_for_timestamp(post_time, post)
+            return json_response(202, REFRESH_JOBS.submit())
+
+        return text_response(404, "Unknown endpoint")
+
+    except Exception as exc:
+        print(f"server error: {exc}")
+        return text_response(500, f"ERROR: {exc}")
+
+
 class CustomHandler(SimpleHTTPRequestHandler):
-    def parse_post_payload(self):
-        content_length = int(self.headers.get("Content-Length", 0))
-        raw = self.rfile.read(content_length) if content_length > 0 else b""
-        content_type = (self.headers.get("Content-Type") or "").split(";", 1)[0].strip().lower()
+    def handle_one_request(self):
+        self.response_status = None
+        started = time.perf_counter()
+        super().handle_one_request()
+        if self.response_status is None:
+            return  # connection closed or request line rejected before routing
+        elapsed = time.perf_counter() - started
+        labels = {"method": self.command, "path": request_label(self.path)}
+        metrics.observe("prolific_http_request_seconds", elapsed, **labels)
+        metrics.inc("prolific_http_requests_total", status=self.response_status, **labels)
 
-        if content_type == "application/json":
-            try:
-                data = json.loads(raw.decode("utf-8"))
-                if isinstance(data, dict):
-                    return data
-            except json.JSONDecodeError:
-                return {}
+    def send_response(self, code, message=None):
+        self.response_status = code
+        super().send_response(code, message)
+
+    def end_headers(self):
+        path = urlsplit(self.path).path
+        if self.command in ("GET", "HEAD") and not path.startswith("/api/"):
+            for name, value in static_cache_headers(path):
+                self.send_header(name, value)
+        super().end_headers()
+
+    def not_modified_since(self, mtime):
+        if "If-Modified-Since" not in self.headers or "If-None-Match" in self.headers:
+            return False
+        return not_modified_since(self.headers["If-Modified-Since"], mtime)
+
+    def send_head(self):
+        # Same contract as SimpleHTTPRequestHandler.send_head, but answers
+        # with a gzip body when the client accepts one. Content-Length is the
+        # compressed size; Last-Modified stays that of the original file.
+        path = self.translate_path(self.path)
+        if (
+            not path.endswith(GZIP_SUFFIXES)
+            or not accepts_gzip(self.headers.get("Accept-Encoding"))
+            or not os.path.isfile(path)
+        ):
+            return super().send_head()
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return super().send_head()
+        if stat.st_size < GZIP_MIN_BYTES:
+            return super().send_head()
 
-        if content_type == "application/x-www-form-urlencoded":
-            parsed = parse_qs(raw.decode("utf-8"), keep_blank_values=True)
-            return {k: v[0] if isinstance(v, list) and v else "" for k, v in parsed.items()}
+        if self.not_modified_since(stat.st_mtime):
+            self.send_response(304)
+            self.end_headers()
+            return None
 
-        return {}
+        body, length = open_gzip_body(path, stat)
+        self.send_response(200)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(length))
+        self.send_header("Last-Modified", self.date_time_string(stat.st_mtime))
+        self.end_headers()
+        return body
+
+    def send_routed(self, response):
+        status, headers, body = response
+        if isinstance(body, bytes):
+            self.send_response(status)
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+            return
 
-    def write_text(self, status, body):
+        # Streamed body. This handler answers as HTTP/1.0, which has no
+        # chunked encoding, so switch this response to HTTP/1.1 when the
+        # client speaks it; HTTP/1.0 clients read until the connection closes.
+        chunked = self.request_version == "HTTP/1.1"
+        if chunked:
+            self.protocol_version = "HTTP/1.1"
+            headers = headers + [("Transfer-Encoding", "chunked")]
         self.send_response(status)
-        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        for name, value in headers + [("Connection", "close")]:
+            self.send_header(name, value)
         self.end_headers()
-        self.wfile.write(body.encode("utf-8"))
+        try:
+            while True:
+                chunk = next_stream_chunk(body)
+                if not chunk:
+                    break
+                if chunked:
+                    chunk = b"%X\r\n%s\r\n" % (len(chunk), chunk)
+                self.wfile.write(chunk)
+            if chunked:
+                self.wfile.write(b"0\r\n\r\n")
+        except (ConnectionError, OSError):
+            pass  # client went away
+        except Exception as exc:
+            # Headers are out; leave the body unterminated so the client sees
+            # a truncated response rather than a clean end.
+            print(f"server error: {exc}")
+        finally:
+            body.close()
+
+    def do_GET(self):
+        if not is_routed_path(urlsplit(self.path).path):
+            super().do_GET()
+            return
+        self.send_routed(handle_get(self.path, self.headers.get("If-None-Match")))
 
     def do_POST(self):
-        try:
-            data = self.parse_post_payload()
+        content_length = coerce_int(self.headers.get("Content-Length"), 0)
+        raw = self.rfile.read(content_length) if content_length > 0 else b""
+        self.send_routed(handle_post(self.path, self.headers.get("Content-Type"), raw))
 
-            if self.path == "/refresh":
-                updateEvents()
-                self.write_text(200, "OK")
-                return
 
-            if self.path == "/addnote":
-                note = str(data.get("note", ""))
-                note_time = coerce_int(data.get("time"), None)
-                log_note(note, note_time)
-                updateEvents()
-                self.write_text(200, "OK")
-                return
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the Prolific dashboards and API.")
+    parser.add_argument("port", nargs="?", type=int, default=PORT)
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        default=os.environ.get("PROLIFIC_ASYNC_SERVER", "").strip().lower() in ("1", "true", "yes"),
+        help="Use the asyncio server (HTTP/1.1 keep-alive, bounded concurrency). "
+        "Also enabled by PROLIFIC_ASYNC_SERVER=1.",
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=None,
+        help="With --async: requests handled at once before new ones queue (default 32).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="With --async: threads for SQLite and file work (default 4).",
+    )
+    return parser.parse_args(argv)
 
-            if self.path == "/blog":
-                post = str(data.get("post", ""))
-                post_time = coerce_int(data.get("time"), None)
-                if post_time is None:
-                    self.write_text(400, "Missing or invalid blog time")
-                    return
 
-                upsert_blog_for_timestamp(post_time, post)
+def main():
+    args = parse_args()
 
-                updateEvents()
-                self.write_text(200, "OK")
-                return
+    # Ensure relative paths in updateEvents/log_note resolve to this project root.
+    os.chdir(ROOT_DIR)
+    os.makedirs(LOG_DIR, exist_ok=True)
+    os.makedirs(RENDER_DIR, exist_ok=True)
+    init_db()
 
-            self.write_text(404, "Unknown endpoint")
+    if args.use_async:
+        import async_server
 
-        except Exception as exc:
-            print(f"server error: {exc}")
-            self.write_text(500, f"ERROR: {exc}")
+        async_server.run(
+            IP,
+            args.port,
+            RENDER_DIR,
+            max_in_flight=args.max_in_flight or async_server.DEFAULT_MAX_IN_FLIGHT,
+            workers=args.workers or async_server.DEFAULT_WORKERS,
+        )
+        return
+
+    Handler = partial(CustomHandler, directory=RENDER_DIR)
+    httpd = ThreadingHTTPServer((IP, args.port), Handler)
+    print(f"Serving Prolific at http://localhost:{args.port}")
+    httpd.serve_forever()
 
 
-Handler = partial(CustomHandler, directory=RENDER_DIR)
-httpd = ThreadingHTTPServer((IP, PORT), Handler)
-print(f"Serving Prolific at http://localhost:{PORT}")
-httpd.serve_forever()
+if __name__ == "__main__":
+    main()
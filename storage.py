@@ -1,11 +1,20 @@
-import glob
+import atexit
+import functools
+import json
 import os
+import queue
 import re
 import sqlite3
 import threading
 import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 
-from rewind7am import rewindTime
+import keyfreq_blocks
+import metrics
+from day_boundaries import rewind as rewindTime
+from day_boundaries import rewind_many
 
 LOG_NAME_RE = re.compile(r"^(window|keyfreq|notes|blog)_(\d+)\.txt$")
 LOG_PATTERNS = (
@@ -17,6 +26,46 @@ LOG_PATTERNS = (
 
 _WRITE_LOCK = threading.Lock()
 
+# Legacy backfill: rows per write transaction, and when/how wide to parse in
+# parallel (PROLIFIC_BACKFILL_WORKERS overrides the worker count).
+BACKFILL_CHUNK_ROWS = 50000
+BACKFILL_PARALLEL_MIN_FILES = 8
+BACKFILL_MAX_WORKERS = 8
+LEGACY_FINGERPRINT_KEY = "legacy_logs_fingerprint"
+
+# Retention: days older than this are compacted by compact_old_days().
+RETENTION_DAYS = 180
+RETENTION_KEYFREQ_BUCKET_SECONDS = 300
+
+# EventWriter logs failed flushes at most this often while retrying.
+FLUSH_ERROR_LOG_SECONDS = 60.0
+
+# Gaps between window samples longer than this are read as idle by
+# export_events (<= 0 turns that off). Window activity is stored as spans: a
+# sample extends the day's latest span when it has the same title and lands
+# within the gap of its end, otherwise it opens a new span, so a span never
+# hides an idle stretch. fetch_window_events() expands spans back into
+# {t, s} points WINDOW_SPAN_POINT_SECONDS apart (the collector's old
+# heartbeat interval), or closer when the gap is shorter than that.
+DEFAULT_WINDOW_ACTIVE_GAP_SECONDS = 1200
+try:
+    MAX_WINDOW_ACTIVE_GAP_SECONDS = int(
+        os.environ.get("PROLIFIC_MAX_WINDOW_ACTIVE_GAP_SECONDS", DEFAULT_WINDOW_ACTIVE_GAP_SECONDS)
+    )
+except ValueError:
+    MAX_WINDOW_ACTIVE_GAP_SECONDS = DEFAULT_WINDOW_ACTIVE_GAP_SECONDS
+WINDOW_SPAN_POINT_SECONDS = 600
+
+
+def _span_max_gap():
+    if MAX_WINDOW_ACTIVE_GAP_SECONDS > 0:
+        return MAX_WINDOW_ACTIVE_GAP_SECONDS
+    return DEFAULT_WINDOW_ACTIVE_GAP_SECONDS
+
+
+def _span_point_seconds():
+    return min(WINDOW_SPAN_POINT_SECONDS, _span_max_gap())
+
 
 def _root_dir():
     return os.path.dirname(os.path.abspath(__file__))
@@ -42,122 +91,929 @@ def get_db_path():
     return os.path.join(get_logs_dir(), "prolific.db")
 
 
-def _connect(db_path=None):
-    path = _resolve_path(db_path) if db_path else get_db_path()
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    conn = sqlite3.connect(path, timeout=30)
+def _open_connection(path, readonly=False):
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
     conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA journal_mode=WAL")
+    if readonly:
+        conn.execute("PRAGMA query_only=ON")
+    else:
+        conn.execute("PRAGMA journal_mode=WAL")
     conn.execute("PRAGMA synchronous=NORMAL")
     return conn
 
 
-def init_db(db_path=None):
+class ConnectionPool:
+    """
+    Keeps SQLite connections open across calls: a single writer connection,
+    used under _WRITE_LOCK, and a pool of query_only reader connections that
+    threads check out and return. Connections are keyed by database path so a
+    changed PROLIFIC_DB_PATH transparently opens new ones.
+    """
+
+    def __init__(self, max_idle_readers=4):
+        self.max_idle_readers = max_idle_readers
+        self._lock = threading.Lock()
+        self._writer = None
+        self._writer_path = None
+        self._idle_readers = {}
+        self._known_paths = set()
+        # "<title> (<process>)" -> window_titles.id for the writer's database.
+        self.title_ids = {}
+
+    def _ensure_dir(self, path):
+        if path in self._known_paths:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._known_paths.add(path)
+
+    def writer(self, path):
+        # Callers hold _WRITE_LOCK, which also serializes use of the writer.
+        with self._lock:
+            if self._writer is not None and self._writer_path == path:
+                return self._writer
+            stale = self._writer
+            self._ensure_dir(path)
+            self._writer = _open_connection(path)
+            self._writer_path = path
+            self.title_ids = {}
+        if stale is not None:
+            stale.close()
+        return self._writer
+
+    def acquire_reader(self, path):
+        with self._lock:
+            idle = self._idle_readers.get(path)
+            if idle:
+                return idle.pop()
+            self._ensure_dir(path)
+        return _open_connection(path, readonly=True)
+
+    def release_reader(self, path, conn):
+        with self._lock:
+            idle = self._idle_readers.setdefault(path, [])
+            if len(idle) < self.max_idle_readers:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            conns = [c for idle in self._idle_readers.values() for c in idle]
+            self._idle_readers = {}
+            if self._writer is not None:
+                conns.append(self._writer)
+            self._writer = None
+            self._writer_path = None
+            self._known_paths = set()
+            self.title_ids = {}
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+
+_POOL = ConnectionPool()
+
+
+def _pool_path(db_path=None):
+    return _resolve_path(db_path) if db_path else get_db_path()
+
+
+def _instrumented(fn):
+    """Records fn's latency under prolific_storage_op_seconds{op=<name>}."""
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with metrics.timer("prolific_storage_op_seconds", op=name):
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+
+@contextmanager
+def _write_transaction(db_path=None):
+    waited = time.perf_counter()
     with _WRITE_LOCK:
-        with _connect(db_path=db_path) as conn:
-            conn.executescript(
-                """
-                CREATE TABLE IF NOT EXISTS window_events (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    t INTEGER NOT NULL,
-                    day_t0 INTEGER NOT NULL,
-                    s TEXT NOT NULL,
-                    source_path TEXT
-                );
-                CREATE INDEX IF NOT EXISTS idx_window_day_t ON window_events(day_t0, t);
-
-                CREATE TABLE IF NOT EXISTS keyfreq_events (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    t INTEGER NOT NULL,
-                    day_t0 INTEGER NOT NULL,
-                    s INTEGER NOT NULL,
-                    source_path TEXT
-                );
-                CREATE INDEX IF NOT EXISTS idx_keyfreq_day_t ON keyfreq_events(day_t0, t);
-
-                CREATE TABLE IF NOT EXISTS notes_events (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    t INTEGER NOT NULL,
-                    day_t0 INTEGER NOT NULL,
-                    s TEXT NOT NULL,
-                    source_path TEXT
-                );
-                CREATE INDEX IF NOT EXISTS idx_notes_day_t ON notes_events(day_t0, t);
-
-                CREATE TABLE IF NOT EXISTS blog_entries (
-                    day_t0 INTEGER PRIMARY KEY,
-                    post TEXT NOT NULL DEFAULT '',
-                    updated_at INTEGER NOT NULL,
-                    source_path TEXT
-                );
-
-                CREATE TABLE IF NOT EXISTS legacy_import_state (
-                    source_path TEXT PRIMARY KEY,
-                    mtime INTEGER NOT NULL,
-                    size INTEGER NOT NULL,
-                    imported_at INTEGER NOT NULL
-                );
+        metrics.observe("prolific_storage_write_lock_wait_seconds", time.perf_counter() - waited)
+        conn = _POOL.writer(_pool_path(db_path))
+        try:
+            with conn:
+                yield conn
+        except BaseException:
+            # Titles inserted by the rolled-back transaction are gone again.
+            _POOL.title_ids = {}
+            raise
+
+
+@contextmanager
+def _read_connection(db_path=None):
+    path = _pool_path(db_path)
+    conn = _POOL.acquire_reader(path)
+    try:
+        yield conn
+    finally:
+        _POOL.release_reader(path, conn)
+
+
+def close_connections():
+    """
+    Closes every pooled connection. Safe to call more than once; later storage
+    calls reopen connections as needed.
+    """
+    with _WRITE_LOCK:
+        _POOL.close()
+
+
+atexit.register(close_connections)
+
+
+def init_db(db_path=None):
+    with _write_transaction(db_path=db_path) as conn:
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS window_titles (
+                id INTEGER PRIMARY KEY,
+                title TEXT NOT NULL,
+                process TEXT NOT NULL DEFAULT '',
+                UNIQUE(title, process)
+            );
+
+            CREATE TABLE IF NOT EXISTS window_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                t INTEGER NOT NULL,
+                day_t0 INTEGER NOT NULL,
+                s TEXT NOT NULL,
+                source_path TEXT,
+                title_id INTEGER REFERENCES window_titles(id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_window_day_t ON window_events(day_t0, t);
+            CREATE INDEX IF NOT EXISTS idx_window_source ON window_events(source_path)
+                WHERE source_path IS NOT NULL;
+
+            CREATE TABLE IF NOT EXISTS window_spans (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                day_t0 INTEGER NOT NULL,
+                start_t INTEGER NOT NULL,
+                end_t INTEGER NOT NULL,
+                title_id INTEGER NOT NULL REFERENCES window_titles(id),
+                source_path TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_spans_day_start ON window_spans(day_t0, start_t);
+            CREATE INDEX IF NOT EXISTS idx_spans_source ON window_spans(source_path)
+                WHERE source_path IS NOT NULL;
+
+            CREATE TABLE IF NOT EXISTS keyfreq_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                t INTEGER NOT NULL,
+                day_t0 INTEGER NOT NULL,
+                s INTEGER NOT NULL,
+                source_path TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_keyfreq_day_t ON keyfreq_events(day_t0, t);
+            CREATE INDEX IF NOT EXISTS idx_keyfreq_source ON keyfreq_events(source_path)
+                WHERE source_path IS NOT NULL;
+
+            CREATE TABLE IF NOT EXISTS keyfreq_blocks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                day_t0 INTEGER NOT NULL,
+                first_t INTEGER NOT NULL,
+                last_t INTEGER NOT NULL,
+                samples INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                source_path TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_keyfreq_blocks_day ON keyfreq_blocks(day_t0);
+            CREATE INDEX IF NOT EXISTS idx_keyfreq_blocks_source ON keyfreq_blocks(source_path)
+                WHERE source_path IS NOT NULL;
+
+            CREATE TABLE IF NOT EXISTS notes_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                t INTEGER NOT NULL,
+                day_t0 INTEGER NOT NULL,
+                s TEXT NOT NULL,
+                source_path TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_notes_day_t ON notes_events(day_t0, t);
+            CREATE INDEX IF NOT EXISTS idx_notes_source ON notes_events(source_path)
+                WHERE source_path IS NOT NULL;
+
+            CREATE TABLE IF NOT EXISTS blog_entries (
+                day_t0 INTEGER PRIMARY KEY,
+                post TEXT NOT NULL DEFAULT '',
+                updated_at INTEGER NOT NULL,
+                source_path TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_blog_source ON blog_entries(source_path)
+                WHERE source_path IS NOT NULL;
+
+            CREATE TABLE IF NOT EXISTS storage_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS legacy_import_state (
+                source_path TEXT PRIMARY KEY,
+                mtime INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                imported_at INTEGER NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS day_revisions (
+                day_t0 INTEGER PRIMARY KEY,
+                revision INTEGER NOT NULL DEFAULT 0
+            );
+
+            CREATE TABLE IF NOT EXISTS days (
+                day_t0 INTEGER PRIMARY KEY,
+                first_t INTEGER,
+                last_t INTEGER,
+                window_count INTEGER NOT NULL DEFAULT 0,
+                keyfreq_count INTEGER NOT NULL DEFAULT 0,
+                notes_count INTEGER NOT NULL DEFAULT 0,
+                has_blog INTEGER NOT NULL DEFAULT 0
+            );
+
+            CREATE TABLE IF NOT EXISTS day_compaction (
+                day_t0 INTEGER PRIMARY KEY,
+                revision INTEGER NOT NULL,
+                keyfreq_bucket_seconds INTEGER NOT NULL,
+                compacted_at INTEGER NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS export_state (
+                day_t0 INTEGER PRIMARY KEY,
+                revision INTEGER NOT NULL,
+                exported_at INTEGER NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS daily_rollups (
+                day_t0 INTEGER PRIMARY KEY,
+                revision INTEGER NOT NULL,
+                category_seconds TEXT NOT NULL,
+                key_stats TEXT NOT NULL,
+                total_keys INTEGER NOT NULL,
+                hacking_seconds INTEGER NOT NULL,
+                misc_titles TEXT NOT NULL,
+                key_bins TEXT NOT NULL,
+                rules_version TEXT NOT NULL DEFAULT '',
+                updated_at INTEGER NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS day_stats (
+                day_t0 INTEGER PRIMARY KEY,
+                revision INTEGER NOT NULL,
+                rules_version TEXT NOT NULL,
+                stats TEXT NOT NULL,
+                updated_at INTEGER NOT NULL
+            );
+            """
+        )
+        _ensure_column(conn, "daily_rollups", "rules_version", "TEXT NOT NULL DEFAULT ''")
+        _ensure_column(conn, "window_events", "title_id", "INTEGER REFERENCES window_titles(id)")
+        if _get_meta(conn, "days_table_built") is None:
+            conn.execute("DELETE FROM days")
+            conn.execute(_DAYS_AGGREGATE_SQL.format(where=""))
+            _set_meta(conn, "days_table_built", int(time.time()))
+    migrate_window_titles(db_path=db_path)
+    migrate_window_spans(db_path=db_path)
+    migrate_keyfreq_blocks(db_path=db_path)
+
+
+def _ensure_column(conn, table, column, decl):
+    columns = {r["name"] for r in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def _get_meta(conn, key, default=None):
+    row = conn.execute("SELECT value FROM storage_meta WHERE key = ?", (key,)).fetchone()
+    return row["value"] if row else default
+
+
+def _set_meta(conn, key, value):
+    conn.execute(
+        """
+        INSERT INTO storage_meta(key, value) VALUES(?, ?)
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        """,
+        (key, str(value)),
+    )
+
+
+# Window titles ("<title> (<process>)") are stored once in window_titles and
+# referenced by id from window_spans (and, before migrate_window_spans(),
+# window_events, whose s is left empty). The split is lossless:
+# _join_title(*_split_title(s)) == s for every string.
+_TITLE_PROCESS_RE = re.compile(r"^(.*) \(([^()]+)\)$", re.S)
+MAX_CACHED_TITLE_IDS = 50000
+
+
+def _split_title(s):
+    match = _TITLE_PROCESS_RE.match(s)
+    if match is None:
+        return s, ""
+    return match.group(1), match.group(2)
+
+
+def _join_title(title, process):
+    return f"{title} ({process})" if process else title
+
+
+def _title_id(conn, s):
+    cache = _POOL.title_ids
+    title_id = cache.get(s)
+    if title_id is not None:
+        return title_id
+    title, process = _split_title(s)
+    conn.execute(
+        "INSERT OR IGNORE INTO window_titles(title, process) VALUES(?, ?)",
+        (title, process),
+    )
+    title_id = conn.execute(
+        "SELECT id FROM window_titles WHERE title = ? AND process = ?",
+        (title, process),
+    ).fetchone()["id"]
+    if len(cache) >= MAX_CACHED_TITLE_IDS:
+        cache.clear()
+    cache[s] = title_id
+    return title_id
+
+
+def migrate_window_titles(batch_size=5000, db_path=None):
+    """
+    Moves window_events.s text of older rows into window_titles, one batch
+    per transaction so the collector keeps writing in between. Returns the
+    number of rows converted; a no-op once the migration has completed.
+    """
+    with _read_connection(db_path=db_path) as conn:
+        if _get_meta(conn, "window_titles_migrated") == "1":
+            return 0
+
+    converted = 0
+    last_id = 0
+    while True:
+        with _write_transaction(db_path=db_path) as conn:
+            rows = conn.execute(
                 """
+                SELECT id, s FROM window_events
+                WHERE id > ? AND title_id IS NULL
+                ORDER BY id ASC
+                LIMIT ?
+                """,
+                (last_id, int(batch_size)),
+            ).fetchall()
+            if not rows:
+                _set_meta(conn, "window_titles_migrated", "1")
+                break
+            conn.executemany(
+                "UPDATE window_events SET title_id = ?, s = '' WHERE id = ?",
+                [(_title_id(conn, r["s"]), r["id"]) for r in rows],
             )
+            last_id = rows[-1]["id"]
+            converted += len(rows)
+
+    if converted:
+        print(f"migrated {converted} window events to window_titles")
+    return converted
+
+
+def _spans_from_points(points):
+    """Folds time-sorted [(t, title_id)] into [[start_t, end_t, title_id]]."""
+    spans = []
+    max_gap = _span_max_gap()
+    for t, title_id in points:
+        last = spans[-1] if spans else None
+        if last is not None and last[2] == title_id and t - last[1] <= max_gap:
+            last[1] = t
+        else:
+            spans.append([t, t, title_id])
+    return spans
+
+
+def migrate_window_spans(batch_size=5000, db_path=None):
+    """
+    Converts window_events rows into window_spans a few days per transaction
+    (at least batch_size rows each) and deletes them, so the collector keeps
+    writing in between. Rows from different legacy files never share a span.
+    Returns the number of rows converted; a no-op once completed.
+    """
+    with _read_connection(db_path=db_path) as conn:
+        if _get_meta(conn, "window_spans_migrated") == "1":
+            return 0
+
+    converted = 0
+    while True:
+        with _write_transaction(db_path=db_path) as conn:
+            batch = 0
+            days = []
+            while batch < batch_size:
+                day_t0 = conn.execute("SELECT MIN(day_t0) FROM window_events").fetchone()[0]
+                if day_t0 is None:
+                    break
+                rows = conn.execute(
+                    """
+                    SELECT t, s, title_id, source_path FROM window_events
+                    WHERE day_t0 = ?
+                    ORDER BY t ASC, id ASC
+                    """,
+                    (day_t0,),
+                ).fetchall()
+                by_source = {}
+                for r in rows:
+                    title_id = r["title_id"] if r["title_id"] is not None else _title_id(conn, r["s"])
+                    by_source.setdefault(r["source_path"], []).append((r["t"], title_id))
+                conn.executemany(
+                    """
+                    INSERT INTO window_spans(day_t0, start_t, end_t, title_id, source_path)
+                    VALUES(?, ?, ?, ?, ?)
+                    """,
+                    [
+                        (day_t0, start, end, title_id, source_path)
+                        for source_path, points in by_source.items()
+                        for start, end, title_id in _spans_from_points(points)
+                    ],
+                )
+                conn.execute("DELETE FROM window_events WHERE day_t0 = ?", (day_t0,))
+                days.append(day_t0)
+                batch += len(rows)
+            _recount_days(conn, days)
+            converted += batch
+            if not days:
+                _set_meta(conn, "window_spans_migrated", "1")
+                break
+
+    if converted:
+        print(f"migrated {converted} window events to window_spans")
+    return converted
+
+
+def _insert_keyfreq_block(conn, day_t0, samples, source_path):
+    conn.execute(
+        """
+        INSERT INTO keyfreq_blocks(day_t0, first_t, last_t, samples, data, source_path)
+        VALUES(?, ?, ?, ?, ?, ?)
+        """,
+        (day_t0, samples[0][0], samples[-1][0], len(samples), keyfreq_blocks.pack(samples, day_t0), source_path),
+    )
+
+
+def _keyfreq_samples(rows):
+    """Decodes keyfreq_blocks rows (day_t0, data) of one day into time-sorted [(t, count)]."""
+    if len(rows) == 1:
+        return keyfreq_blocks.unpack(rows[0]["data"], rows[0]["day_t0"])
+    samples = []
+    for r in rows:
+        samples.extend(keyfreq_blocks.unpack(r["data"], r["day_t0"]))
+    samples.sort(key=lambda sample: sample[0])
+    return samples
+
+
+def migrate_keyfreq_blocks(batch_size=50000, db_path=None):
+    """
+    Packs keyfreq_events rows into one keyfreq_blocks row per day (and
+    legacy file), a few days per transaction, and deletes them. Returns the
+    number of rows converted; a no-op once completed.
+    """
+    with _read_connection(db_path=db_path) as conn:
+        if _get_meta(conn, "keyfreq_blocks_migrated") == "1":
+            return 0
+
+    converted = 0
+    while True:
+        with _write_transaction(db_path=db_path) as conn:
+            batch = 0
+            days = []
+            while batch < batch_size:
+                day_t0 = conn.execute("SELECT MIN(day_t0) FROM keyfreq_events").fetchone()[0]
+                if day_t0 is None:
+                    break
+                rows = conn.execute(
+                    """
+                    SELECT t, s, source_path FROM keyfreq_events
+                    WHERE day_t0 = ?
+                    ORDER BY t ASC, id ASC
+                    """,
+                    (day_t0,),
+                ).fetchall()
+                by_source = {}
+                for r in rows:
+                    by_source.setdefault(r["source_path"], []).append((r["t"], r["s"]))
+                for source_path, samples in by_source.items():
+                    _insert_keyfreq_block(conn, day_t0, samples, source_path)
+                conn.execute("DELETE FROM keyfreq_events WHERE day_t0 = ?", (day_t0,))
+                days.append(day_t0)
+                batch += len(rows)
+            _recount_days(conn, days)
+            converted += batch
+            if not days:
+                _set_meta(conn, "keyfreq_blocks_migrated", "1")
+                break
+
+    if converted:
+        print(f"migrated {converted} keyfreq events to keyfreq_blocks")
+    return converted
 
 
 def _sanitize_text(value):
     return str(value).replace("\r", " ").replace("\n", " ").strip()
 
 
-def insert_window_event(timestamp, title):
+def _bump_day_revision(conn, day_t0):
+    conn.execute(
+        """
+        INSERT INTO day_revisions(day_t0, revision) VALUES(?, 1)
+        ON CONFLICT(day_t0) DO UPDATE SET revision = revision + 1
+        """,
+        (int(day_t0),),
+    )
+
+
+# days holds one row per day with data, so listing days never touches the
+# event tables. Inserts add to it with _count_day_rows(); anything that
+# deletes or replaces rows calls _recount_days() instead.
+_DAYS_AGGREGATE_SQL = """
+    INSERT INTO days(day_t0, first_t, last_t, window_count, keyfreq_count, notes_count, has_blog)
+    SELECT day_t0, MIN(first_t), MAX(last_t), SUM(w), SUM(k), SUM(n), MAX(b) FROM (
+        SELECT day_t0, MIN(start_t) AS first_t, MAX(end_t) AS last_t, COUNT(*) AS w, 0 AS k, 0 AS n, 0 AS b
+        FROM window_spans {where} GROUP BY day_t0
+        UNION ALL
+        SELECT day_t0, MIN(first_t), MAX(last_t), 0, SUM(samples), 0, 0 FROM keyfreq_blocks {where}
+        GROUP BY day_t0
+        UNION ALL
+        SELECT day_t0, MIN(t), MAX(t), 0, 0, COUNT(*), 0 FROM notes_events {where} GROUP BY day_t0
+        UNION ALL
+        SELECT day_t0, NULL, NULL, 0, 0, 0, 1 FROM blog_entries {where}
+    )
+    GROUP BY day_t0
+"""
+
+
+def _count_day_rows(
+    conn, day_t0, first_t=None, last_t=None, window=0, keyfreq=0, notes=0, blog=False
+):
+    conn.execute(
+        """
+        INSERT INTO days(day_t0, first_t, last_t, window_count, keyfreq_count, notes_count, has_blog)
+        VALUES(?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(day_t0) DO UPDATE SET
+            first_t = min(coalesce(first_t, excluded.first_t), coalesce(excluded.first_t, first_t)),
+            last_t = max(coalesce(last_t, excluded.last_t), coalesce(excluded.last_t, last_t)),
+            window_count = window_count + excluded.window_count,
+            keyfreq_count = keyfreq_count + excluded.keyfreq_count,
+            notes_count = notes_count + excluded.notes_count,
+            has_blog = max(has_blog, excluded.has_blog)
+        """,
+        (int(day_t0), first_t, last_t, int(window), int(keyfreq), int(notes), int(bool(blog))),
+    )
+
+
+def _recount_days(conn, day_t0s):
+    for day_t0 in day_t0s:
+        day_stamp = int(day_t0)
+        conn.execute("DELETE FROM days WHERE day_t0 = ?", (day_stamp,))
+        conn.execute(_DAYS_AGGREGATE_SQL.format(where="WHERE day_t0 = ?"), (day_stamp,) * 4)
+
+
+def _window_row(timestamp, title):
     ts = int(timestamp)
-    day_t0 = rewindTime(ts)
-    safe_title = _sanitize_text(title)
-    with _WRITE_LOCK:
-        with _connect() as conn:
-            conn.execute(
-                "INSERT INTO window_events(t, day_t0, s, source_path) VALUES(?, ?, ?, NULL)",
-                (ts, day_t0, safe_title),
-            )
+    return ts, rewindTime(ts), _sanitize_text(title)
 
 
-def insert_keyfreq_event(timestamp, count):
+def _keyfreq_row(timestamp, count):
     ts = int(timestamp)
-    day_t0 = rewindTime(ts)
-    safe_count = max(0, int(count))
-    with _WRITE_LOCK:
-        with _connect() as conn:
-            conn.execute(
-                "INSERT INTO keyfreq_events(t, day_t0, s, source_path) VALUES(?, ?, ?, NULL)",
-                (ts, day_t0, safe_count),
-            )
+    return ts, rewindTime(ts), max(0, int(count))
+
+
+def _extend_spans(conn, day_t0, points):
+    """
+    Applies time-sorted [(t, title_id)] samples of one day to its live
+    spans: extends the latest span in place where possible and opens new
+    ones otherwise. A sample older than the latest span's end that it does
+    not extend gets a span of its own. Returns the number of spans opened.
+    """
+    row = conn.execute(
+        """
+        SELECT id, start_t, end_t, title_id FROM window_spans
+        WHERE day_t0 = ? AND source_path IS NULL
+        ORDER BY start_t DESC, id DESC
+        LIMIT 1
+        """,
+        (day_t0,),
+    ).fetchone()
+    latest = None if row is None else [row["start_t"], row["end_t"], row["title_id"]]
+    current = latest
+    opened = []
+    max_gap = _span_max_gap()
+    for t, title_id in points:
+        if (
+            current is not None
+            and current[2] == title_id
+            and current[0] <= t
+            and t - current[1] <= max_gap
+        ):
+            current[1] = max(current[1], t)
+        elif current is None or t >= current[1]:
+            current = [t, t, title_id]
+            opened.append(current)
+        else:
+            opened.append([t, t, title_id])
+
+    if latest is not None and latest[1] != row["end_t"]:
+        conn.execute("UPDATE window_spans SET end_t = ? WHERE id = ?", (latest[1], row["id"]))
+    if opened:
+        conn.executemany(
+            "INSERT INTO window_spans(day_t0, start_t, end_t, title_id, source_path) VALUES(?, ?, ?, ?, NULL)",
+            [(day_t0, start, end, title_id) for start, end, title_id in opened],
+        )
+    return len(opened)
 
 
+def _append_keyfreq(conn, day_t0, samples):
+    """
+    Adds time-sorted [(t, count)] of one day to its live block. Samples at
+    or after the block's last one are appended to the packed data in SQL
+    (|| yields text, hence the CAST back; the bytes are unchanged); an older
+    sample makes the block re-pack.
+    """
+    row = conn.execute(
+        """
+        SELECT id, last_t FROM keyfreq_blocks
+        WHERE day_t0 = ? AND source_path IS NULL
+        ORDER BY id DESC
+        LIMIT 1
+        """,
+        (day_t0,),
+    ).fetchone()
+    if row is None:
+        _insert_keyfreq_block(conn, day_t0, samples, None)
+    elif samples[0][0] >= row["last_t"]:
+        conn.execute(
+            """
+            UPDATE keyfreq_blocks
+            SET data = CAST(data || ? AS BLOB), last_t = ?, samples = samples + ?
+            WHERE id = ?
+            """,
+            (keyfreq_blocks.pack(samples, row["last_t"]), samples[-1][0], len(samples), row["id"]),
+        )
+    else:
+        data = conn.execute("SELECT data FROM keyfreq_blocks WHERE id = ?", (row["id"],)).fetchone()["data"]
+        merged = sorted(keyfreq_blocks.unpack(data, day_t0) + samples, key=lambda sample: sample[0])
+        conn.execute(
+            """
+            UPDATE keyfreq_blocks
+            SET data = ?, first_t = ?, last_t = ?, samples = ?
+            WHERE id = ?
+            """,
+            (keyfreq_blocks.pack(merged, day_t0), merged[0][0], merged[-1][0], len(merged), row["id"]),
+        )
+
+
+def _insert_live_rows(conn, window_rows, keyfreq_rows):
+    # day_t0 -> [first_t, last_t, spans opened, keyfreq rows]
+    counts = {}
+    for rows in (window_rows, keyfreq_rows):
+        for ts, day_t0, _ in rows:
+            entry = counts.setdefault(day_t0, [ts, ts, 0, 0])
+            entry[0] = min(entry[0], ts)
+            entry[1] = max(entry[1], ts)
+
+    if window_rows:
+        by_day = {}
+        for ts, day_t0, title in sorted(window_rows, key=lambda r: r[0]):
+            by_day.setdefault(day_t0, []).append((ts, _title_id(conn, title)))
+        for day_t0, points in by_day.items():
+            counts[day_t0][2] = _extend_spans(conn, day_t0, points)
+        opened = sum(counts[day_t0][2] for day_t0 in by_day)
+        metrics.inc("prolific_storage_rows_written_total", opened, table="window_spans")
+    if keyfreq_rows:
+        by_day = {}
+        for ts, day_t0, count in sorted(keyfreq_rows, key=lambda r: r[0]):
+            by_day.setdefault(day_t0, []).append((ts, count))
+        for day_t0, samples in by_day.items():
+            _append_keyfreq(conn, day_t0, samples)
+            counts[day_t0][3] = len(samples)
+        metrics.inc("prolific_storage_rows_written_total", len(keyfreq_rows), table="keyfreq_blocks")
+    for day_t0 in sorted(counts):
+        first_t, last_t, window, keyfreq = counts[day_t0]
+        _count_day_rows(conn, day_t0, first_t, last_t, window=window, keyfreq=keyfreq)
+        _bump_day_revision(conn, day_t0)
+
+
+@_instrumented
+def insert_window_event(timestamp, title):
+    row = _window_row(timestamp, title)
+    with _write_transaction() as conn:
+        _insert_live_rows(conn, [row], [])
+
+
+@_instrumented
+def insert_keyfreq_event(timestamp, count):
+    row = _keyfreq_row(timestamp, count)
+    with _write_transaction() as conn:
+        _insert_live_rows(conn, [], [row])
+
+
+class EventWriter:
+    """
+    Group-commit writer for the collector. submit_* only enqueue, and a
+    background thread writes everything queued in one transaction per
+    flush_seconds or batch_size events, so sampling threads never wait on
+    _WRITE_LOCK. At most max_queue events are held at once, counting a batch
+    kept for retry after a failed flush; past that, submit_* waits up to
+    put_timeout and then drops the event. The thread drains and flushes once
+    stop_event is set; call close() after the producers have stopped to
+    write anything enqueued late.
+    """
+
+    def __init__(self, stop_event, flush_seconds=2.0, batch_size=256, max_queue=10000, put_timeout=1.0):
+        self.stop_event = stop_event
+        self.flush_seconds = float(flush_seconds)
+        self.batch_size = max(1, int(batch_size))
+        self.put_timeout = float(put_timeout)
+        self.max_queue = max(1, int(max_queue))
+        self._queue = queue.Queue()
+        # One slot per event queued or held for retry; freed once written.
+        self._slots = threading.Semaphore(self.max_queue)
+        self._backlog = 0
+        self._thread = None
+        self._unwritten = []
+        self._flush_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._failing_since_log = 0
+        self._last_error_log = None
+        self._stats = {
+            "submitted": 0,
+            "written": 0,
+            "dropped": 0,
+            "flushes": 0,
+            "flush_errors": 0,
+            "max_queue_depth": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="prolific-event-writer", daemon=True)
+        self._thread.start()
+        return self
+
+    def submit_window_event(self, timestamp, title):
+        return self._submit(("window", int(timestamp), title))
+
+    def submit_keyfreq_event(self, timestamp, count):
+        return self._submit(("keyfreq", int(timestamp), count))
+
+    def _submit(self, item):
+        if not self._slots.acquire(timeout=self.put_timeout):
+            with self._stats_lock:
+                self._stats["dropped"] += 1
+            return False
+        with self._stats_lock:
+            self._backlog += 1
+            self._stats["submitted"] += 1
+            if self._backlog > self._stats["max_queue_depth"]:
+                self._stats["max_queue_depth"] = self._backlog
+        self._queue.put(item)
+        return True
+
+    def stats(self):
+        with self._stats_lock:
+            out = dict(self._stats)
+            out["queue_depth"] = self._backlog
+        out["avg_flush_ms"] = out["total_flush_ms"] / out["flushes"] if out["flushes"] else 0.0
+        return out
+
+    def _drain(self, pending, limit):
+        while len(pending) < limit:
+            try:
+                pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return pending
+
+    def _log_flush_error(self, exc):
+        # A long lock fails every attempt; report once a minute, not per retry.
+        self._failing_since_log += 1
+        now = time.monotonic()
+        if self._last_error_log is not None and now - self._last_error_log < FLUSH_ERROR_LOG_SECONDS:
+            return
+        print(f"event writer flush failed ({self._failing_since_log} attempts since last report), will retry: {exc}")
+        self._failing_since_log = 0
+        self._last_error_log = now
+
+    @_instrumented
+    def flush(self, pending=None):
+        """
+        Writes `pending` (everything queued when omitted) and returns what is
+        still unwritten: [] on success, the same batch if the write failed.
+        """
+        if pending is None:
+            pending = self._drain([], float("inf"))
+        if not pending:
+            return pending
+
+        # One batched day lookup for the whole flush instead of one per event.
+        window_rows = []
+        keyfreq_rows = []
+        day_t0s = rewind_many([ts for _, ts, _ in pending])
+        for (kind, ts, value), day_t0 in zip(pending, day_t0s):
+            if kind == "window":
+                window_rows.append((ts, day_t0, _sanitize_text(value)))
+            else:
+                keyfreq_rows.append((ts, day_t0, max(0, int(value))))
+
+        started = time.perf_counter()
+        with self._flush_lock:
+            try:
+                with _write_transaction() as conn:
+                    _insert_live_rows(conn, window_rows, keyfreq_rows)
+            except sqlite3.Error as exc:
+                with self._stats_lock:
+                    self._stats["flush_errors"] += 1
+                self._log_flush_error(exc)
+                return pending
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+
+        with self._stats_lock:
+            self._backlog -= len(pending)
+            self._stats["written"] += len(pending)
+            self._stats["flushes"] += 1
+            self._stats["last_flush_ms"] = elapsed_ms
+            self._stats["total_flush_ms"] += elapsed_ms
+            self._stats["max_flush_ms"] = max(self._stats["max_flush_ms"], elapsed_ms)
+        self._slots.release(len(pending))
+        return []
+
+    def _run(self):
+        pending = []
+        retrying = False
+        deadline = time.monotonic() + self.flush_seconds
+        while not self.stop_event.is_set():
+            wait = min(0.5, max(0.0, deadline - time.monotonic()))
+            if retrying:
+                # Keep the failed batch as is until the next attempt; new
+                # events stay queued and count against max_queue.
+                self.stop_event.wait(wait)
+            else:
+                try:
+                    pending.append(self._queue.get(timeout=wait))
+                except queue.Empty:
+                    pass
+                self._drain(pending, self.batch_size)
+            if len(pending) >= self.batch_size or time.monotonic() >= deadline:
+                if pending:
+                    pending = self.flush(pending)
+                    retrying = bool(pending)
+                deadline = time.monotonic() + self.flush_seconds
+        self._unwritten = self.flush(self._drain(pending, float("inf")))
+
+    def close(self, timeout=5.0):
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+        leftover = self.flush(self._drain(self._unwritten, float("inf")))
+        if leftover:
+            with self._stats_lock:
+                self._stats["dropped"] += len(leftover)
+            print(f"event writer dropped {len(leftover)} unwritten events on shutdown")
+
+
+@_instrumented
 def insert_note_event(note, timestamp=None):
     ts = int(time.time()) if timestamp is None else int(timestamp)
     day_t0 = rewindTime(ts)
     safe_note = _sanitize_text(note)
-    with _WRITE_LOCK:
-        with _connect() as conn:
-            conn.execute(
-                "INSERT INTO notes_events(t, day_t0, s, source_path) VALUES(?, ?, ?, NULL)",
-                (ts, day_t0, safe_note),
-            )
+    with _write_transaction() as conn:
+        conn.execute(
+            "INSERT INTO notes_events(t, day_t0, s, source_path) VALUES(?, ?, ?, NULL)",
+            (ts, day_t0, safe_note),
+        )
+        _count_day_rows(conn, day_t0, ts, ts, notes=1)
+        _bump_day_revision(conn, day_t0)
+    metrics.inc("prolific_storage_rows_written_total", table="notes_events")
 
 
+@_instrumented
 def upsert_blog_entry(day_t0, post):
     day_stamp = int(day_t0)
     safe_post = str(post)
     now = int(time.time())
-    with _WRITE_LOCK:
-        with _connect() as conn:
-            conn.execute(
-                """
-                INSERT INTO blog_entries(day_t0, post, updated_at, source_path)
-                VALUES(?, ?, ?, NULL)
-                ON CONFLICT(day_t0) DO UPDATE SET
-                    post = excluded.post,
-                    updated_at = excluded.updated_at,
-                    source_path = NULL
-                """,
-                (day_stamp, safe_post, now),
-            )
+    with _write_transaction() as conn:
+        conn.execute(
+            """
+            INSERT INTO blog_entries(day_t0, post, updated_at, source_path)
+            VALUES(?, ?, ?, NULL)
+            ON CONFLICT(day_t0) DO UPDATE SET
+                post = excluded.post,
+                updated_at = excluded.updated_at,
+                source_path = NULL
+            """,
+            (day_stamp, safe_post, now),
+        )
+        _count_day_rows(conn, day_stamp, blog=True)
+        _bump_day_revision(conn, day_stamp)
 
 
 def upsert_blog_for_timestamp(timestamp, post):
@@ -165,9 +1021,10 @@ def upsert_blog_for_timestamp(timestamp, post):
     upsert_blog_entry(rewindTime(ts), post)
 
 
+@_instrumented
 def get_blog_entry(day_t0):
     day_stamp = int(day_t0)
-    with _connect() as conn:
+    with _read_connection() as conn:
         row = conn.execute(
             "SELECT post FROM blog_entries WHERE day_t0 = ?",
             (day_stamp,),
@@ -175,29 +1032,58 @@ def get_blog_entry(day_t0):
     return row["post"] if row else ""
 
 
-def fetch_window_events(day_t0):
+def _span_points(start_t, end_t, text):
+    """A span as the {t, s} points the collector used to write: one per heartbeat."""
+    points = [{"t": t, "s": text} for t in range(start_t, end_t, _span_point_seconds())]
+    points.append({"t": end_t, "s": text})
+    return points if end_t > start_t else points[:1]
+
+
+@_instrumented
+def fetch_window_spans(day_t0):
+    """Window activity of a day as [{"start", "end", "s"}], ordered by start."""
     day_stamp = int(day_t0)
-    with _connect() as conn:
+    with _read_connection() as conn:
         rows = conn.execute(
-            "SELECT t, s FROM window_events WHERE day_t0 = ? ORDER BY t ASC, id ASC",
+            """
+            SELECT s.start_t, s.end_t, w.title, w.process
+            FROM window_spans s
+            JOIN window_titles w ON w.id = s.title_id
+            WHERE s.day_t0 = ?
+            ORDER BY s.start_t ASC, s.id ASC
+            """,
             (day_stamp,),
         ).fetchall()
-    return [{"t": int(r["t"]), "s": str(r["s"])} for r in rows]
+    return [
+        {"start": int(r["start_t"]), "end": int(r["end_t"]), "s": _join_title(r["title"], r["process"])}
+        for r in rows
+    ]
 
 
+@_instrumented
+def fetch_window_events(day_t0):
+    """Window spans of a day expanded into the {t, s} export shape."""
+    events = []
+    for span in fetch_window_spans(day_t0):
+        events.extend(_span_points(span["start"], span["end"], span["s"]))
+    return events
+
+
+@_instrumented
 def fetch_keyfreq_events(day_t0):
     day_stamp = int(day_t0)
-    with _connect() as conn:
+    with _read_connection() as conn:
         rows = conn.execute(
-            "SELECT t, s FROM keyfreq_events WHERE day_t0 = ? ORDER BY t ASC, id ASC",
+            "SELECT day_t0, data FROM keyfreq_blocks WHERE day_t0 = ? ORDER BY id ASC",
             (day_stamp,),
         ).fetchall()
-    return [{"t": int(r["t"]), "s": int(r["s"])} for r in rows]
+    return [{"t": t, "s": count} for t, count in _keyfreq_samples(rows)]
 
 
+@_instrumented
 def fetch_notes_events(day_t0):
     day_stamp = int(day_t0)
-    with _connect() as conn:
+    with _read_connection() as conn:
         rows = conn.execute(
             "SELECT t, s FROM notes_events WHERE day_t0 = ? ORDER BY t ASC, id ASC",
             (day_stamp,),
@@ -205,53 +1091,477 @@ def fetch_notes_events(day_t0):
     return [{"t": int(r["t"]), "s": str(r["s"])} for r in rows]
 
 
-def list_day_timestamps():
-    with _connect() as conn:
-        rows = conn.execute(
+_RANGE_QUERIES = {
+    "window": """
+        SELECT s.day_t0, s.start_t, s.end_t, w.title, w.process
+        FROM window_spans s
+        JOIN window_titles w ON w.id = s.title_id
+        WHERE s.day_t0 BETWEEN ? AND ?
+        ORDER BY s.day_t0 ASC, s.start_t ASC, s.id ASC
+        """,
+    "keyfreq": """
+        SELECT day_t0, data FROM keyfreq_blocks
+        WHERE day_t0 BETWEEN ? AND ?
+        ORDER BY day_t0 ASC, id ASC
+        """,
+    "notes": """
+        SELECT day_t0, t, s FROM notes_events
+        WHERE day_t0 BETWEEN ? AND ?
+        ORDER BY day_t0 ASC, t ASC, id ASC
+        """,
+    "blog": """
+        SELECT day_t0, post FROM blog_entries
+        WHERE day_t0 BETWEEN ? AND ?
+        ORDER BY day_t0 ASC
+        """,
+}
+
+# Row -> list of events (a window span or keyfreq block expands to several).
+# Kinds in _RANGE_SORTED can have overlapping rows in a day (live data next
+# to legacy imports), so their days are sorted before being yielded.
+_RANGE_SORTED = ("keyfreq",)
+_RANGE_ROW = {
+    "window": lambda r: _span_points(
+        int(r["start_t"]), int(r["end_t"]), _join_title(r["title"], r["process"])
+    ),
+    "keyfreq": lambda r: [
+        {"t": t, "s": count} for t, count in keyfreq_blocks.unpack(r["data"], r["day_t0"])
+    ],
+    "notes": lambda r: [{"t": int(r["t"]), "s": str(r["s"])}],
+}
+
+
+def iter_events(kind, t0_from=None, t0_to=None, batch_size=5000):
+    """
+    Streams one table ("window", "keyfreq", "notes" or "blog") for the days
+    t0_from..t0_to (inclusive) from a single cursor, yielding (day_t0,
+    events) per day in day order; events match the fetch_*_events() output.
+    For "blog" the second item is the post text. The reader connection is
+    held until the generator is exhausted or closed.
+    """
+    converter = _RANGE_ROW.get(kind)
+    if kind not in _RANGE_QUERIES:
+        raise ValueError(f"Unknown event kind: {kind}")
+    sort_days = kind in _RANGE_SORTED
+    lo = -(1 << 62) if t0_from is None else int(t0_from)
+    hi = (1 << 62) if t0_to is None else int(t0_to)
+
+    with _read_connection() as conn:
+        cursor = conn.execute(_RANGE_QUERIES[kind], (lo, hi))
+        try:
+            day = None
+            events = []
+            day_rows = 0
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for r in rows:
+                    if converter is None:
+                        yield int(r["day_t0"]), r["post"]
+                        continue
+                    if r["day_t0"] != day:
+                        if day is not None:
+                            if sort_days and day_rows > 1:
+                                events.sort(key=lambda e: e["t"])
+                            yield day, events
+                        day = int(r["day_t0"])
+                        events = []
+                        day_rows = 0
+                    events.extend(converter(r))
+                    day_rows += 1
+            if day is not None:
+                if sort_days and day_rows > 1:
+                    events.sort(key=lambda e: e["t"])
+                yield day, events
+        finally:
+            cursor.close()
+
+
+_ROLLUP_JSON_FIELDS = ("category_seconds", "key_stats", "misc_titles", "key_bins")
+
+
+@_instrumented
+def upsert_daily_rollups(rollups):
+    """
+    Stores per-day rollups. rollups is a list of (day_t0, revision,
+    rules_version, rollup) where rollup is the dict produced by
+    analytics.compute_day_rollup.
+    """
+    now = int(time.time())
+    rows = [
+        (
+            int(day_t0),
+            int(revision),
+            json.dumps(rollup["category_seconds"], ensure_ascii=False),
+            json.dumps(rollup["key_stats"], ensure_ascii=False),
+            int(rollup["total_keys"]),
+            int(rollup["hacking_seconds"]),
+            json.dumps(rollup["misc_titles"], ensure_ascii=False),
+            json.dumps(rollup["key_bins"]),
+            str(rules_version),
+            now,
+        )
+        for day_t0, revision, rules_version, rollup in rollups
+    ]
+    if not rows:
+        return
+    with _write_transaction() as conn:
+        conn.executemany(
             """
-            SELECT day_t0 FROM window_events
-            UNION
-            SELECT day_t0 FROM keyfreq_events
-            UNION
-            SELECT day_t0 FROM notes_events
-            UNION
-            SELECT day_t0 FROM blog_entries
+            INSERT INTO daily_rollups(
+                day_t0, revision, category_seconds, key_stats, total_keys,
+                hacking_seconds, misc_titles, key_bins, rules_version, updated_at
+            )
+            VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(day_t0) DO UPDATE SET
+                revision = excluded.revision,
+                category_seconds = excluded.category_seconds,
+                key_stats = excluded.key_stats,
+                total_keys = excluded.total_keys,
+                hacking_seconds = excluded.hacking_seconds,
+                misc_titles = excluded.misc_titles,
+                key_bins = excluded.key_bins,
+                rules_version = excluded.rules_version,
+                updated_at = excluded.updated_at
+            """,
+            rows,
+        )
+
+
+def fetch_rollup_revisions():
+    with _read_connection() as conn:
+        rows = conn.execute("SELECT day_t0, revision, rules_version FROM daily_rollups").fetchall()
+    return {int(r["day_t0"]): (int(r["revision"]), str(r["rules_version"])) for r in rows}
+
+
+def iter_daily_rollups(t0_from=None, t0_to=None):
+    """
+    Streams daily_rollups rows for the days t0_from..t0_to (inclusive) in
+    day order, as fetch_daily_rollups() returns them. The reader connection
+    is held until the generator is exhausted or closed.
+    """
+    lo = -(1 << 62) if t0_from is None else int(t0_from)
+    hi = (1 << 62) if t0_to is None else int(t0_to)
+    with _read_connection() as conn:
+        cursor = conn.execute(
+            """
+            SELECT day_t0, category_seconds, key_stats, total_keys,
+                   hacking_seconds, misc_titles, key_bins
+            FROM daily_rollups
+            WHERE day_t0 BETWEEN ? AND ?
             ORDER BY day_t0 ASC
+            """,
+            (lo, hi),
+        )
+        try:
+            for r in cursor:
+                rollup = {"t0": int(r["day_t0"])}
+                for field in _ROLLUP_JSON_FIELDS:
+                    rollup[field] = json.loads(r[field])
+                rollup["total_keys"] = int(r["total_keys"])
+                rollup["hacking_seconds"] = int(r["hacking_seconds"])
+                yield rollup
+        finally:
+            cursor.close()
+
+
+@_instrumented
+def fetch_daily_rollups():
+    return list(iter_daily_rollups())
+
+
+@_instrumented
+def upsert_day_stats(rows):
+    """
+    Caches analytics.compute_day_stats results. rows is a list of (day_t0,
+    revision, rules_version, stats); an entry is only valid while both
+    still match the day.
+    """
+    now = int(time.time())
+    rows = [
+        (int(day_t0), int(revision), str(rules_version), json.dumps(stats, ensure_ascii=False), now)
+        for day_t0, revision, rules_version, stats in rows
+    ]
+    if not rows:
+        return
+    with _write_transaction() as conn:
+        conn.executemany(
             """
-        ).fetchall()
+            INSERT INTO day_stats(day_t0, revision, rules_version, stats, updated_at)
+            VALUES(?, ?, ?, ?, ?)
+            ON CONFLICT(day_t0) DO UPDATE SET
+                revision = excluded.revision,
+                rules_version = excluded.rules_version,
+                stats = excluded.stats,
+                updated_at = excluded.updated_at
+            """,
+            rows,
+        )
+
+
+@_instrumented
+def fetch_day_stats(day_t0=None):
+    """
+    Cached day stats as {day_t0: (revision, rules_version, stats)}, for one
+    day or, without day_t0, every day.
+    """
+    with _read_connection() as conn:
+        if day_t0 is None:
+            rows = conn.execute("SELECT day_t0, revision, rules_version, stats FROM day_stats").fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT day_t0, revision, rules_version, stats FROM day_stats WHERE day_t0 = ?",
+                (int(day_t0),),
+            ).fetchall()
+    return {
+        int(r["day_t0"]): (int(r["revision"]), str(r["rules_version"]), json.loads(r["stats"]))
+        for r in rows
+    }
+
+
+@_instrumented
+def fetch_day_fingerprint(day_t0):
+    """
+    The day's days row (counts, first/last event time), blog update time
+    and revision, or None when the day has no data at all. Every write path
+    bumps the revision, so this changes whenever the day's payload can.
+    """
+    day_stamp = int(day_t0)
+    with _read_connection() as conn:
+        day = conn.execute(
+            """
+            SELECT first_t, last_t, window_count, keyfreq_count, notes_count, has_blog
+            FROM days WHERE day_t0 = ?
+            """,
+            (day_stamp,),
+        ).fetchone()
+        if day is None:
+            return None
+        blog = conn.execute(
+            "SELECT updated_at, length(post) AS size FROM blog_entries WHERE day_t0 = ?",
+            (day_stamp,),
+        ).fetchone()
+        revision = conn.execute(
+            "SELECT revision FROM day_revisions WHERE day_t0 = ?",
+            (day_stamp,),
+        ).fetchone()
+
+    return (
+        tuple(day),
+        (int(blog["updated_at"]), int(blog["size"])) if blog else (0, 0),
+        int(revision["revision"]) if revision else 0,
+    )
+
+
+@_instrumented
+def list_day_timestamps():
+    with _read_connection() as conn:
+        rows = conn.execute("SELECT day_t0 FROM days ORDER BY day_t0 ASC").fetchall()
     return [int(r["day_t0"]) for r in rows]
 
 
+def fetch_day_revisions():
+    with _read_connection() as conn:
+        rows = conn.execute("SELECT day_t0, revision FROM day_revisions").fetchall()
+    return {int(r["day_t0"]): int(r["revision"]) for r in rows}
+
+
+def fetch_export_revisions():
+    with _read_connection() as conn:
+        rows = conn.execute("SELECT day_t0, revision FROM export_state").fetchall()
+    return {int(r["day_t0"]): int(r["revision"]) for r in rows}
+
+
+@_instrumented
+def mark_days_exported(day_revisions):
+    rows = [(int(day_t0), int(revision), int(time.time())) for day_t0, revision in day_revisions]
+    if not rows:
+        return
+    with _write_transaction() as conn:
+        conn.executemany(
+            """
+            INSERT INTO export_state(day_t0, revision, exported_at)
+            VALUES(?, ?, ?)
+            ON CONFLICT(day_t0) DO UPDATE SET
+                revision = excluded.revision,
+                exported_at = excluded.exported_at
+            """,
+            rows,
+        )
+
+
+def _compaction_plan(conn, day_t0, bucket_seconds):
+    """
+    Merges one day's keyfreq samples into bucket_seconds buckets aligned on
+    day_t0, block by block. Each bucket becomes one sample at the time of
+    its last one (so it stays in the same 10-minute key bin) with the summed
+    count. Window spans need no compaction; they carry no heartbeats.
+
+    Returns ([(block_id, samples, packed)] to rewrite, samples_before,
+    samples_after, bytes_saved).
+    """
+    rows = conn.execute(
+        "SELECT id, day_t0, data FROM keyfreq_blocks WHERE day_t0 = ? ORDER BY id ASC",
+        (day_t0,),
+    ).fetchall()
+    rewrites = []
+    before = after = saved = 0
+    for row in rows:
+        samples = keyfreq_blocks.unpack(row["data"], day_t0)
+        buckets = {}
+        for t, count in samples:
+            key = (t - day_t0) // bucket_seconds
+            bucket = buckets.get(key)
+            buckets[key] = (t, count) if bucket is None else (max(t, bucket[0]), bucket[1] + count)
+        before += len(samples)
+        after += len(buckets)
+        if len(buckets) < len(samples):
+            merged = sorted(buckets.values())
+            packed = keyfreq_blocks.pack(merged, day_t0)
+            rewrites.append((row["id"], merged, packed))
+            saved += len(row["data"]) - len(packed)
+    return rewrites, before, after, saved
+
+
+def compact_old_days(
+    older_than_days=RETENTION_DAYS,
+    keyfreq_bucket_seconds=RETENTION_KEYFREQ_BUCKET_SECONDS,
+    dry_run=False,
+    max_days=None,
+    stop_event=None,
+    pause_seconds=0.0,
+    now=None,
+):
+    """
+    Downsamples keyfreq rows of days that started more than older_than_days
+    ago (see _compaction_plan). Each day is compacted in its own write
+    transaction, so live writes are only held up briefly; pause_seconds
+    spaces the days out further and stop_event ends the run between days.
+    A day is compacted again only if it changed since (its revision moved)
+    or the bucket grew. Compacting bumps the day's revision, so the next
+    export rewrites it.
+
+    dry_run=True changes nothing and reports what a run would do. Returns
+    {days, keyfreq_rows_before, keyfreq_rows_after, bytes_saved}, counting
+    samples and packed block bytes.
+    """
+    bucket = int(keyfreq_bucket_seconds)
+    if bucket <= 0:
+        raise ValueError(f"Invalid keyfreq bucket: {keyfreq_bucket_seconds}")
+    cutoff = rewindTime(int(time.time() if now is None else now)) - int(older_than_days) * 86400
+
+    with _read_connection() as conn:
+        days = [
+            int(r["day_t0"])
+            for r in conn.execute(
+                """
+                SELECT d.day_t0 FROM days d
+                LEFT JOIN day_revisions r ON r.day_t0 = d.day_t0
+                LEFT JOIN day_compaction c ON c.day_t0 = d.day_t0
+                WHERE d.day_t0 < ?
+                  AND (c.day_t0 IS NULL
+                       OR c.revision != coalesce(r.revision, 0)
+                       OR c.keyfreq_bucket_seconds < ?)
+                ORDER BY d.day_t0 ASC
+                """,
+                (cutoff, bucket),
+            )
+        ]
+    if max_days is not None:
+        days = days[: int(max_days)]
+
+    report = {"days": 0, "keyfreq_rows_before": 0, "keyfreq_rows_after": 0, "bytes_saved": 0}
+
+    def plan(conn, day_t0):
+        rewrites, before, after, saved = _compaction_plan(conn, day_t0, bucket)
+        report["days"] += 1
+        report["keyfreq_rows_before"] += before
+        report["keyfreq_rows_after"] += after
+        report["bytes_saved"] += saved
+        return rewrites
+
+    for k, day_t0 in enumerate(days):
+        if k and pause_seconds > 0 and not dry_run:
+            if stop_event is not None:
+                stop_event.wait(pause_seconds)
+            else:
+                time.sleep(pause_seconds)
+        if stop_event is not None and stop_event.is_set():
+            break
+        if dry_run:
+            with _read_connection() as conn:
+                plan(conn, day_t0)
+            continue
+
+        with _write_transaction() as conn:
+            rewrites = plan(conn, day_t0)
+            if rewrites:
+                conn.executemany(
+                    """
+                    UPDATE keyfreq_blocks
+                    SET data = ?, first_t = ?, last_t = ?, samples = ?
+                    WHERE id = ?
+                    """,
+                    [
+                        (packed, samples[0][0], samples[-1][0], len(samples), block_id)
+                        for block_id, samples, packed in rewrites
+                    ],
+                )
+                _recount_days(conn, [day_t0])
+                _bump_day_revision(conn, day_t0)
+            conn.execute(
+                """
+                INSERT INTO day_compaction(day_t0, revision, keyfreq_bucket_seconds, compacted_at)
+                SELECT ?, coalesce((SELECT revision FROM day_revisions WHERE day_t0 = ?), 0), ?, ?
+                ON CONFLICT(day_t0) DO UPDATE SET
+                    revision = excluded.revision,
+                    keyfreq_bucket_seconds = excluded.keyfreq_bucket_seconds,
+                    compacted_at = excluded.compacted_at
+                """,
+                (day_t0, day_t0, bucket, int(time.time())),
+            )
+    return report
+
+
 def _legacy_file_records(logs_dir):
-    files = []
-    for pattern in LOG_PATTERNS:
-        files.extend(glob.glob(os.path.join(logs_dir, pattern)))
+    """(kind, day_t0, path, mtime, size) for every legacy log, in one directory pass."""
     records = []
-    for path in files:
-        name = os.path.basename(path)
-        match = LOG_NAME_RE.match(name)
-        if not match:
-            continue
-        kind = match.group(1)
-        day_t0 = int(match.group(2))
-        records.append((kind, day_t0, os.path.abspath(path)))
+    with os.scandir(logs_dir) as entries:
+        for entry in entries:
+            match = LOG_NAME_RE.match(entry.name)
+            if not match or not entry.is_file():
+                continue
+            stat = entry.stat()
+            records.append(
+                (
+                    match.group(1),
+                    int(match.group(2)),
+                    os.path.abspath(entry.path),
+                    int(stat.st_mtime),
+                    int(stat.st_size),
+                )
+            )
     return sorted(records, key=lambda x: x[2])
 
 
-def _needs_import(conn, source_path, force):
-    stat = os.stat(source_path)
-    mtime = int(stat.st_mtime)
-    size = int(stat.st_size)
-    if force:
-        return True, mtime, size
+def _load_import_state(conn):
+    rows = conn.execute("SELECT source_path, mtime, size FROM legacy_import_state").fetchall()
+    return {r["source_path"]: (int(r["mtime"]), int(r["size"])) for r in rows}
 
-    row = conn.execute(
-        "SELECT mtime, size FROM legacy_import_state WHERE source_path = ?",
-        (source_path,),
-    ).fetchone()
-    if row is None:
-        return True, mtime, size
-    return (int(row["mtime"]) != mtime or int(row["size"]) != size), mtime, size
+
+def _legacy_logs_fingerprint(logs_dir):
+    # Only the legacy log entries count: the DB and its -wal/-shm/-journal
+    # files usually live in logs/ too and touch the directory mtime on every
+    # connect and checkpoint.
+    files = 0
+    mtime_ns = 0
+    with os.scandir(logs_dir) as entries:
+        for entry in entries:
+            if LOG_NAME_RE.match(entry.name) and entry.is_file():
+                files += 1
+                mtime_ns = max(mtime_ns, entry.stat().st_mtime_ns)
+    return {"dir": os.path.abspath(logs_dir), "files": files, "mtime_ns": mtime_ns}
 
 
 def _mark_imported(conn, source_path, mtime, size):
@@ -270,35 +1580,27 @@ def _mark_imported(conn, source_path, mtime, size):
 
 def _clear_imported_rows(conn, kind, source_path):
     if kind == "window":
-        conn.execute("DELETE FROM window_events WHERE source_path = ?", (source_path,))
+        conn.execute("DELETE FROM window_spans WHERE source_path = ?", (source_path,))
     elif kind == "keyfreq":
-        conn.execute("DELETE FROM keyfreq_events WHERE source_path = ?", (source_path,))
+        conn.execute("DELETE FROM keyfreq_blocks WHERE source_path = ?", (source_path,))
     elif kind == "notes":
         conn.execute("DELETE FROM notes_events WHERE source_path = ?", (source_path,))
     elif kind == "blog":
         conn.execute("DELETE FROM blog_entries WHERE source_path = ?", (source_path,))
 
 
-def _import_legacy_event_file(conn, kind, day_t0, source_path):
+def _parse_legacy_file(kind, day_t0, source_path):
+    """
+    Reads one legacy log file. Runs in backfill worker processes, so it only
+    touches the file: returns (post, 0) for blog files and ([(t, value)],
+    malformed_line_count) for the others.
+    """
     day_t1 = day_t0 + 86400
-    inserted = 0
     malformed = 0
 
     if kind == "blog":
         with open(source_path, "r", encoding="utf-8", errors="replace") as f:
-            post = f.read()
-        conn.execute(
-            """
-            INSERT INTO blog_entries(day_t0, post, updated_at, source_path)
-            VALUES(?, ?, ?, ?)
-            ON CONFLICT(day_t0) DO UPDATE SET
-                post = excluded.post,
-                updated_at = excluded.updated_at,
-                source_path = excluded.source_path
-            """,
-            (day_t0, post, int(time.time()), source_path),
-        )
-        return 1, 0
+            return f.read(), 0
 
     rows = []
     with open(source_path, "r", encoding="utf-8", errors="replace") as f:
@@ -332,31 +1634,100 @@ def _import_legacy_event_file(conn, kind, day_t0, source_path):
                 value = _sanitize_text(value_raw)
                 if not value:
                     continue
-            rows.append((stamp, day_t0, value, source_path))
+            rows.append((stamp, value))
+    return rows, malformed
 
-    if not rows:
-        return 0, malformed
 
-    if kind == "window":
-        conn.executemany(
-            "INSERT INTO window_events(t, day_t0, s, source_path) VALUES(?, ?, ?, ?)",
-            rows,
+def _insert_parsed_file(conn, kind, day_t0, source_path, parsed):
+    if kind == "blog":
+        conn.execute(
+            """
+            INSERT INTO blog_entries(day_t0, post, updated_at, source_path)
+            VALUES(?, ?, ?, ?)
+            ON CONFLICT(day_t0) DO UPDATE SET
+                post = excluded.post,
+                updated_at = excluded.updated_at,
+                source_path = excluded.source_path
+            """,
+            (day_t0, parsed, int(time.time()), source_path),
         )
-    elif kind == "keyfreq":
+        return 1
+
+    if not parsed:
+        return 0
+
+    if kind == "window":
+        points = sorted(((stamp, _title_id(conn, value)) for stamp, value in parsed), key=lambda p: p[0])
+        spans = _spans_from_points(points)
         conn.executemany(
-            "INSERT INTO keyfreq_events(t, day_t0, s, source_path) VALUES(?, ?, ?, ?)",
-            rows,
+            "INSERT INTO window_spans(day_t0, start_t, end_t, title_id, source_path) VALUES(?, ?, ?, ?, ?)",
+            [(day_t0, start, end, title_id, source_path) for start, end, title_id in spans],
         )
-    elif kind == "notes":
+        metrics.inc("prolific_storage_rows_written_total", len(spans), table="window_spans")
+        return len(parsed)
+
+    if kind == "keyfreq":
+        _insert_keyfreq_block(conn, day_t0, sorted(parsed, key=lambda sample: sample[0]), source_path)
+        metrics.inc("prolific_storage_rows_written_total", len(parsed), table="keyfreq_blocks")
+        return len(parsed)
+
+    metrics.inc("prolific_storage_rows_written_total", len(parsed), table=f"{kind}_events")
+    if kind == "notes":
         conn.executemany(
             "INSERT INTO notes_events(t, day_t0, s, source_path) VALUES(?, ?, ?, ?)",
-            rows,
+            [(stamp, day_t0, value, source_path) for stamp, value in parsed],
         )
-    inserted = len(rows)
-    return inserted, malformed
-
-
-def backfill_from_legacy_logs(force=False):
+    return len(parsed)
+
+
+def _backfill_workers():
+    try:
+        configured = int(os.environ.get("PROLIFIC_BACKFILL_WORKERS", "0"))
+    except ValueError:
+        configured = 0
+    if configured > 0:
+        return configured
+    return min(BACKFILL_MAX_WORKERS, os.cpu_count() or 1)
+
+
+def _iter_parsed_files(pending, workers):
+    """Yields _parse_legacy_file() results in the order of pending."""
+    if workers <= 1 or len(pending) < BACKFILL_PARALLEL_MIN_FILES:
+        for kind, day_t0, source_path, _, _ in pending:
+            yield _parse_legacy_file(kind, day_t0, source_path)
+        return
+
+    # Keep only a few files per worker in flight so parsed rows never pile
+    # up far ahead of the writer.
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        for kind, day_t0, source_path, _, _ in pending:
+            in_flight.append(pool.submit(_parse_legacy_file, kind, day_t0, source_path))
+            if len(in_flight) >= workers * 4:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+@_instrumented
+def backfill_from_legacy_logs(
+    force=False, workers=None, chunk_rows=BACKFILL_CHUNK_ROWS, progress=None
+):
+    """
+    Imports legacy window_/keyfreq_/notes_/blog_*.txt files that are new or
+    changed since their last import (all of them with force=True).
+
+    Unless forced, this returns early when the legacy logs have the same
+    count and newest mtime as at the last completed backfill, without
+    loading the import state. force=True re-imports everything.
+
+    Files are parsed in a process pool and written in transactions of about
+    chunk_rows rows, releasing the write lock in between so the collector
+    is never stalled for the whole import. A file is only marked imported in
+    the transaction that inserts its rows, so an interrupted run resumes
+    where it stopped. progress, if given, is called after each transaction
+    as progress(files_done, files_total, rows_inserted).
+    """
     init_db()
     logs_dir = get_logs_dir()
     os.makedirs(logs_dir, exist_ok=True)
@@ -368,24 +1739,48 @@ def backfill_from_legacy_logs(force=False):
         "rows_malformed": 0,
     }
 
-    records = _legacy_file_records(logs_dir)
-    if not records:
-        return summary
+    # Taken before listing, so a file added or changed mid-scan changes it
+    # again and is picked up by the next call.
+    fingerprint = _legacy_logs_fingerprint(logs_dir)
+    with _read_connection() as conn:
+        stored = json.loads(_get_meta(conn, LEGACY_FINGERPRINT_KEY, "{}"))
+        if not force and stored == fingerprint:
+            summary["files_seen"] = fingerprint["files"]
+            return summary
+        imported = {} if force else _load_import_state(conn)
 
-    with _WRITE_LOCK:
-        with _connect() as conn:
-            for kind, day_t0, source_path in records:
-                summary["files_seen"] += 1
-                should_import, mtime, size = _needs_import(conn, source_path, force=force)
-                if not should_import:
-                    continue
+    records = _legacy_file_records(logs_dir)
+    summary["files_seen"] = len(records)
+    pending = [r for r in records if imported.get(r[2]) != (r[3], r[4])]
 
+    def write_chunk(chunk):
+        with _write_transaction() as conn:
+            for (kind, day_t0, source_path, mtime, size), (parsed, malformed) in chunk:
                 _clear_imported_rows(conn, kind, source_path)
-                inserted, malformed = _import_legacy_event_file(conn, kind, day_t0, source_path)
+                inserted = _insert_parsed_file(conn, kind, day_t0, source_path, parsed)
                 _mark_imported(conn, source_path, mtime, size)
-
+                _recount_days(conn, [day_t0])
+                _bump_day_revision(conn, day_t0)
                 summary["files_imported"] += 1
                 summary["rows_inserted"] += int(inserted)
                 summary["rows_malformed"] += int(malformed)
-
+        if progress is not None:
+            progress(summary["files_imported"], len(pending), summary["rows_inserted"])
+
+    if workers is None:
+        workers = _backfill_workers()
+    chunk = []
+    chunk_size = 0
+    for record, result in zip(pending, _iter_parsed_files(pending, workers)):
+        chunk.append((record, result))
+        chunk_size += len(result[0]) if record[0] != "blog" else 1
+        if chunk_size >= chunk_rows:
+            write_chunk(chunk)
+            chunk = []
+            chunk_size = 0
+    if chunk:
+        write_chunk(chunk)
+
+    with _write_transaction() as conn:
+        _set_meta(conn, LEGACY_FINGERPRINT_KEY, json.dumps(fingerprint))
     return summary
@@ -0,0 +1,86 @@
+import json
+
+import analytics
+
+
+def _window(t, s):
+    return {"t": t, "s": s}
+
+
+def test_category_seconds_matches_overview_stat_events():
+    ew = analytics.map_events(
+        [
+            _window(0, "main.py - Visual Studio Code"),
+            _window(100, "GitHub - Google Chrome"),
+            _window(160, "notes.md - Visual Studio Code"),
+            _window(400, "Mystery App"),
+            _window(500, "__IDLE__ (idle)"),
+        ]
+    )
+    assert [e["m"] for e in ew] == ["VSCode", "Research", "VSCode", "MISC", "Idle"]
+
+    # Like statEvents in overview_app.js, the first interval of a category
+    # only registers it and the last event has no duration.
+    assert analytics.category_seconds(ew) == {"VSCode": 240, "Research": 0, "MISC": 0, "Idle": 0}
+    assert analytics.misc_title_stats(ew) == {"Mystery App": [100, 1]}
+
+
+def test_hacking_session_detected_and_closed():
+    ew = analytics.map_events(
+        [_window(0, "main.py - Visual Studio Code"), _window(500, "YouTube"), _window(1000, "YouTube")]
+    )
+    ek = [{"t": 9 * (i + 1), "s": 10} for i in range(40)]
+    ek += [{"t": 500 + 9 * (i + 1), "s": 0} for i in range(12)]
+
+    key_stats = analytics.compute_key_stats(ew, ek)
+    assert key_stats["VSCode"] == {"f": 400, "n": 40}
+
+    hacking = analytics.compute_hacking_stats(ew, ek)
+    [session] = hacking["events"]
+    assert session["t0"] == 9 * 16
+    assert session["t1"] == 500 + 9 * 11
+    assert hacking["total_hacking_keys"] == 250
+    assert hacking["total_hacking_time"] == session["dt"]
+
+
+
+def test_zero_length_hacking_session_gets_json_safe_intensity():
+    # Repeated key timestamps can close a session at its start time, where
+    # computeHackingStats divides by zero.
+    ew = analytics.map_events([_window(0, "main.py - Visual Studio Code"), _window(100, "YouTube")])
+    ek = [{"t": t, "s": 10} for t in range(1, 17)]
+    ek += [{"t": 16, "s": 0} for _ in range(11)]
+
+    [session] = analytics.compute_hacking_stats(ew, ek)["events"]
+    assert (session["t0"], session["t1"], session["dt"]) == (16, 16, 0)
+    assert session["ftotal"] == 10
+    assert session["intensity"] == 0.0
+    json.dumps(session, allow_nan=False)
+
+def test_focus_tax_matches_day_app():
+    ew = analytics.stat_events(
+        analytics.map_events(
+            [
+                _window(0, "main.py - Visual Studio Code"),
+                _window(100, "GitHub - Google Chrome"),
+                _window(160, "notes.md - Visual Studio Code"),
+                _window(400, "__IDLE__ (idle)"),
+                _window(2000, "main.py - Visual Studio Code"),
+            ]
+        )
+    )
+    assert [e["dt"] for e in ew] == [100, 60, 240, 1600, 1]
+
+    # Idle is left out; two switches between deep categories, the second
+    # right after the first: (30 + 15 + 9 + 20) + (30 + 9 + 36 + 20 + 15).
+    focus = analytics.compute_focus_tax_stats(ew)
+    assert focus == {
+        "active_seconds": 401,
+        "tax_seconds": 184,
+        "tax_pct": 100.0 * 184 / 401,
+        "coherence": 39,
+        "switches": 2,
+        "short_hops": 3,
+        "deep_blocks": 0,
+    }
+    assert analytics.compute_focus_tax_stats([])["coherence"] == 100
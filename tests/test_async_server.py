@@ -0,0 +1,164 @@
+import asyncio
+import gzip
+import http.client
+import importlib
+import json
+import threading
+import time
+
+import pytest
+
+import storage
+
+
+@pytest.fixture
+def async_server(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROLIFIC_LOG_DIR", str(tmp_path / "logs"))
+    monkeypatch.setenv("PROLIFIC_DB_PATH", str(tmp_path / "logs" / "prolific.db"))
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "render").mkdir()
+    storage.init_db()
+
+    import async_server
+    import server
+
+    importlib.reload(server)
+    importlib.reload(async_server)
+    loop = asyncio.new_event_loop()
+    httpd = async_server.AsyncServer(str(tmp_path / "render"), max_in_flight=2, workers=2)
+    port = loop.run_until_complete(httpd.start("127.0.0.1", 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        yield port, async_server, tmp_path / "render"
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.run_until_complete(httpd.close())
+        loop.close()
+
+
+def test_keep_alive_serves_api_and_static_files_on_one_connection(async_server):
+    import server
+
+    port, _, render = async_server
+    day_t0 = storage.rewindTime(1736550100)
+    storage.insert_window_event(day_t0 + 10, "VSCode")
+    (render / "day.html").write_text("<html>day</html>", encoding="utf-8")
+    doc = {"days": [{"t0": t0, "title": "x" * 40} for t0 in range(200)]}
+    (render / "overview.json").write_text(json.dumps(doc), encoding="utf-8")
+
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    try:
+        conn.request("GET", f"/api/day/{day_t0}")
+        resp = conn.getresponse()
+        assert resp.status == 200
+        assert resp.getheader("Connection") == "keep-alive"
+        assert json.loads(resp.read())["window_events"] == [{"t": day_t0 + 10, "s": "VSCode"}]
+        sock = conn.sock
+
+        conn.request("GET", f"/api/day/{day_t0}", headers={"If-None-Match": resp.getheader("ETag")})
+        resp = conn.getresponse()
+        assert resp.status == 304
+        assert resp.read() == b""
+
+        conn.request("GET", "/day.html")
+        resp = conn.getresponse()
+        assert resp.status == 200
+        assert resp.read() == b"<html>day</html>"
+
+        conn.request("GET", "/overview.json", headers={"Accept-Encoding": "gzip"})
+        resp = conn.getresponse()
+        assert resp.getheader("Content-Encoding") == "gzip"
+        assert resp.getheader("Cache-Control") == "no-cache"
+        assert json.loads(gzip.decompress(resp.read())) == doc
+
+        note = json.dumps({"note": "async note", "time": day_t0 + 5})
+        conn.request("POST", "/addnote", body=note, headers={"Content-Type": "application/json"})
+        resp = conn.getresponse()
+        assert resp.status == 202
+        job = json.loads(resp.read())
+        assert server.REFRESH_JOBS.wait(job["id"], timeout=10)["state"] == "done"
+
+        conn.request("GET", "/api/days?fields=window,notes")
+        resp = conn.getresponse()
+        assert resp.getheader("Transfer-Encoding") == "chunked"
+        [line] = [json.loads(line) for line in resp.read().splitlines()]
+        assert line == {
+            "t0": day_t0,
+            "window_events": [{"t": day_t0 + 10, "s": "VSCode"}],
+            "notes_events": [{"t": day_t0 + 5, "s": "async note"}],
+        }
+
+        conn.request("GET", "/../logs/prolific.db")
+        resp = conn.getresponse()
+        assert resp.status == 404
+        resp.read()
+        assert conn.sock is sock
+    finally:
+        conn.close()
+
+    assert [e["s"] for e in storage.fetch_notes_events(day_t0)] == ["async note"]
+
+
+def test_requests_over_the_limit_get_503(async_server, monkeypatch):
+    port, async_server_module, _ = async_server
+    import server
+
+    release = threading.Event()
+
+    def slow_get(raw_path, if_none_match=None):
+        release.wait(5)
+        return server.text_response(200, "slow")
+
+    monkeypatch.setattr(server, "handle_get", slow_get)
+    monkeypatch.setattr(async_server_module, "QUEUE_TIMEOUT_SECONDS", 0.2)
+
+    results = []
+
+    def fetch():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        try:
+            conn.request("GET", "/api/day/1")
+            resp = conn.getresponse()
+            results.append((resp.status, resp.getheader("Retry-After")))
+            resp.read()
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=fetch) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    threads[-1].join(5)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert sorted(results) == [(200, None), (200, None), (503, "1")]
+
+
+def test_close_ends_idle_keep_alive_connections_quietly(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROLIFIC_LOG_DIR", str(tmp_path / "logs"))
+    monkeypatch.setenv("PROLIFIC_DB_PATH", str(tmp_path / "logs" / "prolific.db"))
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "render").mkdir()
+    storage.init_db()
+    import async_server
+
+    errors = []
+
+    async def main():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+        httpd = async_server.AsyncServer(str(tmp_path / "render"))
+        port = await httpd.start("127.0.0.1", 0)
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /missing HTTP/1.1\r\nHost: x\r\n\r\n")
+        await reader.readuntil(b"\r\n\r\n")
+        await httpd.close()
+        assert (await reader.read()).endswith(b"File not found")  # read to EOF
+        writer.close()
+        await asyncio.sleep(0.05)
+
+    asyncio.run(main())
+    assert errors == []
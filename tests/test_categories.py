@@ -0,0 +1,67 @@
+import json
+import re
+
+import categories
+
+TITLES = [
+    "main.py - Visual Studio Code (Code.exe)",
+    "GitHub - Google Chrome (chrome.exe)",
+    "Inbox - Outlook (OUTLOOK.EXE)",
+    "Budget.xlsx - Excel (EXCEL.EXE)",
+    "Notebook - Jupyter - Brave (brave.exe)",
+    "X (twitter) - Firefox (firefox.exe)",
+    "__IDLE__ (idle)",
+    "__idle__ lowercase does not match",
+    "",
+]
+
+
+def _linear_mapwin(rules, title):
+    mapped = categories.DEFAULT_CATEGORY
+    for pattern, flags, mapto in rules:
+        if re.search(pattern, title, re.I if "i" in flags else 0):
+            mapped = mapto
+    return mapped
+
+
+def test_engine_matches_linear_last_match_wins_scan():
+    with open(categories.RULES_PATH, "r", encoding="utf-8") as f:
+        rules, hacking, passive = categories._rules_from_document(json.load(f))
+    engine = categories.CategoryEngine(rules, hacking, passive)
+
+    for title in TITLES:
+        assert engine.categorize(title) == _linear_mapwin(rules, title)
+    assert engine.categorize("Notebook - Jupyter - Brave (brave.exe)") == "OneNote"
+    assert engine.cache_size() == len(TITLES)
+
+
+def test_rule_update_drops_only_affected_titles():
+    rules = [("Chrome", "i", "Browser"), ("Code", "", "VSCode")]
+    engine = categories.CategoryEngine(rules)
+    for title in ["Chrome", "Code", "Spotify", "Spotify Code"]:
+        engine.categorize(title)
+
+    dropped = engine.update(rules + [("Spotify", "i", "Media")])
+    assert dropped == 2
+    assert engine.categorize("Spotify") == "Media"
+    assert engine.categorize("Spotify Code") == "Media"
+    assert engine.categorize("Code") == "VSCode"
+
+    # Reordering surviving rules can change any winner, so everything goes.
+    assert engine.update([("Code", "", "VSCode"), ("Chrome", "i", "Browser")]) == 4
+
+
+def test_answer_computed_under_replaced_rules_is_not_cached():
+    engine = categories.CategoryEngine([("Chrome", "i", "Browser")])
+    real_regex = engine._rule_set.regex
+
+    class SwapRulesMidCall:
+        def match(self, title):
+            engine.update([("Code", "", "VSCode")])
+            return real_regex.match(title)
+
+    engine._rule_set = engine._rule_set._replace(regex=SwapRulesMidCall())
+    assert engine.categorize("Chrome") == "Browser"
+    assert engine.cache_size() == 0
+    assert engine.categorize("Chrome") == categories.DEFAULT_CATEGORY
+    assert engine.version == categories.CategoryEngine([("Code", "", "VSCode")]).version
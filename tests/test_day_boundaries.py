@@ -0,0 +1,58 @@
+import random
+import time
+
+import pytest
+
+import day_boundaries
+from rewind7am import rewindTime
+
+pytestmark = pytest.mark.skipif(not hasattr(time, "tzset"), reason="needs time.tzset")
+
+
+@pytest.fixture
+def local_tz(monkeypatch):
+    def use(name):
+        monkeypatch.setenv("TZ", name)
+        time.tzset()
+
+    yield use
+    monkeypatch.undo()
+    time.tzset()
+
+
+# (zone, a timestamp shortly before a DST change there)
+DST_CASES = [
+    ("America/New_York", 1710054000),  # 2024-03-10 spring forward
+    ("America/New_York", 1730613600),  # 2024-11-03 fall back
+    ("Europe/London", 1711846800),  # 2024-03-31
+    ("Europe/London", 1729990800),  # 2024-10-27
+    ("Australia/Sydney", 1712412000),  # 2024-04-07
+    ("Asia/Manila", 1736550100),  # no DST
+]
+
+
+@pytest.mark.parametrize("zone,around", DST_CASES)
+def test_rewind_matches_rewind_time_across_dst(local_tz, zone, around):
+    local_tz(zone)
+    stamps = list(range(around - 3 * 86400, around + 3 * 86400, 600))
+    stamps += [rewindTime(t) + d for t in stamps[::12] for d in (-1, 0, 1)]
+
+    expected = [rewindTime(t) for t in stamps]
+    assert [day_boundaries.rewind(t) for t in stamps] == expected
+    assert day_boundaries.rewind_many(stamps) == expected
+
+
+def test_rewind_many_random_years_and_timezone_switch(local_tz):
+    rng = random.Random(7)
+    stamps = [rng.randrange(0, 2_000_000_000) for _ in range(2000)]
+    for zone in ("America/Los_Angeles", "Europe/Berlin"):
+        local_tz(zone)
+        assert day_boundaries.rewind_many(stamps) == [rewindTime(t) for t in stamps]
+    assert day_boundaries.rewind_many([]) == []
+
+
+def test_rewind_rejects_invalid_timestamps():
+    with pytest.raises(ValueError):
+        day_boundaries.rewind(-1)
+    with pytest.raises(ValueError):
+        day_boundaries.rewind_many([10, "x"])
@@ -2,6 +2,8 @@ import importlib
 import json
 from pathlib import Path
 
+import storage
+
 
 def _write(path: Path, content: str):
     path.parent.mkdir(parents=True, exist_ok=True)
@@ -16,7 +18,8 @@ def test_update_events_exports_clean_daily_payload(tmp_path, monkeypatch):
 
     monkeypatch.setenv("PROLIFIC_LOG_DIR", str(logs_dir))
     monkeypatch.setenv("PROLIFIC_DB_PATH", str(db_path))
-    monkeypatch.setenv("PROLIFIC_MAX_WINDOW_ACTIVE_GAP_SECONDS", "60")
+    # Read from PROLIFIC_MAX_WINDOW_ACTIVE_GAP_SECONDS when storage is imported.
+    monkeypatch.setattr(storage, "MAX_WINDOW_ACTIVE_GAP_SECONDS", 60)
     monkeypatch.chdir(tmp_path)
 
     _write(
@@ -78,3 +81,196 @@ def test_update_events_exports_clean_daily_payload(tmp_path, monkeypatch):
 
     export_list = json.loads((tmp_path / "render" / "export_list.json").read_text(encoding="utf-8"))
     assert export_list == [{"t0": day_t0, "t1": day_t1, "fname": f"events_{day_t0}.json"}]
+
+    overview = json.loads((tmp_path / "render" / "overview.json").read_text(encoding="utf-8"))
+    [day] = overview["days"]
+    assert day["t0"] == day_t0 and day["fname"] == f"events_{day_t0}.json"
+    assert day["total_keys"] == 7
+    assert sum(day["key_bins"]) == 7
+    assert set(day["category_seconds"]) == {"MISC", "Idle"}
+
+
+def test_update_events_rewrites_only_changed_days(tmp_path, monkeypatch):
+    logs_dir = tmp_path / "logs"
+    db_path = logs_dir / "prolific.db"
+    day_a = 1000
+    day_b = day_a + 86400
+
+    monkeypatch.setenv("PROLIFIC_LOG_DIR", str(logs_dir))
+    monkeypatch.setenv("PROLIFIC_DB_PATH", str(db_path))
+    monkeypatch.chdir(tmp_path)
+
+    _write(logs_dir / f"window_{day_a}.txt", f"{day_a + 1} VSCode\n")
+    _write(logs_dir / f"window_{day_b}.txt", f"{day_b + 1} Browser\n")
+
+    import export_events
+    import storage
+
+    importlib.reload(export_events)
+    first = export_events.updateEvents()
+    assert first == {"days_total": 2, "days_written": 2}
+
+    second = export_events.updateEvents()
+    assert second == {"days_total": 2, "days_written": 0}
+
+    storage.upsert_blog_entry(day_b, "only day b changed")
+    third = export_events.updateEvents()
+    assert third == {"days_total": 2, "days_written": 1}
+
+    payload = json.loads((tmp_path / "render" / f"events_{day_b}.json").read_text(encoding="utf-8"))
+    assert payload["blog"] == "only day b changed"
+
+    (tmp_path / "render" / f"events_{day_a}.json").unlink()
+    assert export_events.updateEvents()["days_written"] == 1
+
+    assert export_events.updateEvents(full=True)["days_written"] == 2
+
+    export_list = json.loads((tmp_path / "render" / "export_list.json").read_text(encoding="utf-8"))
+    assert [e["t0"] for e in export_list] == [day_a, day_b]
+
+
+def test_update_events_writes_v2_columnar_export(tmp_path, monkeypatch):
+    logs_dir = tmp_path / "logs"
+    day_t0 = 1000
+    title = "main.py - prolific - Visual Studio Code"
+
+    monkeypatch.setenv("PROLIFIC_LOG_DIR", str(logs_dir))
+    monkeypatch.setenv("PROLIFIC_DB_PATH", str(logs_dir / "prolific.db"))
+    monkeypatch.chdir(tmp_path)
+
+    _write(
+        logs_dir / f"window_{day_t0}.txt",
+        "".join(f"{day_t0 + 10 * k} {title if k % 2 else 'Browser'}\n" for k in range(50)),
+    )
+    _write(logs_dir / f"keyfreq_{day_t0}.txt", f"{day_t0 + 3} 7\n{day_t0 + 9} 2\n")
+    _write(logs_dir / f"notes_{day_t0}.txt", f"{day_t0 + 5} {title}\n")
+
+    import export_events
+
+    importlib.reload(export_events)
+    export_events.updateEvents(v2=True)
+
+    render = tmp_path / "render"
+    v1 = json.loads((render / f"events_{day_t0}.json").read_text(encoding="utf-8"))
+    v2_text = (render / f"events_{day_t0}.v2.json").read_text(encoding="utf-8")
+    v2 = json.loads(v2_text)
+
+    assert v2["format"] == 2
+    assert v2["strings"].count(title) == 1
+    assert v2["keyfreq_events"] == {"dt": [3, 6], "s": [7, 2]}
+    assert export_events.decode_day_payload_v2(v2) == v1
+    assert len(v2_text) * 3 < len((render / f"events_{day_t0}.json").read_text(encoding="utf-8"))
+
+    export_list = json.loads((render / "export_list.json").read_text(encoding="utf-8"))
+    assert export_list[0]["formats"] == {
+        "1": f"events_{day_t0}.json",
+        "2": f"events_{day_t0}.v2.json",
+    }
+
+
+def test_range_read_export_matches_per_day_payloads(tmp_path, monkeypatch):
+    logs_dir = tmp_path / "logs"
+    monkeypatch.setenv("PROLIFIC_LOG_DIR", str(logs_dir))
+    monkeypatch.setenv("PROLIFIC_DB_PATH", str(logs_dir / "prolific.db"))
+    monkeypatch.chdir(tmp_path)
+
+    import export_events
+
+    importlib.reload(export_events)
+    days = [1000 + 86400 * k for k in range(export_events.RANGE_READ_MIN_DAYS + 2)]
+    for k, day_t0 in enumerate(days):
+        # Leave gaps so some streams have no rows for some days.
+        if k % 2 == 0:
+            _write(logs_dir / f"window_{day_t0}.txt", f"{day_t0 + 5} Editor\n{day_t0 + 9} Browser\n")
+        if k % 3 == 0:
+            _write(logs_dir / f"keyfreq_{day_t0}.txt", f"{day_t0 + 6} {k}\n")
+        if k % 4 == 1:
+            _write(logs_dir / f"notes_{day_t0}.txt", f"{day_t0 + 7} note {k}\n")
+        if k % 5 == 2:
+            _write(logs_dir / f"blog_{day_t0}.txt", f"blog {k}")
+
+    summary = export_events.updateEvents()
+    assert summary["days_written"] == summary["days_total"]
+    for t0 in export_events.list_day_timestamps():
+        written = json.loads((tmp_path / "render" / f"events_{t0}.json").read_text(encoding="utf-8"))
+        assert written == export_events.build_day_payload(t0)
+
+
+def test_write_json_streams_and_skips_unchanged_files(tmp_path, monkeypatch):
+    import gzip
+
+    import export_events
+
+    monkeypatch.setattr(export_events, "JSON_CHUNK_ITEMS", 3)
+    payload = {
+        "window_events": [{"t": t, "s": f"title {t} é"} for t in range(10)],
+        "keyfreq_events": [],
+        "v2": {"dt": list(range(7)), "s": [0] * 7},
+        "blog": "post",
+    }
+    for separators in (None, (",", ":")):
+        expected = json.dumps(payload, ensure_ascii=False, separators=separators)
+        assert "".join(export_events._iter_json(payload, separators)) == expected
+
+    path = tmp_path / "events_1.json"
+    assert export_events._write_json(str(path), payload) is True
+    assert json.loads(path.read_text(encoding="utf-8")) == payload
+    assert gzip.decompress((tmp_path / "events_1.json.gz").read_bytes()) == path.read_bytes()
+    stamp = path.stat().st_mtime_ns
+
+    # The payload is encoded once per write (_iter_json also recurses), and
+    # unchanged content is never compressed or replaced.
+    encoded = []
+    real_iter_json = export_events._iter_json
+
+    def counting_iter_json(*args, **kwargs):
+        encoded.append(args[0])
+        return real_iter_json(*args, **kwargs)
+
+    with monkeypatch.context() as m:
+        m.setattr(export_events, "_iter_json", counting_iter_json)
+        m.setattr(gzip, "GzipFile", None)
+        assert export_events._write_json(str(path), payload) is False
+    assert sum(obj is payload for obj in encoded) == 1
+    assert path.stat().st_mtime_ns == stamp
+
+    payload["blog"] = "edited"
+    encoded.clear()
+    with monkeypatch.context() as m:
+        m.setattr(export_events, "_iter_json", counting_iter_json)
+        assert export_events._write_json(str(path), payload) is True
+    assert sum(obj is payload for obj in encoded) == 1
+    assert json.loads(path.read_text(encoding="utf-8"))["blog"] == "edited"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["events_1.json", "events_1.json.gz"]
+
+
+def test_lowered_idle_gap_splits_spans_and_keeps_inferred_idle(tmp_path, monkeypatch):
+    import export_events
+
+    monkeypatch.setenv("PROLIFIC_DB_PATH", str(tmp_path / "prolific.db"))
+    storage.init_db()
+    day_t0 = storage.rewindTime(1736550100)
+    with monkeypatch.context() as m:
+        m.setattr(storage, "MAX_WINDOW_ACTIVE_GAP_SECONDS", 300)
+        importlib.reload(export_events)
+        for t in (0, 100, 200, 1000, 1900):
+            storage.insert_window_event(day_t0 + t, "Editor")
+
+        spans = storage.fetch_window_spans(day_t0)
+        assert [(e["start"] - day_t0, e["end"] - day_t0) for e in spans] == [
+            (0, 200),
+            (1000, 1000),
+            (1900, 1900),
+        ]
+        events = export_events.build_day_payload(day_t0)["window_events"]
+        assert [(e["t"] - day_t0, e["s"]) for e in events] == [
+            (0, "Editor"),
+            (200, "Editor"),
+            (500, "__IDLE__"),
+            (1000, "Editor"),
+            (1300, "__IDLE__"),
+            (1900, "Editor"),
+        ]
+        # Long spans expand to points no further apart than the idle gap.
+        assert [p["t"] for p in storage._span_points(0, 700, "Editor")] == [0, 300, 600, 700]
+    importlib.reload(export_events)
@@ -0,0 +1,25 @@
+import pytest
+
+import keyfreq_blocks
+
+
+def test_round_trip_with_zero_runs_and_wide_values():
+    base = 1736550000
+    samples = [(base + 9 * k, 0) for k in range(1, 500)]
+    samples += [(base + 5000, 3), (base + 5000, 4), (base + 5009, 70000), (base + 5010, 0), (base + 5019, 0)]
+    samples += [(base + 90000, 1)]  # gap wider than a uint16
+    data = keyfreq_blocks.pack(samples, base)
+    assert keyfreq_blocks.unpack(data, base) == samples
+    # 499 idle samples collapse into one record.
+    assert len(data) < 60
+
+
+def test_blocks_concatenate_and_clamp():
+    base = 1000
+    head = [(1009, 2), (1018, 0)]
+    tail = [(1018, 5), (1027, -3)]
+    data = keyfreq_blocks.pack(head, base) + keyfreq_blocks.pack(tail, head[-1][0])
+    assert keyfreq_blocks.unpack(data, base) == head + [(1018, 5), (1027, 0)]
+
+    with pytest.raises(ValueError):
+        keyfreq_blocks.pack([(1009, 1), (1000, 1)], base)
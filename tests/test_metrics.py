@@ -0,0 +1,36 @@
+import metrics
+
+
+def test_histograms_and_counters_render_as_prometheus_text():
+    metrics.reset()
+    metrics.observe("prolific_export_day_seconds", 0.003)
+    metrics.observe("prolific_export_day_seconds", 20)
+    metrics.inc("prolific_http_requests_total", method="GET", path="static", status=200)
+    metrics.inc("prolific_http_requests_total", method="GET", path="static", status=200)
+
+    text = metrics.render_prometheus()
+    assert "# TYPE prolific_export_day_seconds histogram" in text
+    assert 'prolific_export_day_seconds_bucket{le="0.005"} 1' in text
+    assert 'prolific_export_day_seconds_bucket{le="10.0"} 1' in text
+    assert 'prolific_export_day_seconds_bucket{le="+Inf"} 2' in text
+    assert "prolific_export_day_seconds_count 2" in text
+    assert 'prolific_http_requests_total{method="GET",path="static",status="200"} 2' in text
+
+    line = metrics.summary_line()
+    assert "export_day[] n=2" in line and "max=20000.0ms" in line
+    metrics.reset()
+    assert metrics.summary_line() == "no metrics yet"
+
+
+def test_timed_records_even_when_the_call_raises():
+    metrics.reset()
+
+    @metrics.timed("prolific_storage_op_seconds", op="boom")
+    def boom():
+        raise RuntimeError("x")
+
+    try:
+        boom()
+    except RuntimeError:
+        pass
+    assert 'prolific_storage_op_seconds_count{op="boom"} 1' in metrics.render_prometheus()
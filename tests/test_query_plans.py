@@ -0,0 +1,153 @@
+"""
+Runs every SQL statement storage.py issues through EXPLAIN QUERY PLAN on a
+populated database and fails on full scans of the event tables, so a new
+query cannot quietly turn into one.
+"""
+
+import ast
+import importlib
+import re
+import sqlite3
+import threading
+from pathlib import Path
+
+import storage
+
+EVENT_TABLES = ("window_events", "window_spans", "keyfreq_events", "keyfreq_blocks", "notes_events", "blog_entries", "window_titles")
+FULL_SCAN_RE = re.compile(r"^SCAN (%s)\b" % "|".join(EVENT_TABLES))
+
+# One-time migrations that read whole tables on purpose.
+ALLOWED_FULL_SCANS = {
+    "days table rebuild": lambda sql: sql.startswith("INSERT INTO days") and "WHERE" not in sql,
+}
+
+DML_RE = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", re.I)
+
+
+def _normalize(sql):
+    return " ".join(sql.split())
+
+
+def _storage_sql_literals():
+    source = Path(storage.__file__).read_text(encoding="utf-8")
+    return {
+        _normalize(node.value)
+        for node in ast.walk(ast.parse(source))
+        if isinstance(node, ast.Constant) and isinstance(node.value, str) and DML_RE.match(node.value)
+    }
+
+
+def _literal_pattern(literal):
+    parts = re.split(r"(\?|\{\w+\})", literal)
+    return re.compile(
+        "".join(".*?" if p == "?" or p.startswith("{") else re.escape(p) for p in parts), re.S
+    )
+
+
+def _write(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content, encoding="utf-8")
+
+
+def _run_workload(tmp_path):
+    logs_dir = tmp_path / "logs"
+    days = [storage.rewindTime(1736550100) + 86400 * k for k in range(12)]
+    for day_t0 in days:
+        _write(logs_dir / f"window_{day_t0}.txt", f"{day_t0 + 5} Editor (code.exe)\n{day_t0 + 9} Web\n")
+        _write(logs_dir / f"keyfreq_{day_t0}.txt", f"{day_t0 + 6} 4\n")
+        _write(logs_dir / f"notes_{day_t0}.txt", f"{day_t0 + 7} legacy note\n")
+        _write(logs_dir / f"blog_{day_t0}.txt", "legacy blog")
+
+    storage.init_db()
+    storage.backfill_from_legacy_logs(workers=1)
+    storage.backfill_from_legacy_logs(force=True, workers=1)
+
+    with sqlite3.connect(storage.get_db_path()) as conn:
+        conn.execute(
+            "INSERT INTO window_events(t, day_t0, s, source_path) VALUES(?, ?, 'Old title', NULL)",
+            (days[0] + 1, days[0]),
+        )
+        conn.execute(
+            "INSERT INTO keyfreq_events(t, day_t0, s, source_path) VALUES(?, ?, 7, NULL)",
+            (days[0] + 2, days[0]),
+        )
+        conn.execute(
+            "DELETE FROM storage_meta WHERE key IN "
+            "('window_titles_migrated', 'window_spans_migrated', 'keyfreq_blocks_migrated')"
+        )
+    storage.migrate_window_titles()
+    storage.migrate_window_spans()
+    storage.migrate_keyfreq_blocks()
+
+    storage.insert_window_event(days[-1] + 100, "Live")
+    storage.insert_window_event(days[-1] + 150, "Live")
+    storage.insert_keyfreq_event(days[-1] + 100, 3)
+    storage.insert_keyfreq_event(days[-1] + 90, 1)
+    storage.insert_note_event("live note", timestamp=days[-1] + 101)
+    storage.upsert_blog_for_timestamp(days[-1] + 102, "live blog")
+    stop_event = threading.Event()
+    writer = storage.EventWriter(stop_event, flush_seconds=60)
+    writer.submit_window_event(days[-1] + 200, "Queued")
+    writer.submit_keyfreq_event(days[-1] + 200, 1)
+    writer.start()
+    stop_event.set()
+    writer.close()
+
+    import export_events
+
+    importlib.reload(export_events)
+    export_events.updateEvents(full=True)
+    storage.upsert_blog_entry(days[3], "changed")
+    export_events.updateEvents()
+    export_events.day_payload_etag(days[3])
+    export_events.day_stats(days[3])
+    export_events.all_day_stats()
+    storage.fetch_day_fingerprint(days[0] - 86400)
+    for kind in ("window", "keyfreq", "notes", "blog"):
+        list(storage.iter_events(kind))
+    storage.fetch_window_spans(days[-1])
+    storage.fetch_rollup_revisions()
+    storage.fetch_daily_rollups()
+    storage.compact_old_days(older_than_days=0, dry_run=True)
+    storage.compact_old_days(older_than_days=0)
+
+
+def test_storage_queries_do_not_scan_event_tables(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROLIFIC_LOG_DIR", str(tmp_path / "logs"))
+    monkeypatch.setenv("PROLIFIC_DB_PATH", str(tmp_path / "logs" / "prolific.db"))
+    monkeypatch.chdir(tmp_path)
+
+    traced = []
+    open_connection = storage._open_connection
+
+    def traced_open(path, readonly=False):
+        conn = open_connection(path, readonly=readonly)
+        conn.set_trace_callback(traced.append)
+        return conn
+
+    storage.close_connections()
+    monkeypatch.setattr(storage, "_open_connection", traced_open)
+    try:
+        _run_workload(tmp_path)
+    finally:
+        storage.close_connections()
+
+    statements = {_normalize(sql) for sql in traced if DML_RE.match(sql)}
+
+    # Every statement written in storage.py must have been exercised above.
+    unexercised = [
+        literal
+        for literal in _storage_sql_literals()
+        if not any(_literal_pattern(literal).fullmatch(sql) for sql in statements)
+    ]
+    assert unexercised == []
+
+    scans = []
+    with sqlite3.connect(storage.get_db_path()) as conn:
+        for sql in sorted(statements):
+            if any(allowed(sql) for allowed in ALLOWED_FULL_SCANS.values()):
+                continue
+            for row in conn.execute("EXPLAIN QUERY PLAN " + sql):
+                if FULL_SCAN_RE.match(row[3]):
+                    scans.append((row[3], sql))
+    assert scans == []
@@ -0,0 +1,47 @@
+import threading
+
+from refresh_jobs import RefreshJobs
+
+
+def test_refresh_jobs_coalesce_into_one_follow_up():
+    gate = threading.Event()
+    started = threading.Event()
+    runs = []
+
+    def run(progress):
+        runs.append(len(runs) + 1)
+        started.set()
+        progress(1, 3, 1)
+        gate.wait(5)
+        return {"days_total": 3, "days_written": 2}
+
+    jobs = RefreshJobs(run)
+    first = jobs.submit()
+    assert started.wait(5)
+
+    second = jobs.submit()
+    third = jobs.submit()
+    assert second["id"] == third["id"] != first["id"]
+    assert third["state"] == "queued" and third["requests"] == 2
+
+    running = jobs.get(first["id"])
+    assert running["state"] == "running"
+    assert (running["days_done"], running["days_total"]) == (1, 3)
+
+    gate.set()
+    done = jobs.wait(second["id"], timeout=5)
+    assert done["state"] == "done"
+    assert done["days_written"] == 2
+    assert jobs.get(first["id"])["state"] == "done"
+    assert runs == [1, 2]
+    assert jobs.get(12345) is None
+
+
+def test_refresh_job_failure_is_reported():
+    def run(progress):
+        raise RuntimeError("disk full")
+
+    jobs = RefreshJobs(run)
+    job = jobs.wait(jobs.submit()["id"], timeout=5)
+    assert job["state"] == "failed"
+    assert job["error"] == "disk full"
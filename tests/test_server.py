@@ -0,0 +1,232 @@
+import http.client
+import importlib
+import json
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import storage
+
+
+@pytest.fixture
+def live_server(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROLIFIC_LOG_DIR", str(tmp_path / "logs"))
+    monkeypatch.setenv("PROLIFIC_DB_PATH", str(tmp_path / "logs" / "prolific.db"))
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "render").mkdir()
+    storage.init_db()
+
+    import server
+
+    importlib.reload(server)
+    handler = partial(server.CustomHandler, directory=str(tmp_path / "render"))
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield httpd.server_address[1]
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def _get(port, path, headers=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    try:
+        conn.request("GET", path, headers=headers or {})
+        resp = conn.getresponse()
+        return resp.status, dict(resp.getheaders()), resp.read()
+    finally:
+        conn.close()
+
+
+def test_api_day_serves_payload_with_etag(live_server):
+    day_t0 = storage.rewindTime(1736550100)
+    storage.insert_window_event(day_t0 + 10, "VSCode")
+    storage.insert_keyfreq_event(day_t0 + 10, 4)
+    storage.upsert_blog_entry(day_t0, "api blog")
+
+    status, headers, body = _get(live_server, f"/api/day/{day_t0}")
+    assert status == 200
+    payload = json.loads(body)
+    assert payload["window_events"] == [{"t": day_t0 + 10, "s": "VSCode"}]
+    assert payload["keyfreq_events"] == [{"t": day_t0 + 10, "s": 4}]
+    assert payload["blog"] == "api blog"
+    etag = headers["ETag"]
+    assert etag.startswith('"')
+
+    status, headers, body = _get(live_server, f"/api/day/{day_t0}", {"If-None-Match": etag})
+    assert status == 304
+    assert body == b""
+
+    storage.insert_note_event("changed", timestamp=day_t0 + 20)
+    status, headers, _ = _get(live_server, f"/api/day/{day_t0}", {"If-None-Match": etag})
+    assert status == 200
+    assert headers["ETag"] != etag
+
+    status, _, _ = _get(live_server, f"/api/day/{day_t0 + 86400}")
+    assert status == 404
+
+
+def test_api_day_v2_format(live_server):
+    day_t0 = storage.rewindTime(1736550100)
+    storage.insert_window_event(day_t0 + 10, "VSCode")
+    storage.insert_window_event(day_t0 + 25, "VSCode")
+
+    status, headers, body = _get(live_server, f"/api/day/{day_t0}?format=v2")
+    assert status == 200
+    payload = json.loads(body)
+    assert payload["format"] == 2
+    assert payload["strings"] == ["VSCode"]
+    assert payload["window_events"] == {"dt": [10, 15], "s": [0, 0]}
+
+    _, plain_headers, _ = _get(live_server, f"/api/day/{day_t0}")
+    assert plain_headers["ETag"] != headers["ETag"]
+
+
+def test_api_day_stats_are_cached_until_the_day_changes(live_server):
+    day_t0 = storage.rewindTime(1736550100)
+    storage.insert_window_event(day_t0 + 10, "main.py - Visual Studio Code")
+    storage.insert_window_event(day_t0 + 100, "YouTube")
+    storage.insert_keyfreq_event(day_t0 + 20, 4)
+
+    status, headers, body = _get(live_server, f"/api/day/{day_t0}/stats")
+    assert status == 200
+    stats = json.loads(body)
+    assert stats["key_stats"] == {"VSCode": {"f": 4, "n": 1}}
+    assert set(stats) == {"hacking_stats", "key_stats", "focus_stats"}
+    [(revision, _, cached)] = storage.fetch_day_stats(day_t0).values()
+    assert cached == stats
+
+    status, _, _ = _get(live_server, f"/api/day/{day_t0}/stats", {"If-None-Match": headers["ETag"]})
+    assert status == 304
+
+    storage.insert_keyfreq_event(day_t0 + 30, 6)
+    status, _, body = _get(live_server, "/api/days/stats")
+    assert status == 200
+    [day] = json.loads(body)["days"]
+    assert day["t0"] == day_t0
+    assert day["key_stats"] == {"VSCode": {"f": 10, "n": 2}}
+    assert storage.fetch_day_stats(day_t0)[day_t0][0] > revision
+
+    status, _, _ = _get(live_server, f"/api/day/{day_t0 + 86400}/stats")
+    assert status == 404
+
+
+def test_api_days_streams_ndjson_per_day(live_server):
+    import export_events
+
+    day_a = storage.rewindTime(1736550100)
+    day_b = day_a + 86400
+    storage.insert_window_event(day_a + 10, "VSCode")
+    storage.insert_keyfreq_event(day_b + 10, 4)
+    storage.upsert_blog_entry(day_b, "day b")
+    export_events.updateEvents()
+
+    status, headers, body = _get(live_server, f"/api/days?from={day_a}&to={day_b}")
+    assert status == 200
+    assert headers["Content-Type"].startswith("application/x-ndjson")
+    assert headers["Transfer-Encoding"] == "chunked"
+    lines = [json.loads(line) for line in body.decode("utf-8").splitlines()]
+    assert [line["t0"] for line in lines] == [day_a, day_b]
+    assert lines[0]["window_events"] == [{"t": day_a + 10, "s": "VSCode"}]
+    assert lines[1]["keyfreq_events"] == [{"t": day_b + 10, "s": 4}]
+    assert lines[1]["blog"] == "day b"
+
+    status, _, body = _get(live_server, f"/api/days?from={day_b}&fields=keyfreq,rollup")
+    [line] = [json.loads(line) for line in body.decode("utf-8").splitlines()]
+    assert set(line) == {"t0", "keyfreq_events", "rollup"}
+    assert line["rollup"]["total_keys"] == 4
+
+    assert _get(live_server, "/api/days?fields=window,bogus")[0] == 400
+    assert _get(live_server, f"/api/days?from={day_b}&to={day_a}")[0] == 400
+    assert _get(live_server, "/api/days?from=yesterday")[0] == 400
+
+
+def test_static_files_are_served_gzipped(live_server, tmp_path):
+    import gzip
+
+    import export_events
+
+    render = tmp_path / "render"
+    doc = {"days": [{"t0": k, "title": "Visual Studio Code"} for k in range(200)]}
+    export_events._write_json(str(render / "overview.json"), doc)
+    (render / "app.js").write_text("function f() { return 1; }\n" * 200, encoding="utf-8")
+
+    status, headers, body = _get(live_server, "/overview.json", {"Accept-Encoding": "gzip"})
+    assert status == 200
+    assert headers["Content-Encoding"] == "gzip"
+    assert headers["Vary"] == "Accept-Encoding"
+    assert int(headers["Content-Length"]) == len(body)
+    assert body == (render / "overview.json.gz").read_bytes()
+    assert json.loads(gzip.decompress(body)) == doc
+
+    status, headers, body = _get(live_server, "/app.js", {"Accept-Encoding": "br, gzip;q=0.8"})
+    assert headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(body) == (render / "app.js").read_bytes()
+    last_modified = headers["Last-Modified"]
+
+    status, _, _ = _get(
+        live_server, "/app.js", {"Accept-Encoding": "gzip", "If-Modified-Since": last_modified}
+    )
+    assert status == 304
+
+    status, headers, body = _get(live_server, "/app.js", {"Accept-Encoding": "gzip;q=0"})
+    assert "Content-Encoding" not in headers
+    assert body == (render / "app.js").read_bytes()
+
+
+def test_refresh_returns_job_and_reports_progress(live_server):
+    import server
+
+    day_t0 = storage.rewindTime(1736550100)
+    storage.insert_window_event(day_t0 + 10, "VSCode")
+
+    conn = http.client.HTTPConnection("127.0.0.1", live_server, timeout=5)
+    try:
+        conn.request(
+            "POST",
+            "/refresh",
+            body="time=0",
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+        )
+        resp = conn.getresponse()
+        assert resp.status == 202
+        job = json.loads(resp.read())
+    finally:
+        conn.close()
+
+    server.REFRESH_JOBS.wait(job["id"], timeout=10)
+    status, _, body = _get(live_server, f"/api/refresh/{job['id']}")
+    assert status == 200
+    report = json.loads(body)
+    assert report["state"] == "done"
+    assert report["days_total"] == report["days_written"] == 1
+
+    status, _, _ = _get(live_server, "/api/refresh/999999")
+    assert status == 404
+
+
+def test_metrics_endpoint_reports_requests_and_storage(live_server):
+    import metrics
+
+    metrics.reset()
+    day_t0 = storage.rewindTime(1736550100)
+    storage.insert_window_event(day_t0 + 10, "VSCode")
+    assert _get(live_server, f"/api/day/{day_t0}")[0] == 200
+
+    # Request metrics are recorded after the response is sent, so allow the
+    # server thread a moment to catch up.
+    for _ in range(50):
+        status, headers, body = _get(live_server, "/metrics")
+        text = body.decode("utf-8")
+        if 'path="/api/day/:t0"' in text:
+            break
+    assert status == 200
+    assert headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    assert 'prolific_http_requests_total{method="GET",path="/api/day/:t0",status="200"} 1' in text
+    assert 'prolific_storage_op_seconds_count{op="insert_window_event"} 1' in text
+    assert 'prolific_storage_rows_written_total{table="window_spans"} 1' in text
+    assert "prolific_storage_write_lock_wait_seconds_count" in text
@@ -1,6 +1,11 @@
 import os
+import sqlite3
+import threading
+import time
 from pathlib import Path
 
+import pytest
+
 import storage
 
 
@@ -86,3 +91,391 @@ def test_legacy_backfill_and_live_writes(tmp_path, monkeypatch):
     assert storage.get_blog_entry(day_t0) == "new blog body"
 
     assert os.path.isfile(db_path)
+
+
+def test_connection_pool_reuses_connections_and_follows_db_path(tmp_path, monkeypatch):
+    first_db = tmp_path / "first.db"
+    second_db = tmp_path / "second.db"
+    monkeypatch.setenv("PROLIFIC_DB_PATH", str(first_db))
+
+    storage.init_db()
+    storage.insert_note_event("first", timestamp=1736550100)
+    with storage._read_connection() as conn:
+        reader = conn
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM notes_events")
+    with storage._read_connection() as conn:
+        assert conn is reader
+
+    monkeypatch.setenv("PROLIFIC_DB_PATH", str(second_db))
+    storage.init_db()
+    assert storage.list_day_timestamps() == []
+
+    storage.close_connections()
+    monkeypatch.setenv("PROLIFIC_DB_PATH", str(first_db))
+    assert [e["s"] for e in storage.fetch_notes_events(storage.rewindTime(1736550100))] == ["first"]
+
+
+def test_event_writer_batches_events_into_one_flush(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROLIFIC_DB_PATH", str(tmp_path / "prolific.db"))
+    storage.init_db()
+    day_t0 = storage.rewindTime(1736550100)
+
+    stop_event = threading.Event()
+    writer = storage.EventWriter(stop_event, flush_seconds=60, batch_size=1000)
+    for i in range(5):
+        writer.submit_window_event(day_t0 + i, f"Window {i}")
+        writer.submit_keyfreq_event(day_t0 + i, i)
+    assert writer.stats()["queue_depth"] == 10
+    assert storage.fetch_window_events(day_t0) == []
+
+    def per_event_rewind(t):
+        raise AssertionError("flush should resolve days in one batch")
+
+    with monkeypatch.context() as m:
+        m.setattr(storage, "rewindTime", per_event_rewind)
+        writer.start()
+        stop_event.set()
+        writer.close()
+
+    stats = writer.stats()
+    assert stats["written"] == 10
+    assert stats["flushes"] == 1
+    assert stats["queue_depth"] == 0
+    assert [e["s"] for e in storage.fetch_window_events(day_t0)] == [f"Window {i}" for i in range(5)]
+    assert [e["s"] for e in storage.fetch_keyfreq_events(day_t0)] == [0, 1, 2, 3, 4]
+
+
+def test_event_writer_bounds_events_held_while_the_database_is_locked(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv("PROLIFIC_DB_PATH", str(tmp_path / "prolific.db"))
+    storage.init_db()
+    day_t0 = storage.rewindTime(1736550100)
+    real_transaction = storage._write_transaction
+    locked = threading.Event()
+    locked.set()
+
+    def flaky_transaction(*args, **kwargs):
+        if locked.is_set():
+            raise sqlite3.OperationalError("database is locked")
+        return real_transaction(*args, **kwargs)
+
+    monkeypatch.setattr(storage, "_write_transaction", flaky_transaction)
+    stop_event = threading.Event()
+    writer = storage.EventWriter(
+        stop_event, flush_seconds=0.01, batch_size=10, max_queue=100, put_timeout=0.001
+    ).start()
+    accepted = sum(writer.submit_keyfreq_event(day_t0 + i, 1) for i in range(500))
+    time.sleep(0.1)
+    accepted += sum(writer.submit_keyfreq_event(day_t0 + 500 + i, 1) for i in range(500))
+
+    stats = writer.stats()
+    assert stats["flush_errors"] > 1
+    assert stats["queue_depth"] == accepted == 100
+    assert stats["dropped"] == 900
+    assert capsys.readouterr().out.count("will retry") == 1
+
+    locked.clear()
+    stop_event.set()
+    writer.close()
+    assert writer.stats()["written"] == 100
+    assert writer.stats()["queue_depth"] == 0
+    assert len(storage.fetch_keyfreq_events(day_t0)) == 100
+
+def test_window_titles_dictionary_and_online_migration(tmp_path, monkeypatch):
+    db_path = tmp_path / "prolific.db"
+    monkeypatch.setenv("PROLIFIC_DB_PATH", str(db_path))
+    day_t0 = storage.rewindTime(1736550100)
+    odd_titles = ["main.py - Code (Code.exe)", "no process", "empty parens ()", "(only) (x) (y.exe)"]
+
+    # Rows written before window_titles existed carry their text in s.
+    storage.init_db()
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO window_events(t, day_t0, s, source_path) VALUES(?, ?, ?, NULL)",
+            [(day_t0 + i, day_t0, title) for i, title in enumerate(odd_titles)],
+        )
+        conn.execute(
+            "DELETE FROM storage_meta WHERE key IN ('window_titles_migrated', 'window_spans_migrated')"
+        )
+
+    assert storage.migrate_window_titles(batch_size=3) == len(odd_titles)
+    assert storage.migrate_window_titles() == 0
+    assert storage.migrate_window_spans() == len(odd_titles)
+    assert [e["s"] for e in storage.fetch_window_events(day_t0)] == odd_titles
+
+    storage.insert_window_event(day_t0 + 10, "main.py - Code (Code.exe)")
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM window_titles").fetchone()[0] == len(odd_titles)
+        assert conn.execute("SELECT COUNT(*) FROM window_events").fetchone()[0] == 0
+        assert conn.execute("SELECT process FROM window_titles WHERE title = 'main.py - Code'").fetchone() == (
+            "Code.exe",
+        )
+    assert storage.fetch_window_events(day_t0)[-1] == {"t": day_t0 + 10, "s": "main.py - Code (Code.exe)"}
+
+
+def test_window_spans_extend_in_place_and_round_trip(tmp_path, monkeypatch):
+    db_path = tmp_path / "prolific.db"
+    monkeypatch.setenv("PROLIFIC_DB_PATH", str(db_path))
+    day_t0 = storage.rewindTime(1736550100)
+    storage.init_db()
+
+    # Old-style rows: heartbeats every 600 s, a title change, then the
+    # collector was off for an hour.
+    old_rows = [(0, "Editor"), (600, "Editor"), (1200, "Editor"), (1250, "Web"), (5000, "Web")]
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO window_events(t, day_t0, s, source_path) VALUES(?, ?, ?, NULL)",
+            [(day_t0 + t, day_t0, title) for t, title in old_rows],
+        )
+        conn.execute("DELETE FROM storage_meta WHERE key = 'window_spans_migrated'")
+    assert storage.migrate_window_spans(batch_size=2) == len(old_rows)
+    assert [(e["start"] - day_t0, e["end"] - day_t0, e["s"]) for e in storage.fetch_window_spans(day_t0)] == [
+        (0, 1200, "Editor"),
+        (1250, 1250, "Web"),
+        (5000, 5000, "Web"),
+    ]
+    assert [(e["t"] - day_t0, e["s"]) for e in storage.fetch_window_events(day_t0)] == old_rows
+
+    # Live samples of the same title move end_t instead of adding rows.
+    stop_event = threading.Event()
+    writer = storage.EventWriter(stop_event, flush_seconds=60)
+    for t in range(5010, 5100, 10):
+        writer.submit_window_event(day_t0 + t, "Web")
+    writer.submit_window_event(day_t0 + 5100, "Editor")
+    writer.start()
+    stop_event.set()
+    writer.close()
+    storage.insert_window_event(day_t0 + 5110, "Editor")
+    spans = storage.fetch_window_spans(day_t0)
+    assert [(e["start"] - day_t0, e["end"] - day_t0, e["s"]) for e in spans[-2:]] == [
+        (5000, 5090, "Web"),
+        (5100, 5110, "Editor"),
+    ]
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT window_count, last_t FROM days").fetchone() == (4, day_t0 + 5110)
+
+
+def test_parallel_backfill_matches_serial_and_commits_in_chunks(tmp_path, monkeypatch):
+    logs_dir = tmp_path / "logs"
+    days = [1736550000 + 86400 * k for k in range(storage.BACKFILL_PARALLEL_MIN_FILES)]
+    for day_t0 in days:
+        _write(
+            logs_dir / f"window_{day_t0}.txt",
+            "".join(f"{day_t0 + k} Title {k % 3}\n" for k in range(30)) + "garbage\n",
+        )
+        _write(logs_dir / f"keyfreq_{day_t0}.txt", f"{day_t0 + 1} 3\n{day_t0 + 2} x\n")
+
+    results = {}
+    for workers in (1, 2):
+        monkeypatch.setenv("PROLIFIC_LOG_DIR", str(logs_dir))
+        monkeypatch.setenv("PROLIFIC_DB_PATH", str(tmp_path / f"w{workers}.db"))
+        calls = []
+        summary = storage.backfill_from_legacy_logs(
+            force=True, workers=workers, chunk_rows=100, progress=lambda *a: calls.append(a)
+        )
+        assert summary == {
+            "files_seen": 2 * len(days),
+            "files_imported": 2 * len(days),
+            "rows_inserted": 31 * len(days),
+            "rows_malformed": 2 * len(days),
+        }
+        assert len(calls) > 1
+        assert calls[-1] == (2 * len(days), 2 * len(days), 31 * len(days))
+        results[workers] = [
+            (storage.fetch_window_events(d), storage.fetch_keyfreq_events(d)) for d in days
+        ]
+
+        again = storage.backfill_from_legacy_logs(workers=workers)
+        assert again["files_imported"] == 0
+
+    assert results[1] == results[2]
+
+
+def test_backfill_short_circuits_on_unchanged_logs_dir(tmp_path, monkeypatch):
+    logs_dir = tmp_path / "logs"
+    day_t0 = 1736550000
+    monkeypatch.setenv("PROLIFIC_LOG_DIR", str(logs_dir))
+    monkeypatch.setenv("PROLIFIC_DB_PATH", str(tmp_path / "prolific.db"))
+    _write(logs_dir / f"window_{day_t0}.txt", f"{day_t0 + 1} VSCode\n")
+
+    assert storage.backfill_from_legacy_logs()["files_imported"] == 1
+
+    def no_scan(logs_dir):
+        raise AssertionError("logs dir was listed")
+
+    with monkeypatch.context() as m:
+        m.setattr(storage, "_legacy_file_records", no_scan)
+        assert storage.backfill_from_legacy_logs() == {
+            "files_seen": 1,
+            "files_imported": 0,
+            "rows_inserted": 0,
+            "rows_malformed": 0,
+        }
+
+    _write(logs_dir / f"window_{day_t0 + 86400}.txt", f"{day_t0 + 86401} Browser\n")
+    summary = storage.backfill_from_legacy_logs()
+    assert (summary["files_seen"], summary["files_imported"]) == (2, 1)
+
+    # Removing a file changes the count even if the newest mtime stays put.
+    os.remove(logs_dir / f"window_{day_t0}.txt")
+    with monkeypatch.context() as m:
+        m.setattr(storage, "_legacy_file_records", no_scan)
+        with pytest.raises(AssertionError, match="listed"):
+            storage.backfill_from_legacy_logs()
+
+
+def test_backfill_short_circuit_ignores_the_database_in_the_logs_dir(tmp_path, monkeypatch):
+    logs_dir = tmp_path / "logs"
+    day_t0 = 1736550000
+    monkeypatch.setenv("PROLIFIC_LOG_DIR", str(logs_dir))
+    monkeypatch.setenv("PROLIFIC_DB_PATH", str(logs_dir / "prolific.db"))
+    _write(logs_dir / f"window_{day_t0}.txt", f"{day_t0 + 1} VSCode\n")
+    assert storage.backfill_from_legacy_logs()["files_imported"] == 1
+
+    # Reconnecting and writing creates and removes -wal/-shm files next to
+    # the legacy logs, which moves the directory mtime.
+    dir_mtime = os.stat(logs_dir).st_mtime_ns
+    storage.close_connections()
+    storage.insert_note_event("n", timestamp=day_t0 + 5)
+    with sqlite3.connect(logs_dir / "prolific.db") as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    storage.close_connections()
+    os.utime(logs_dir, ns=(0, dir_mtime + 10**9))
+
+    def no_scan(logs_dir):
+        raise AssertionError("logs dir was listed")
+
+    with monkeypatch.context() as m:
+        m.setattr(storage, "_legacy_file_records", no_scan)
+        assert storage.backfill_from_legacy_logs()["files_seen"] == 1
+
+
+def test_iter_events_streams_per_day_groups(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROLIFIC_DB_PATH", str(tmp_path / "prolific.db"))
+    storage.init_db()
+    days = [storage.rewindTime(1736550100) + 86400 * k for k in range(3)]
+    for day_t0 in days:
+        storage.insert_window_event(day_t0 + 20, "B (b.exe)")
+        storage.insert_window_event(day_t0 + 10, "A")
+        storage.insert_keyfreq_event(day_t0 + 10, 3)
+    storage.upsert_blog_entry(days[1], "middle")
+
+    groups = list(storage.iter_events("window", days[0], days[1], batch_size=1))
+    assert groups == [(d, storage.fetch_window_events(d)) for d in days[:2]]
+    assert groups[0][1] == [{"t": days[0] + 10, "s": "A"}, {"t": days[0] + 20, "s": "B (b.exe)"}]
+
+    assert [d for d, _ in storage.iter_events("keyfreq")] == days
+    assert list(storage.iter_events("notes")) == []
+    assert list(storage.iter_events("blog")) == [(days[1], "middle")]
+    with pytest.raises(ValueError):
+        list(storage.iter_events("mouse"))
+
+
+def test_days_table_tracks_inserts_reimports_and_rebuild(tmp_path, monkeypatch):
+    logs_dir = tmp_path / "logs"
+    db_path = tmp_path / "prolific.db"
+    monkeypatch.setenv("PROLIFIC_LOG_DIR", str(logs_dir))
+    monkeypatch.setenv("PROLIFIC_DB_PATH", str(db_path))
+    day_a = storage.rewindTime(1736550100)
+    day_b = day_a + 86400
+
+    _write(logs_dir / f"window_{day_a}.txt", f"{day_a + 5} A\n{day_a + 50} B\n")
+    storage.backfill_from_legacy_logs()
+    storage.insert_window_event(day_a + 2, "C")
+    stop_event = threading.Event()
+    writer = storage.EventWriter(stop_event, flush_seconds=60)
+    writer.submit_keyfreq_event(day_a + 99, 3)
+    writer.submit_keyfreq_event(day_b + 1, 1)
+    writer.start()
+    stop_event.set()
+    writer.close()
+    storage.insert_note_event("n", timestamp=day_b + 7)
+    storage.upsert_blog_entry(day_b + 86400, "blog only")
+
+    def days():
+        with sqlite3.connect(db_path) as conn:
+            return conn.execute("SELECT * FROM days ORDER BY day_t0").fetchall()
+
+    assert storage.list_day_timestamps() == [day_a, day_b, day_b + 86400]
+    assert days() == [
+        (day_a, day_a + 2, day_a + 99, 3, 1, 0, 0),
+        (day_b, day_b + 1, day_b + 7, 0, 1, 1, 0),
+        (day_b + 86400, None, None, 0, 0, 0, 1),
+    ]
+
+    # Re-importing a changed legacy file replaces its rows, not adds to them.
+    _write(logs_dir / f"window_{day_a}.txt", f"{day_a + 5} A\n")
+    storage.backfill_from_legacy_logs(force=True)
+    assert days()[0] == (day_a, day_a + 2, day_a + 99, 2, 1, 0, 0)
+
+    maintained = days()
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("DELETE FROM days")
+        conn.execute("DELETE FROM storage_meta WHERE key = 'days_table_built'")
+    storage.init_db()
+    assert days() == maintained
+
+
+def test_compact_old_days_downsamples_and_reports(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROLIFIC_LOG_DIR", str(tmp_path / "logs"))
+    monkeypatch.setenv("PROLIFIC_DB_PATH", str(tmp_path / "prolific.db"))
+    old_day = storage.rewindTime(1736550100)
+    recent_day = old_day + 400 * 86400
+    storage.init_db()
+    for day_t0 in (old_day, recent_day):
+        storage.insert_window_event(day_t0 + 5, "Editor")
+        for k in range(1, 41):  # every 9 s for 6 minutes
+            storage.insert_keyfreq_event(day_t0 + 9 * k, 2)
+    revision = storage.fetch_day_revisions()[old_day]
+
+    now = recent_day + 3600
+    report = storage.compact_old_days(older_than_days=180, keyfreq_bucket_seconds=300, dry_run=True, now=now)
+    assert report["days"] == 1
+    assert (report["keyfreq_rows_before"], report["keyfreq_rows_after"]) == (40, 2)
+    assert len(storage.fetch_keyfreq_events(old_day)) == 40
+
+    assert storage.compact_old_days(older_than_days=180, keyfreq_bucket_seconds=300, now=now) == report
+    assert storage.fetch_keyfreq_events(old_day) == [
+        {"t": old_day + 297, "s": 66},
+        {"t": old_day + 360, "s": 14},
+    ]
+    assert len(storage.fetch_keyfreq_events(recent_day)) == 40
+    assert storage.fetch_day_revisions()[old_day] > revision
+    with sqlite3.connect(tmp_path / "prolific.db") as conn:
+        counts = conn.execute("SELECT window_count, keyfreq_count FROM days WHERE day_t0 = ?", (old_day,))
+        assert counts.fetchone() == (1, 2)
+
+    # Nothing left to do until the day changes again.
+    assert storage.compact_old_days(older_than_days=180, now=now)["days"] == 0
+    storage.insert_keyfreq_event(old_day + 370, 1)
+    assert storage.compact_old_days(older_than_days=180, now=now)["keyfreq_rows_after"] == 2
+
+
+def test_keyfreq_blocks_append_and_migrate(tmp_path, monkeypatch):
+    db_path = tmp_path / "prolific.db"
+    monkeypatch.setenv("PROLIFIC_DB_PATH", str(db_path))
+    day_t0 = storage.rewindTime(1736550100)
+    storage.init_db()
+
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO keyfreq_events(t, day_t0, s, source_path) VALUES(?, ?, ?, NULL)",
+            [(day_t0 + 9 * k, day_t0, k % 2) for k in range(1, 6)],
+        )
+        conn.execute("DELETE FROM storage_meta WHERE key = 'keyfreq_blocks_migrated'")
+    assert storage.migrate_keyfreq_blocks() == 5
+    assert storage.migrate_keyfreq_blocks() == 0
+    expected = [{"t": day_t0 + 9 * k, "s": k % 2} for k in range(1, 6)]
+    assert storage.fetch_keyfreq_events(day_t0) == expected
+
+    # New samples append to the day's block; a late one re-packs it.
+    storage.insert_keyfreq_event(day_t0 + 54, 8)
+    storage.insert_keyfreq_event(day_t0 + 20, 6)
+    expected += [{"t": day_t0 + 54, "s": 8}]
+    expected.insert(2, {"t": day_t0 + 20, "s": 6})
+    assert storage.fetch_keyfreq_events(day_t0) == expected
+    assert list(storage.iter_events("keyfreq")) == [(day_t0, expected)]
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*), SUM(samples) FROM keyfreq_blocks").fetchone() == (1, 7)
+        assert conn.execute("SELECT COUNT(*) FROM keyfreq_events").fetchone() == (0,)
+        assert conn.execute("SELECT keyfreq_count, last_t FROM days").fetchone() == (7, day_t0 + 54)